@@ -13,6 +13,7 @@
 
 import tensorflow as tf
 from deephyp import network_ops as net_ops
+from deephyp import frozen
 
 
 class mlp_1D_network():
@@ -36,6 +37,8 @@ class mlp_1D_network():
         weightStd (float): Used by 'gaussian' and 'truncated_normal' weight initialisation methods.
         skipConnect (boolean): Whether to use skip connections throughout the network.
         activationFuncFinal (str): Activation function for final layer. Current options: ['sigmoid', 'relu', 'linear'].
+        usePipeline (boolean): Whether to feed the network with a tf.data pipeline when training, instead of feed \
+                        dicts. The Iterator objects passed to *train* are converted to datasets.
 
     Attributes:
         inputSize (int): Number of dimensions of input data (i.e. number of spectral bands).
@@ -52,16 +55,25 @@ class mlp_1D_network():
         y_recon (tensor): Reconstructed output of network. Accessible through the *decoder* and *encoder_decoder* class \
             functions, requiring a trained model.
         train_ops (dict): Dictionary of names of train and loss ops (suffixed with _train and _loss) added to the \
-            network using the *add_train_op* class function. The name (without suffix) is passed to the *train* class \
+            network using the *add_train_op* class function, and whether the loss is a 'sum' or 'mean' over the \
+            samples of a batch (suffixed with _reduction). The name (without suffix) is passed to the *train* class \
             function to train the network with the referenced train and loss op.
         modelsAddrs (dict): Dictionary of model names added to the network using the *add_model* class function. The \
             names reference models which can be used by the *encoder*, *decoder* and *encoder_decoder* class functions.
+        pipeline (dict): If usePipeline - the tf.data iterator feeding the network (see network_ops.create_pipeline). \
+            Else None.
+        sample_weights (tensor): Weight of each sample in the loss, with shape [numSamples]. Defaults to 1 for \
+            each sample, and is fed by Iterators with sample weights (e.g. counts of duplicate spectra).
+        sessions (obj): Cache of open sessions holding loaded models (see network_ops.SessionCache). Models are \
+            loaded on first use and stay loaded until closed with the *close* class function.
+        ensembles (dict): Ensembles of models used by the *predict_ensemble* class function (see frozen.Ensemble), \
+            keyed by the tuple of model names.
 
     """
 
     def __init__( self , configFile=None, inputSize=None , encoderSize=[50,30,10] , activationFunc='sigmoid' ,
                   tiedWeights=None , weightInitOpt='truncated_normal' , weightStd=0.1, skipConnect=False,
-                  activationFuncFinal='linear'  ):
+                  activationFuncFinal='linear', usePipeline=False  ):
 
         self.inputSize = inputSize
         self.activationFunc = activationFunc
@@ -84,8 +96,8 @@ class mlp_1D_network():
         self.encoderSize = [self.inputSize] + self.encodersize
         self.decoderSize = self.encoderSize[::-1]
 
-        self.x = tf.placeholder("float", [None, self.inputSize])
-        self.y_target = tf.placeholder("float", [None, self.inputSize])
+        self.x, self.y_target, self.pipeline = net_ops.input_placeholders(self.inputSize, self.inputSize, usePipeline)
+        self.sample_weights = net_ops.sample_weights_placeholder(self.x, self.pipeline)
 
         self.weights = { }
         self.biases = { }
@@ -93,6 +105,9 @@ class mlp_1D_network():
         self.a = {}
         self.train_ops = {}
         self.modelsAddrs = {}
+        self.modelsPreProcessors = {}
+        self.sessions = net_ops.SessionCache()
+        self.ensembles = {}
 
         if self.tiedWeights is None:
             self.tiedWeights = [0]*(len(self.encoderSize)-1)
@@ -181,7 +196,10 @@ class mlp_1D_network():
 
         """
         # construct loss op
-        self.train_ops['%s_loss'%name] = net_ops.loss_function_reconstruction_1D(self.y_recon, self.y_target, func=lossFunc)
+        self.train_ops['%s_loss'%name] = net_ops.loss_function_reconstruction_1D(
+            self.y_recon, self.y_target, func=lossFunc, sample_weights=self.sample_weights)
+
+        self.train_ops['%s_reduction'%name] = 'sum'
 
         # weight decay loss contribution
         wdLoss = net_ops.loss_weight_decay(wd_lambda)
@@ -195,7 +213,7 @@ class mlp_1D_network():
 
 
     def train(self, dataTrain, dataVal, train_op_name, n_epochs, save_addr, visualiseRateTrain=0, visualiseRateVal=0,
-              save_epochs=[1000]):
+              save_epochs=[1000], preProcessor=None):
         """ Calls network_ops function to train a network.
 
         Args:
@@ -209,6 +227,9 @@ class mlp_1D_network():
             visualiseRateTrain (int): Epoch rate at which to print training loss in console.
             visualiseRateVal (int): Epoch rate at which to print validation loss in console.
             save_epochs (int list): Epochs to save checkpoints at.
+            preProcessor (obj): PreProcessor object used to pre-process the training data. It is saved with the \
+                model, and the inference functions, exported models (numpy, frozen) and scene.SceneProcessor \
+                apply it to their inputs when called with applyPreProcessor=True.
         """
 
         # make sure a checkpoint is saved at n_epochs
@@ -216,44 +237,88 @@ class mlp_1D_network():
             save_epochs.append(n_epochs)
 
         net_ops.train( self, dataTrain, dataVal, train_op_name, n_epochs, save_addr, visualiseRateTrain,
-                       visualiseRateVal, save_epochs )
+                       visualiseRateVal, save_epochs, preProcessor )
 
 
     def add_model(self,addr,modelName):
-        """ Loads a saved set of model parameters for the network.
+        """ Loads a saved set of model parameters for the network. If the model was saved with a pre-processor, it \
+            is loaded, and applied to data samples input into the model by the inference functions when they are \
+            called with applyPreProcessor=True.
 
         Args:
             addr (str): Address of the directory containing the checkpoint files.
             modelName (str): Name of the model (to refer to it later in-case of multiple models for a given network).
         """
 
+        self.close(modelName)
         self.modelsAddrs[modelName] = addr
+        self.modelsPreProcessors[modelName] = net_ops.load_preprocessor(addr)
+
+    def close(self, modelName=None):
+        """ Closes the session holding a loaded model, and of any ensembles including it. The model stays added to \
+            the network, and is loaded again the next time it is used.
+
+        Args:
+            modelName (str): Name of the model. If None - closes the sessions of all models.
+        """
+
+        self.sessions.close(modelName)
+        for modelNames in list(self.ensembles):
+            if (modelName is None) or (modelName in modelNames):
+                self.ensembles.pop(modelNames).close()
+
+    def export_numpy(self, modelName, addr):
+        """ Exports a model to a .npz file, which can be used for inference without tensor flow by \
+            runtime.NumpyModel.
+
+        Args:
+            modelName (str): Name of the model to export (previously added with add_model() ).
+            addr (str): Address of the .npz file.
+        """
+
+        net_ops.export_numpy(self, modelName, addr)
 
-    def encoder( self, modelName, dataSamples  ):
+    def export_frozen(self, modelName, addr):
+        """ Exports a model as a frozen inference graph, with the variables converted to constants and the train \
+            ops removed. It loads faster than the network and can be used with frozen.FrozenModel.
+
+        Args:
+            modelName (str): Name of the model to export (previously added with add_model() ).
+            addr (str): Directory to save the frozen graph in.
+        """
+
+        net_ops.export_frozen(self, modelName, addr)
+
+    def encoder( self, modelName, dataSamples, batchSize=None, out=None, generator=False, applyPreProcessor=False ):
         """ Extract the latent variable of some dataSamples using a trained model.
 
         Args:
             modelName (str): Name of the model to use (previously added with add_model() ).
             dataSample (np.array): Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
 
         Returns:
-            (np.array): Latent representation z of dataSamples. Shape [numSamples x arbitrary].
+            (np.array or generator): Latent representation z of dataSamples. Shape [numSamples x arbitrary].
 
         """
 
-        with tf.Session() as sess:
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
 
-            # load the model
-            net_ops.load_model(self.modelsAddrs[modelName], sess)
+        # get latent values
+        dataZ = net_ops.run_batched(sess, self.z, self.x, dataSamples, batchSize, out, generator,
+                                    net_ops.model_preprocessor(self, modelName, applyPreProcessor))
 
-            # get latent values
-            dataZ = sess.run(self.z, feed_dict={self.x: dataSamples})
+        return dataZ
 
-            return dataZ
 
 
-
-    def decoder( self, modelName, dataZ  ):
+    def decoder( self, modelName, dataZ, batchSize=None, out=None, generator=False ):
         """ Extract the reconstruction of some dataSamples from their latent representation encoding  using a trained \
             model.
 
@@ -261,44 +326,125 @@ class mlp_1D_network():
             modelName (str): Name of the model to use (previously added with add_model() ).
             dataZ (np.array): Latent representation of data samples to reconstruct using the network. Shape \
                     [numSamples x arbitrary].
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
 
         Returns:
-            (np.array): Reconstructed data (y_recon attribute). Shape [numSamples x arbitrary].
+            (np.array or generator): Reconstructed data (y_recon attribute). Shape [numSamples x arbitrary].
 
         """
 
-        with tf.Session() as sess:
-
-            # load the model
-            net_ops.load_model(self.modelsAddrs[modelName], sess)
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
 
-            # get reconstruction
-            dataY_recon = sess.run(self.y_recon, feed_dict={self.z: dataZ})
+        # get reconstruction
+        dataY_recon = net_ops.run_batched(sess, self.y_recon, self.z, dataZ, batchSize, out, generator)
 
-            return dataY_recon
+        return dataY_recon
 
 
-    def encoder_decoder( self, modelName, dataSamples  ):
+    def encoder_decoder( self, modelName, dataSamples, batchSize=None, out=None, generator=False,
+                         applyPreProcessor=False ):
         """ Extract the reconstruction of some dataSamples using a trained model.
 
         Args:
             modelName (str): Name of the model to use (previously added with add_model() ).
             dataSample (np.array): Data samples to reconstruct using the network. Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
 
         Returns:
-            (np.array): Reconstructed data (y_recon attribute). Shape [numSamples x arbitrary].
+            (np.array or generator): Reconstructed data (y_recon attribute). Shape [numSamples x arbitrary].
 
         """
 
-        with tf.Session() as sess:
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
 
-            # load the model
-            net_ops.load_model(self.modelsAddrs[modelName], sess)
+        # get reconstruction
+        dataY_recon = net_ops.run_batched(sess, self.y_recon, self.x, dataSamples, batchSize, out, generator,
+                                          net_ops.model_preprocessor(self, modelName, applyPreProcessor))
 
-            # get reconstruction
-            dataY_recon = sess.run(self.y_recon, feed_dict={self.x: dataSamples})
+        return dataY_recon
 
-            return dataY_recon
+
+    def predict( self, modelName, dataSamples, outputs=['z','y_recon'], batchSize=None, out=None, generator=False,
+                 applyPreProcessor=False ):
+        """ Extract several outputs of some dataSamples using a trained model, all computed in the same session run \
+            (i.e. from one forward pass through the network).
+
+        Args:
+            modelName (str): Name of the model to use (previously added with add_model() ).
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            outputs (str list): Names of the outputs to extract (see network_ops.network_outputs), from 'z', \
+                'y_recon' and layer activations 'a1', 'a2', ...
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (dict): Arrays (e.g. memmaps) to write some of the outputs into, keyed by output name. If None - new \
+                arrays are returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of arrays.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (dict or generator): Array of each output, keyed by output name.
+
+        """
+
+        networkOutputs = net_ops.network_outputs(self)
+        for name in outputs:
+            if (name not in networkOutputs) | (name == 'x'):
+                raise ValueError('unknown output: %s. Use %s.' % (
+                    name, ', '.join(sorted(key for key in networkOutputs if key != 'x'))))
+
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
+
+        # get all outputs in one run
+        fetches = dict((name, networkOutputs[name]) for name in outputs)
+        predOutputs = net_ops.run_batched(sess, fetches, self.x, dataSamples, batchSize, out, generator,
+                                          net_ops.model_preprocessor(self, modelName, applyPreProcessor))
+
+        return predOutputs
+
+
+    def predict_ensemble( self, modelNames, dataSamples, output='y_recon', reduce=None, batchSize=None, out=None,
+                          generator=False, applyPreProcessor=False ):
+        """ Computes an output of several trained models at once. The models are frozen into one graph the first time \
+            they are used together, and each batch of dataSamples is fed once to compute the outputs of all of them \
+            in one session run. The models must be saved with the same pre-processing.
+
+        Args:
+            modelNames (list): Names of the models to use (previously added with add_model() ).
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            output (str): Name of the output to compute (see network_ops.network_outputs), e.g. 'z' or 'y_recon'.
+            reduce (str): How to combine the models' outputs. Current options: [None, 'mean', 'vote']. None stacks \
+                them, 'mean' averages them and 'vote' gives the most common label (only for 'y_labels').
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Outputs of the models. Shape [numSamples x numModels x arbitrary] if reduce is \
+                None, else [numSamples x arbitrary].
+
+        """
+
+        key = tuple(modelNames)
+        if key not in self.ensembles:
+            self.ensembles[key] = frozen.ensemble_from_network(self, modelNames)
+
+        return self.ensembles[key].predict(dataSamples, output, reduce, batchSize, out, generator,
+                                           applyPreProcessor)
 
 
 
@@ -334,6 +480,8 @@ class cnn_1D_network():
         padding (str): Type of padding used. Current options: ['VALID', 'SAME'].
         encoderStride (int list): Stride at each convolutional encoder layer.
         activationFuncFinal (str): Activation function for final layer. Current options: ['sigmoid', 'relu', 'linear'].
+        usePipeline (boolean): Whether to feed the network with a tf.data pipeline when training, instead of feed \
+                        dicts. The Iterator objects passed to *train* are converted to datasets.
 
 
     Attributes:
@@ -359,10 +507,19 @@ class cnn_1D_network():
         y_recon (tensor): Reconstructed output of network. Accessible through the *decoder* and *encoder_decoder* class \
             functions, requiring a trained model.
         train_ops (dict): Dictionary of names of train and loss ops (suffixed with _train and _loss) added to the \
-            network using the *add_train_op* class function. The name (without suffix) is passed to the *train* class \
+            network using the *add_train_op* class function, and whether the loss is a 'sum' or 'mean' over the \
+            samples of a batch (suffixed with _reduction). The name (without suffix) is passed to the *train* class \
             function to train the network with the referenced train and loss op.
         modelsAddrs (dict): Dictionary of model names added to the network using the *add_model* class function. The \
             names reference models which can be used by the *encoder*, *decoder* and *encoder_decoder* class functions.
+        pipeline (dict): If usePipeline - the tf.data iterator feeding the network (see network_ops.create_pipeline). \
+            Else None.
+        sample_weights (tensor): Weight of each sample in the loss, with shape [numSamples]. Defaults to 1 for \
+            each sample, and is fed by Iterators with sample weights (e.g. counts of duplicate spectra).
+        sessions (obj): Cache of open sessions holding loaded models (see network_ops.SessionCache). Models are \
+            loaded on first use and stay loaded until closed with the *close* class function.
+        ensembles (dict): Ensembles of models used by the *predict_ensemble* class function (see frozen.Ensemble), \
+            keyed by the tuple of model names.
 
 
 
@@ -371,7 +528,7 @@ class cnn_1D_network():
     def __init__( self , configFile=None, inputSize=None , zDim=5, encoderNumFilters=[10,10,10] ,
                   encoderFilterSize=[20,10,10], activationFunc='sigmoid', tiedWeights=None,
                   weightInitOpt='truncated_normal', weightStd=0.1, skipConnect=False, padding='VALID',
-                  encoderStride=[1,1,1], activationFuncFinal='linear' ):
+                  encoderStride=[1,1,1], activationFuncFinal='linear', usePipeline=False ):
 
 
         self.inputSize = inputSize
@@ -407,8 +564,8 @@ class cnn_1D_network():
         self.decoderStride = encoderStride[::-1]
 
 
-        self.x = tf.placeholder("float", [None, self.inputSize])
-        self.y_target = tf.placeholder("float", [None, self.inputSize])
+        self.x, self.y_target, self.pipeline = net_ops.input_placeholders(self.inputSize, self.inputSize, usePipeline)
+        self.sample_weights = net_ops.sample_weights_placeholder(self.x, self.pipeline)
 
         self.weights = { }
         self.biases = { }
@@ -416,6 +573,9 @@ class cnn_1D_network():
         self.a = {}
         self.train_ops = {}
         self.modelsAddrs = {}
+        self.modelsPreProcessors = {}
+        self.sessions = net_ops.SessionCache()
+        self.ensembles = {}
 
         if self.tiedWeights is None:
             self.tiedWeights = [0]*(len(self.encoderNumFilters)-1)
@@ -537,7 +697,10 @@ class cnn_1D_network():
 
         """
         # construct loss op
-        self.train_ops['%s_loss'%name] = net_ops.loss_function_reconstruction_1D(self.y_recon, self.y_target, func=lossFunc)
+        self.train_ops['%s_loss'%name] = net_ops.loss_function_reconstruction_1D(
+            self.y_recon, self.y_target, func=lossFunc, sample_weights=self.sample_weights)
+
+        self.train_ops['%s_reduction'%name] = 'sum'
 
         # weight decay loss contribution
         wdLoss = net_ops.loss_weight_decay(wd_lambda)
@@ -550,7 +713,7 @@ class cnn_1D_network():
 
 
     def train(self, dataTrain, dataVal, train_op_name, n_epochs, save_addr, visualiseRateTrain=0, visualiseRateVal=0,
-              save_epochs=[1000]):
+              save_epochs=[1000], preProcessor=None):
         """ Calls network_ops function to train a network.
 
         Args:
@@ -564,51 +727,99 @@ class cnn_1D_network():
             visualiseRateTrain (int): Epoch rate at which to print training loss in console.
             visualiseRateVal (int): Epoch rate at which to print validation loss in console.
             save_epochs (int list): Epochs to save checkpoints at.
+            preProcessor (obj): PreProcessor object used to pre-process the training data. It is saved with the \
+                model, and the inference functions, exported models (numpy, frozen) and scene.SceneProcessor \
+                apply it to their inputs when called with applyPreProcessor=True.
         """
 
         # make sure a checkpoint is saved at n_epochs
         if n_epochs not in save_epochs:
             save_epochs.append(n_epochs)
 
-        net_ops.train( self, dataTrain, dataVal, train_op_name, n_epochs, save_addr, visualiseRateTrain, visualiseRateVal, save_epochs )
+        net_ops.train( self, dataTrain, dataVal, train_op_name, n_epochs, save_addr, visualiseRateTrain,
+                       visualiseRateVal, save_epochs, preProcessor )
 
 
     def add_model(self,addr,modelName):
-        """ Loads a saved set of model parameters for the network.
+        """ Loads a saved set of model parameters for the network. If the model was saved with a pre-processor, it \
+            is loaded, and applied to data samples input into the model by the inference functions when they are \
+            called with applyPreProcessor=True.
 
         Args:
             addr (str): Address of the directory containing the checkpoint files.
             modelName (str): Name of the model (to refer to it later in-case of multiple models for a given network).
         """
 
+        self.close(modelName)
         self.modelsAddrs[modelName] = addr
+        self.modelsPreProcessors[modelName] = net_ops.load_preprocessor(addr)
+
+    def close(self, modelName=None):
+        """ Closes the session holding a loaded model, and of any ensembles including it. The model stays added to \
+            the network, and is loaded again the next time it is used.
+
+        Args:
+            modelName (str): Name of the model. If None - closes the sessions of all models.
+        """
+
+        self.sessions.close(modelName)
+        for modelNames in list(self.ensembles):
+            if (modelName is None) or (modelName in modelNames):
+                self.ensembles.pop(modelNames).close()
+
+    def export_numpy(self, modelName, addr):
+        """ Exports a model to a .npz file, which can be used for inference without tensor flow by \
+            runtime.NumpyModel.
+
+        Args:
+            modelName (str): Name of the model to export (previously added with add_model() ).
+            addr (str): Address of the .npz file.
+        """
 
+        net_ops.export_numpy(self, modelName, addr)
 
-    def encoder( self, modelName, dataSamples  ):
+    def export_frozen(self, modelName, addr):
+        """ Exports a model as a frozen inference graph, with the variables converted to constants and the train \
+            ops removed. It loads faster than the network and can be used with frozen.FrozenModel.
+
+        Args:
+            modelName (str): Name of the model to export (previously added with add_model() ).
+            addr (str): Directory to save the frozen graph in.
+        """
+
+        net_ops.export_frozen(self, modelName, addr)
+
+
+    def encoder( self, modelName, dataSamples, batchSize=None, out=None, generator=False, applyPreProcessor=False ):
         """ Extract the latent variable of some dataSamples using a trained model.
 
         Args:
             modelName (str): Name of the model to use (previously added with add_model() ).
             dataSample (np.array): Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
 
         Returns:
-            (np.array): Latent representation z of dataSamples. Shape [numSamples x arbitrary].
+            (np.array or generator): Latent representation z of dataSamples. Shape [numSamples x arbitrary].
 
         """
 
-        with tf.Session() as sess:
-
-            # load the model
-            net_ops.load_model(self.modelsAddrs[modelName], sess)
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
 
-            # get latent values
-            dataZ = sess.run(self.z, feed_dict={self.x: dataSamples})
+        # get latent values
+        dataZ = net_ops.run_batched(sess, self.z, self.x, dataSamples, batchSize, out, generator,
+                                    net_ops.model_preprocessor(self, modelName, applyPreProcessor))
 
-            return dataZ
+        return dataZ
 
 
 
-    def decoder( self, modelName, dataZ  ):
+    def decoder( self, modelName, dataZ, batchSize=None, out=None, generator=False ):
         """ Extract the reconstruction of some dataSamples from their latent representation encoding  using a trained \
             model.
 
@@ -616,44 +827,125 @@ class cnn_1D_network():
             modelName (str): Name of the model to use (previously added with add_model() ).
             dataZ (np.array): Latent representation of data samples to reconstruct using the network. Shape \
                     [numSamples x arbitrary].
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
 
         Returns:
-            (np.array): Reconstructed data (y_recon attribute). Shape [numSamples x arbitrary].
+            (np.array or generator): Reconstructed data (y_recon attribute). Shape [numSamples x arbitrary].
 
         """
 
-        with tf.Session() as sess:
-
-            # load the model
-            net_ops.load_model(self.modelsAddrs[modelName], sess)
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
 
-            # get reconstruction
-            dataY_recon = sess.run(self.y_recon, feed_dict={self.z: dataZ})
+        # get reconstruction
+        dataY_recon = net_ops.run_batched(sess, self.y_recon, self.z, dataZ, batchSize, out, generator)
 
-            return dataY_recon
+        return dataY_recon
 
 
-    def encoder_decoder( self, modelName, dataSamples  ):
+    def encoder_decoder( self, modelName, dataSamples, batchSize=None, out=None, generator=False,
+                         applyPreProcessor=False ):
         """ Extract the reconstruction of some dataSamples using a trained model.
 
         Args:
             modelName (str): Name of the model to use (previously added with add_model() ).
             dataSample (np.array): Data samples to reconstruct using the network. Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Reconstructed data (y_recon attribute). Shape [numSamples x arbitrary].
+
+        """
+
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
+
+        # get reconstruction
+        dataY_recon = net_ops.run_batched(sess, self.y_recon, self.x, dataSamples, batchSize, out, generator,
+                                          net_ops.model_preprocessor(self, modelName, applyPreProcessor))
+
+        return dataY_recon
+
+
+    def predict( self, modelName, dataSamples, outputs=['z','y_recon'], batchSize=None, out=None, generator=False,
+                 applyPreProcessor=False ):
+        """ Extract several outputs of some dataSamples using a trained model, all computed in the same session run \
+            (i.e. from one forward pass through the network).
+
+        Args:
+            modelName (str): Name of the model to use (previously added with add_model() ).
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            outputs (str list): Names of the outputs to extract (see network_ops.network_outputs), from 'z', \
+                'y_recon' and layer activations 'a1', 'a2', ...
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (dict): Arrays (e.g. memmaps) to write some of the outputs into, keyed by output name. If None - new \
+                arrays are returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of arrays.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
 
         Returns:
-            (np.array): Reconstructed data (y_recon attribute). Shape [numSamples x arbitrary].
+            (dict or generator): Array of each output, keyed by output name.
 
         """
 
-        with tf.Session() as sess:
+        networkOutputs = net_ops.network_outputs(self)
+        for name in outputs:
+            if (name not in networkOutputs) | (name == 'x'):
+                raise ValueError('unknown output: %s. Use %s.' % (
+                    name, ', '.join(sorted(key for key in networkOutputs if key != 'x'))))
 
-            # load the model
-            net_ops.load_model(self.modelsAddrs[modelName], sess)
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
+
+        # get all outputs in one run
+        fetches = dict((name, networkOutputs[name]) for name in outputs)
+        predOutputs = net_ops.run_batched(sess, fetches, self.x, dataSamples, batchSize, out, generator,
+                                          net_ops.model_preprocessor(self, modelName, applyPreProcessor))
+
+        return predOutputs
+
+
+    def predict_ensemble( self, modelNames, dataSamples, output='y_recon', reduce=None, batchSize=None, out=None,
+                          generator=False, applyPreProcessor=False ):
+        """ Computes an output of several trained models at once. The models are frozen into one graph the first time \
+            they are used together, and each batch of dataSamples is fed once to compute the outputs of all of them \
+            in one session run. The models must be saved with the same pre-processing.
+
+        Args:
+            modelNames (list): Names of the models to use (previously added with add_model() ).
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            output (str): Name of the output to compute (see network_ops.network_outputs), e.g. 'z' or 'y_recon'.
+            reduce (str): How to combine the models' outputs. Current options: [None, 'mean', 'vote']. None stacks \
+                them, 'mean' averages them and 'vote' gives the most common label (only for 'y_labels').
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Outputs of the models. Shape [numSamples x numModels x arbitrary] if reduce is \
+                None, else [numSamples x arbitrary].
+
+        """
 
-            # get reconstruction
-            dataY_recon = sess.run(self.y_recon, feed_dict={self.x: dataSamples})
+        key = tuple(modelNames)
+        if key not in self.ensembles:
+            self.ensembles[key] = frozen.ensemble_from_network(self, modelNames)
 
-            return dataY_recon
+        return self.ensembles[key].predict(dataSamples, output, reduce, batchSize, out, generator,
+                                           applyPreProcessor)
 
 
 
@@ -0,0 +1,296 @@
+'''
+    Description: on-disk cache of pre-processed datasets. The first time a dataset is loaded it is read from its \
+    source file (.mat, .npy or ENVI), pre-processed and stored as .npy files. Later loads memory-map those files.
+
+    - File name: cache.py
+    - Author: deephyp contributors
+    - Date created: October 2026
+    - Python package: deephyp
+
+'''
+
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from os.path import join, exists, abspath, getsize, getmtime
+from deephyp import data
+from deephyp import envi
+
+
+# number of bytes hashed at a time
+HASH_CHUNK_SIZE = 2**24
+
+
+class DatasetCache():
+    """ Class for caching pre-processed datasets on disk. Each dataset is keyed by a hash of the contents of its \
+        source files and the pre-processing parameters, so a changed file or a different method makes a new entry. \
+        An entry holds the pre-processed spectra and the labels (and, if asked for, a float32 copy of the \
+        un-pre-processed spectra) as .npy files, and the wavelengths and pre-processor as json. Loading an entry \
+        memory-maps the .npy files, so only the parts of the dataset that are used are read. When the cache grows \
+        beyond maxBytes, the least recently used entries are removed.
+
+    Args:
+        cacheDir (str): Address of the directory to store the cache in. Created if it does not exist.
+        maxBytes (int): Maximum total size of the entries in bytes. If None - no limit.
+
+    Attributes:
+        cacheDir (str): Address of the directory the cache is stored in.
+        maxBytes (int): Maximum total size of the entries in bytes.
+        lastHit (boolean): Whether the last call to *load* found the dataset in the cache.
+        lastTimes (dict): Seconds taken by the last call to *load*: 'hash' (hashing the source files), 'build' \
+            (reading, pre-processing and storing the dataset, zero on a hit), 'open' (memory-mapping the entry) and \
+            'total'.
+    """
+
+    def __init__(self, cacheDir='deephyp_cache', maxBytes=10*2**30):
+
+        if not exists(cacheDir):
+            os.makedirs(cacheDir)
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.lastHit = False
+        self.lastTimes = {}
+
+    def load(self, addr, varName=None, labelsAddr=None, labelsVarName=None, method='minmax', chunkSize=100000,
+             numThreads=None, storeSpectra=False):
+        """ Loads a pre-processed dataset, from the cache if it is there, else from its source file (then adding it \
+            to the cache).
+
+        Args:
+            addr (str): Address of the spectral data. A .mat file (read with scipy.io.loadmat), a .npy file or an \
+                ENVI image (see envi.EnviImage), with shape [numRows x numCols x numBands] or [numSamples x numBands].
+            varName (str): Name of the variable holding the data in a .mat file. If None - the only variable in it.
+            labelsAddr (str): Address of the class labels of each sample (.mat or .npy). If None - no labels.
+            labelsVarName (str): Name of the variable holding the labels in a .mat file. If None - the only variable \
+                in it.
+            method (str or obj): Method of pre-processing (see data.PreProcessor), or a fitted PreProcessor object.
+            chunkSize (int): Number of spectra processed at a time when pre-processing.
+            numThreads (int): Number of threads used to pre-process. If None - set to the number of CPUs.
+            storeSpectra (boolean): Whether the entry also stores a float32 copy of the un-pre-processed spectra, \
+                which doubles its size. If False - spectra and spectraCube are memory-maps of the source file if it \
+                can be memory-mapped as [numSamples x numBands] (.npy files and BIP ENVI images), else None.
+
+        Returns:
+            (obj): data.HypImg with memory-mapped spectraPrep (and spectra and spectraCube, unless they are None), \
+                and its preProcessor set.
+        """
+
+        tic = time.time()
+        index = self._read_index()
+        params = {'source':self._source_hash(addr, index), 'varName':varName, 'labels':None,
+                  'labelsVarName':labelsVarName, 'dtype':'float32', 'storeSpectra':storeSpectra,
+                  'method':method.get_config() if isinstance(method, data.PreProcessor) else method}
+        if labelsAddr is not None:
+            params['labels'] = self._source_hash(labelsAddr, index)
+        key = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+        entryDir = join(self.cacheDir, key)
+        hashTime = time.time() - tic
+
+        self.lastHit = exists(join(entryDir, 'meta.json'))
+        buildTime = 0.0
+        if not self.lastHit:
+            tic = time.time()
+            nbytes = self._build(entryDir, addr, varName, labelsAddr, labelsVarName, method, chunkSize, numThreads,
+                                 storeSpectra)
+            index['entries'][key] = {'source':abspath(addr), 'nbytes':nbytes}
+            buildTime = time.time() - tic
+
+        tic = time.time()
+        hypData = _open_entry(entryDir, addr, varName, chunkSize)
+        openTime = time.time() - tic
+
+        index['entries'].setdefault(key, {'source':abspath(addr), 'nbytes':_dir_size(entryDir)})
+        index['entries'][key]['lastUsed'] = time.time()
+        self._evict(index, keep=key)
+        self._write_index(index)
+
+        self.lastTimes = {'hash':hashTime, 'build':buildTime, 'open':openTime,
+                          'total':hashTime + buildTime + openTime}
+        return hypData
+
+    def size(self):
+        """ Total size of the entries in the cache.
+
+        Returns:
+            (int): Number of bytes.
+        """
+        return sum(entry['nbytes'] for entry in self._read_index()['entries'].values())
+
+    def clear(self):
+        """ Removes all the entries from the cache.
+        """
+        index = self._read_index()
+        for key in list(index['entries']):
+            shutil.rmtree(join(self.cacheDir, key), ignore_errors=True)
+        self._write_index({'files':{}, 'entries':{}})
+
+    def _build(self, entryDir, addr, varName, labelsAddr, labelsVarName, method, chunkSize, numThreads,
+               storeSpectra):
+        """Reads a dataset from its source files, pre-processes it and stores it in an entry. Returns its size."""
+
+        # the entry is built in a temporary directory and then renamed, so a failed build leaves no entry
+        buildDir = tempfile.mkdtemp(dir=self.cacheDir)
+        try:
+            spectralInput, wavelengths, bands = _read_source(addr, varName)
+            if storeSpectra or not _is_spectra_memmap(spectralInput):
+                # a float32 copy of the spectra, stored in the entry or (if not asked for) only used to pre-process
+                if storeSpectra:
+                    spectra = np.lib.format.open_memmap(join(buildDir, 'spectra.npy'), mode='w+', dtype=np.float32,
+                                                        shape=np.shape(spectralInput))
+                else:
+                    spectra = data._temp_memmap(np.shape(spectralInput), np.float32)
+                rowsPerChunk = max(chunkSize // max(int(np.prod(np.shape(spectralInput)[1:-1])), 1), 1)
+                for start in range(0, spectra.shape[0], rowsPerChunk):
+                    spectra[start:start+rowsPerChunk] = spectralInput[start:start+rowsPerChunk]
+                spectra.flush()
+            else:
+                spectra = spectralInput
+            spectralInput = None
+
+            labels = None
+            if labelsAddr is not None:
+                labels = np.asarray(_read_source(labelsAddr, labelsVarName)[0])
+                np.save(join(buildDir, 'labels.npy'), labels)
+
+            hypData = data.HypImg(spectra, labels=labels, wavelengths=wavelengths, bands=bands, chunkSize=chunkSize)
+            hypData.pre_process(method, outAddr=join(buildDir, 'spectraPrep.npy'), numThreads=numThreads)
+            hypData.spectraPrep.flush()
+
+            meta = {'source':abspath(addr), 'shape':list(np.shape(spectra)),
+                    'preProcessor':hypData.preProcessor.get_config(),
+                    'wavelengths':None if wavelengths is None else np.asarray(wavelengths).tolist(),
+                    'bands':None if bands is None else np.asarray(bands).tolist()}
+            with open(join(buildDir, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            hypData = spectra = None
+
+            if exists(entryDir):
+                shutil.rmtree(entryDir)
+            os.rename(buildDir, entryDir)
+        except:
+            shutil.rmtree(buildDir, ignore_errors=True)
+            raise
+
+        return _dir_size(entryDir)
+
+    def _source_hash(self, addr, index):
+        """Hash of the contents of a source. For an ENVI image, this covers both its header and its data file."""
+        if os.path.splitext(addr)[1].lower() in ['.mat', '.npy']:
+            return self._file_hash(addr, index)
+        return ':'.join(self._file_hash(fileAddr, index) for fileAddr in envi.find_files(addr))
+
+    def _file_hash(self, addr, index):
+        """Hash of the contents of a file. Hashes are kept in the index, and only recomputed if the file changes."""
+        stat = {'size':getsize(addr), 'mtime':getmtime(addr)}
+        known = index['files'].get(abspath(addr))
+        if (known is not None) and (known['size'] == stat['size']) and (known['mtime'] == stat['mtime']):
+            return known['hash']
+        sha = hashlib.sha1()
+        with open(addr, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        stat['hash'] = sha.hexdigest()
+        index['files'][abspath(addr)] = stat
+        return stat['hash']
+
+    def _evict(self, index, keep):
+        """Removes the least recently used entries (other than keep) until the cache is within maxBytes."""
+        if self.maxBytes is None:
+            return
+        total = sum(entry['nbytes'] for entry in index['entries'].values())
+        for key in sorted(index['entries'], key=lambda key: index['entries'][key].get('lastUsed', 0)):
+            if total <= self.maxBytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(join(self.cacheDir, key), ignore_errors=True)
+            total -= index['entries'].pop(key)['nbytes']
+
+    def _read_index(self):
+        """Reads the index of the cache (the hashes of source files, and the size and last use of each entry)."""
+        addr = join(self.cacheDir, 'index.json')
+        if not exists(addr):
+            return {'files':{}, 'entries':{}}
+        with open(addr, 'r') as f:
+            index = json.load(f)
+        # drop entries whose directory has been removed
+        index['entries'] = dict((key, entry) for key, entry in index['entries'].items()
+                                if exists(join(self.cacheDir, key, 'meta.json')))
+        return index
+
+    def _write_index(self, index):
+        """Writes the index of the cache, replacing the old one in a single step."""
+        fd, addr = tempfile.mkstemp(suffix='.json', dir=self.cacheDir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.replace(addr, join(self.cacheDir, 'index.json'))
+
+
+def _read_source(addr, varName=None):
+    """Reads an array from a .mat, .npy or ENVI file. Returns the array (a memmap for .npy and ENVI files), and the \
+        wavelengths and band indexes if the file has them (else None)."""
+    extension = os.path.splitext(addr)[1].lower()
+    if extension == '.mat':
+        import scipy.io
+        mat = scipy.io.loadmat(addr)
+        if varName is None:
+            names = [name for name in mat if not name.startswith('__')]
+            if len(names) != 1:
+                raise ValueError('the .mat file holds several variables (%s). Give the name of one.' %
+                                 ', '.join(sorted(names)))
+            varName = names[0]
+        return mat[varName], None, None
+    if extension == '.npy':
+        return np.load(addr, mmap_mode='r'), None, None
+    img = envi.EnviImage(addr)
+    bands = None if img.wavelengths is None else np.arange(img.numBands)
+    return img.cube, img.wavelengths, bands
+
+
+def _open_entry(entryDir, addr, varName, chunkSize):
+    """Makes a data.HypImg from the memory-mapped files of an entry. Spectra not stored in the entry are memory-mapped \
+        from addr, the source being loaded (which has the same contents as the one the entry was built from, but \
+        may be a different file)."""
+    with open(join(entryDir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    labels = None
+    if exists(join(entryDir, 'labels.npy')):
+        labels = np.load(join(entryDir, 'labels.npy'))
+    wavelengths = meta['wavelengths'] if meta['wavelengths'] is None else np.array(meta['wavelengths'])
+    bands = meta['bands'] if meta['bands'] is None else np.array(meta['bands'])
+
+    spectraPrep = np.load(join(entryDir, 'spectraPrep.npy'), mmap_mode='r')
+    spectralInput = None
+    if exists(join(entryDir, 'spectra.npy')):
+        spectralInput = np.load(join(entryDir, 'spectra.npy'), mmap_mode='r')
+    elif os.path.splitext(addr)[1].lower() != '.mat':
+        spectralInput = _read_source(addr, varName)[0]
+        if not _is_spectra_memmap(spectralInput):
+            spectralInput = None
+
+    if spectralInput is None:
+        # the un-pre-processed spectra are not available as a memmap, so the HypImg is shaped from spectraPrep
+        hypData = data.HypImg(np.reshape(spectraPrep, meta['shape']), labels=labels, wavelengths=wavelengths,
+                              bands=bands, chunkSize=chunkSize)
+        hypData.spectra = hypData.spectraCube = None
+    else:
+        hypData = data.HypImg(spectralInput, labels=labels, wavelengths=wavelengths, bands=bands, chunkSize=chunkSize)
+    hypData.spectraPrep = spectraPrep
+    hypData.preProcessor = data.PreProcessor()
+    hypData.preProcessor.set_config(meta['preProcessor'])
+    return hypData
+
+
+def _is_spectra_memmap(arr):
+    """Checks whether an array is memory-mapped in an order that reshapes to [numSamples x numBands] without a \
+        copy (e.g. a .npy file or a BIP ENVI image)."""
+    return isinstance(arr, np.memmap) and arr.flags.c_contiguous
+
+
+def _dir_size(addr):
+    """Total size of the files in a directory."""
+    return sum(getsize(join(addr, name)) for name in os.listdir(addr))
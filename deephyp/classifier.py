@@ -12,6 +12,7 @@
 
 import tensorflow as tf
 from deephyp import network_ops as net_ops
+from deephyp import frozen
 
 
 class cnn_1D_network():
@@ -38,6 +39,9 @@ class cnn_1D_network():
                     'xavier', 'xavier_improved'].
         weightStd (float): Used by 'gaussian' and 'truncated_normal' weight initialisation methods.
         padding (str): Type of padding used. Current options: ['VALID', 'SAME'].
+        usePipeline (boolean): Whether to feed the network with a tf.data pipeline when training, instead of feed \
+                        dicts. The Iterator objects passed to *train* are converted to datasets, \
+                        and class label targets are one-hot encoded in the pipeline.
 
     Attributes:
         inputSize (int): Number of dimensions of input data (i.e. number of spectral bands).
@@ -55,18 +59,29 @@ class cnn_1D_network():
         numLayers (int): Total number of layers (convolutional and fully-connected).
         y_pred (tensor): Output of network - class scores with shape [numSamples x numClasses]. Accessible through the \
             *predict_scores* class functions, requiring a trained model.
+        y_scores (tensor): Softmax of y_pred, with shape [numSamples x numClasses].
+        y_labels (tensor): Predicted class labels (starting at 1), with shape [numSamples].
         train_ops (dict): Dictionary of names of train and loss ops (suffixed with _train and _loss) added to the \
-            network using the *add_train_op* class function. The name (without suffix) is passed to the *train* class \
+            network using the *add_train_op* class function, and whether the loss is a 'sum' or 'mean' over the \
+            samples of a batch (suffixed with _reduction). The name (without suffix) is passed to the *train* class \
             function to train the network with the referenced train and loss op.
         modelsAddrs (dict): Dictionary of model names added to the network using the *add_model* class function. The \
             names reference models which can be used by the *predict_scores*, *predict_labels* and *predict_features* \
             class functions.
+        pipeline (dict): If usePipeline - the tf.data iterator feeding the network (see network_ops.create_pipeline). \
+            Else None.
+        sample_weights (tensor): Weight of each sample in the loss, with shape [numSamples]. Defaults to 1 for \
+            each sample, and is fed by Iterators with sample weights (e.g. counts of duplicate spectra).
+        sessions (obj): Cache of open sessions holding loaded models (see network_ops.SessionCache). Models are \
+            loaded on first use and stay loaded until closed with the *close* class function.
+        ensembles (dict): Ensembles of models used by the *predict_ensemble* class function (see frozen.Ensemble), \
+            keyed by the tuple of model names.
 
     """
 
     def __init__( self , configFile=None, inputSize=None, numClasses=None, convFilterSize=[20,10,10],
                   convNumFilters=[10,10,10], convStride = [1,1,1], fcSize=[20,20], activationFunc='relu',
-                  weightInitOpt='truncated_normal', weightStd=0.1, padding='VALID'):
+                  weightInitOpt='truncated_normal', weightStd=0.1, padding='VALID', usePipeline=False):
 
         self.inputSize = inputSize
         self.numClasses = numClasses
@@ -95,8 +110,8 @@ class cnn_1D_network():
         if not (len(self.convFilterSize) == len(self.convNumFilters) == len(self.convStride)):
             raise Exception('the length of convNumfilters, convFilterSize and convStride must be equal.')
 
-        self.x = tf.placeholder("float", [None, self.inputSize])
-        self.y_target = tf.placeholder("float", [None, self.numClasses])
+        self.x, self.y_target, self.pipeline = net_ops.input_placeholders(self.inputSize, self.numClasses, usePipeline)
+        self.sample_weights = net_ops.sample_weights_placeholder(self.x, self.pipeline)
 
         self.weights = { }
         self.biases = { }
@@ -104,6 +119,9 @@ class cnn_1D_network():
         self.a = {}
         self.train_ops = {}
         self.modelsAddrs = {}
+        self.modelsPreProcessors = {}
+        self.sessions = net_ops.SessionCache()
+        self.ensembles = {}
 
         # pre-compute shape of data after each layer
         self.convDataShape = [self.inputSize]
@@ -180,6 +198,10 @@ class cnn_1D_network():
         # output of final layer
         self.y_pred = self.a['a%d' % (absLayerNum)]
 
+        # class scores and labels, built once so that repeated predictions do not grow the graph
+        self.y_scores = tf.nn.softmax(self.y_pred)
+        self.y_labels = tf.math.argmax(self.y_pred,axis=1) + 1
+
         self.numLayers = len(self.a) - 1
 
 
@@ -203,11 +225,14 @@ class cnn_1D_network():
         """
         # construct loss op
         if balance_classes:
-            class_weights = net_ops.balance_classes(self.y_target,self.numClasses)
+            class_weights = net_ops.balance_classes(self.y_target,self.numClasses,self.sample_weights)
         else:
             class_weights = None
         self.train_ops['%s_loss'%name] = net_ops.loss_function_crossentropy_1D(
-            self.y_pred, self.y_target, class_weights=class_weights, num_classes=self.numClasses)
+            self.y_pred, self.y_target, class_weights=class_weights, num_classes=self.numClasses,
+            sample_weights=self.sample_weights)
+
+        self.train_ops['%s_reduction'%name] = 'mean'
 
         # weight decay loss contribution
         wdLoss = net_ops.loss_weight_decay(wd_lambda)
@@ -221,7 +246,7 @@ class cnn_1D_network():
 
 
     def train(self, dataTrain, dataVal, train_op_name, n_epochs, save_addr, visualiseRateTrain=0, visualiseRateVal=0,
-              save_epochs=[1000]):
+              save_epochs=[1000], preProcessor=None):
         """ Calls network_ops function to train a network.
 
         Args:
@@ -235,6 +260,9 @@ class cnn_1D_network():
             visualiseRateTrain (int): Epoch rate at which to print training loss in console.
             visualiseRateVal (int): Epoch rate at which to print validation loss in console.
             save_epochs (int list): Epochs to save checkpoints at.
+            preProcessor (obj): PreProcessor object used to pre-process the training data. It is saved with the \
+                model, and the inference functions, exported models (numpy, frozen) and scene.SceneProcessor \
+                apply it to their inputs when called with applyPreProcessor=True.
         """
 
         # make sure a checkpoint is saved at n_epochs
@@ -243,80 +271,138 @@ class cnn_1D_network():
 
 
         net_ops.train( self, dataTrain, dataVal, train_op_name, n_epochs, save_addr, visualiseRateTrain,
-                       visualiseRateVal, save_epochs )
+                       visualiseRateVal, save_epochs, preProcessor )
 
 
     def add_model(self,addr,modelName):
-        """ Loads a saved set of model parameters for the network.
+        """ Loads a saved set of model parameters for the network. If the model was saved with a pre-processor, it \
+            is loaded, and applied to data samples input into the model by the inference functions when they are \
+            called with applyPreProcessor=True.
 
         Args:
             addr (str): Address of the directory containing the checkpoint files.
             modelName (str): Name of the model (to refer to it later in-case of multiple models for a given network).
         """
 
+        self.close(modelName)
         self.modelsAddrs[modelName] = addr
+        self.modelsPreProcessors[modelName] = net_ops.load_preprocessor(addr)
+
+    def close(self, modelName=None):
+        """ Closes the session holding a loaded model, and of any ensembles including it. The model stays added to \
+            the network, and is loaded again the next time it is used.
+
+        Args:
+            modelName (str): Name of the model. If None - closes the sessions of all models.
+        """
+
+        self.sessions.close(modelName)
+        for modelNames in list(self.ensembles):
+            if (modelName is None) or (modelName in modelNames):
+                self.ensembles.pop(modelNames).close()
+
+    def export_numpy(self, modelName, addr):
+        """ Exports a model to a .npz file, which can be used for inference without tensor flow by \
+            runtime.NumpyModel.
+
+        Args:
+            modelName (str): Name of the model to export (previously added with add_model() ).
+            addr (str): Address of the .npz file.
+        """
+
+        net_ops.export_numpy(self, modelName, addr)
 
-    def predict_scores( self, modelName, dataSamples, useSoftmax=True  ):
+    def export_frozen(self, modelName, addr):
+        """ Exports a model as a frozen inference graph, with the variables converted to constants and the train \
+            ops removed. It loads faster than the network and can be used with frozen.FrozenModel.
+
+        Args:
+            modelName (str): Name of the model to export (previously added with add_model() ).
+            addr (str): Directory to save the frozen graph in.
+        """
+
+        net_ops.export_frozen(self, modelName, addr)
+
+    def predict_scores( self, modelName, dataSamples, useSoftmax=True, batchSize=None, out=None, generator=False,
+                        applyPreProcessor=False ):
         """ Extract the predicted classification scores of some dataSamples using a trained model.
 
         Args:
             modelName (str): Name of the model to use (previously added with add_model() ).
             dataSamples (np.array): Shape [numSamples x inputSize].
             useSoftmax (boolean): Pass predicted scores output by network through a softmax function.
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
 
         Returns:
-            (np.array): Predicted classification scores of dataSamples. Shape [numSamples x numClasses].
+            (np.array or generator): Predicted classification scores of dataSamples. Shape [numSamples x numClasses].
 
         """
 
-        with tf.Session() as sess:
-
-            # load the model
-            net_ops.load_model(self.modelsAddrs[modelName], sess)
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
 
-            # get scores
-            if useSoftmax:
-                scores = tf.nn.softmax(self.y_pred)
-            else:
-                scores = self.y_pred
-            predScores = sess.run(scores, feed_dict={self.x: dataSamples})
+        # get scores
+        if useSoftmax:
+            scores = self.y_scores
+        else:
+            scores = self.y_pred
+        predScores = net_ops.run_batched(sess, scores, self.x, dataSamples, batchSize, out, generator,
+                                         net_ops.model_preprocessor(self, modelName, applyPreProcessor))
 
-            return predScores
+        return predScores
 
 
-    def predict_labels( self, modelName, dataSamples  ):
+    def predict_labels( self, modelName, dataSamples, batchSize=None, out=None, generator=False,
+                        applyPreProcessor=False ):
         """ Extract the predicted classification labels of some dataSamples using a trained model.
 
         Args:
             modelName (str): Name of the model to use (previously added with add_model() )
             dataSamples (array): Shape [numSamples x inputSize]
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
 
         Returns:
-            (np.array): Predicted classification labels of dataSamples. Shape [numSamples].
+            (np.array or generator): Predicted classification labels of dataSamples. Shape [numSamples].
 
         """
 
-        with tf.Session() as sess:
-
-            # load the model
-            net_ops.load_model(self.modelsAddrs[modelName], sess)
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
 
-            pred_labels = sess.run(tf.math.argmax(self.y_pred,axis=1), feed_dict={self.x: dataSamples}) + 1
+        pred_labels = net_ops.run_batched(sess, self.y_labels, self.x, dataSamples, batchSize, out, generator,
+                                          net_ops.model_preprocessor(self, modelName, applyPreProcessor))
 
-            return pred_labels
+        return pred_labels
 
 
-    def predict_features( self, modelName, dataSamples, layer ):
+    def predict_features( self, modelName, dataSamples, layer, batchSize=None, out=None, generator=False,
+                          applyPreProcessor=False ):
         """ Extract the predicted feature values at a particular layer of the network.
 
         Args:
             modelName (str): Name of the model to use (previously added with add_model() )
             dataSamples (np.array): Shape [numSamples x inputSize]
             layer (int): Layer at which to extract features. Must be between 1 and numLayers inclusive.
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
 
         Returns:
-            (np.array): Values of neurons at layer. Shape [numSamples x numNeurons] if fully-connected layer and \
-                        [numSamples x convDim1 x convDim2] if convolutional layer.
+            (np.array or generator): Values of neurons at layer. Shape [numSamples x numNeurons] if fully-connected \
+                layer and [numSamples x convDim1 x convDim2] if convolutional layer.
 
         """
 
@@ -324,14 +410,87 @@ class cnn_1D_network():
             raise ValueError('layer must be between 1 and numLayers (%i) inclusive. '
                              'Layer input: %i'% (self.numLayers,layer) )
 
-        with tf.Session() as sess:
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
+
+        predFeatures = net_ops.run_batched(sess, self.a['a%i'%(layer)], self.x, dataSamples, batchSize, out, generator,
+                                           net_ops.model_preprocessor(self, modelName, applyPreProcessor))
+
+        return predFeatures
 
-            # load the model
-            net_ops.load_model(self.modelsAddrs[modelName], sess)
 
-            predFeatures = sess.run(self.a['a%i'%(layer)], feed_dict={self.x: dataSamples})
+    def predict( self, modelName, dataSamples, outputs=['y_labels','y_scores'], batchSize=None, out=None,
+                 generator=False, applyPreProcessor=False ):
+        """ Extract several outputs of some dataSamples using a trained model, all computed in the same session run \
+            (i.e. from one forward pass through the network).
+
+        Args:
+            modelName (str): Name of the model to use (previously added with add_model() ).
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            outputs (str list): Names of the outputs to extract (see network_ops.network_outputs), from 'y_pred', \
+                'y_scores', 'y_labels' and layer activations 'a1', 'a2', ...
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (dict): Arrays (e.g. memmaps) to write some of the outputs into, keyed by output name. If None - new \
+                arrays are returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of arrays.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (dict or generator): Array of each output, keyed by output name.
+
+        """
+
+        networkOutputs = net_ops.network_outputs(self)
+        for name in outputs:
+            if (name not in networkOutputs) | (name == 'x'):
+                raise ValueError('unknown output: %s. Use %s.' % (
+                    name, ', '.join(sorted(key for key in networkOutputs if key != 'x'))))
+
+        # get the session holding the loaded model
+        sess = net_ops.get_session(self, modelName)
+
+        # get all outputs in one run
+        fetches = dict((name, networkOutputs[name]) for name in outputs)
+        predOutputs = net_ops.run_batched(sess, fetches, self.x, dataSamples, batchSize, out, generator,
+                                          net_ops.model_preprocessor(self, modelName, applyPreProcessor))
+
+        return predOutputs
+
+
+    def predict_ensemble( self, modelNames, dataSamples, output='y_scores', reduce=None, batchSize=None, out=None,
+                          generator=False, applyPreProcessor=False ):
+        """ Computes an output of several trained models at once. The models are frozen into one graph the first time \
+            they are used together, and each batch of dataSamples is fed once to compute the outputs of all of them \
+            in one session run. The models must be saved with the same pre-processing.
+
+        Args:
+            modelNames (list): Names of the models to use (previously added with add_model() ).
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            output (str): Name of the output to compute (see network_ops.network_outputs), e.g. 'y_pred', \
+                'y_scores' or 'y_labels'.
+            reduce (str): How to combine the models' outputs. Current options: [None, 'mean', 'vote']. None stacks \
+                them, 'mean' averages them and 'vote' gives the most common label (only for 'y_labels').
+            batchSize (int): Number of samples to run through the network at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Outputs of the models. Shape [numSamples x numModels x arbitrary] if reduce is \
+                None, else [numSamples x arbitrary].
+
+        """
+
+        key = tuple(modelNames)
+        if key not in self.ensembles:
+            self.ensembles[key] = frozen.ensemble_from_network(self, modelNames)
 
-            return predFeatures
+        return self.ensembles[key].predict(dataSamples, output, reduce, batchSize, out, generator,
+                                           applyPreProcessor)
 
 
 
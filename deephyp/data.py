@@ -11,6 +11,22 @@
 
 
 import numpy as np
+import mmap
+import os
+import tempfile
+import json
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+import weakref
+import warnings
+import queue
+
+
+# constants of the 64-bit FNV-1a hash used by deduplicate
+FNV_OFFSET = np.uint64(14695981039346656037)
+FNV_PRIME = np.uint64(1099511628211)
 
 
 class HypImg:
@@ -18,6 +34,12 @@ class HypImg:
         samples with label zero are considered as a background class. This class is not included in numClasses and data \
         samples with this label have a one-hot vector label of all zeros.
 
+        Pixels can be excluded with a valid-pixel mask (given, or made from no-data values, NaNs or background \
+        labels), kept as a compact vector of the indexes of the valid samples. spectraPrep and labels then hold only \
+        the valid samples (in the order of validIdx), so pre-processing, training and inference on spectraPrep scale \
+        with the number of valid pixels. Results for the valid samples are put back into a full-size raster with \
+        *scatter*.
+
     Args:
         spectralInput (np.array float): Spectral dataset. Shape can be [numRows x numCols x numBands] or \
             [numSamples x numBands].
@@ -25,125 +47,884 @@ class HypImg:
         bands (np.array int): Wavelength indexes for each band of spectralInput. Shape [numBands].
         labels (np.array int): Class labels for each spectral sample in spectralInput. Shape can be [numRows x numCols] \
             or [numSamples].
+        chunkSize (int): Number of spectra processed at a time when pre-processing. Bounds the scratch memory used.
+        dtype (np.dtype): Floating point data type to store the spectral data as. The networks take float32 inputs. \
+            Memory-mapped data is kept in its on-disk data type and only spectraPrep is stored as dtype.
+        mask (np.array bool): Which samples are valid. Shape [numRows x numCols] or [numSamples]. If None - all \
+            samples are valid (unless excluded by the following arguments).
+        noDataValue (float): Samples with this value in every band (e.g. the no-data border of an orthorectified \
+            flightline) are excluded. If None - not used.
+        maskNaN (boolean): Whether samples with a NaN in any band are excluded.
+        maskBackground (boolean): Whether samples with label zero (background class) are excluded. Requires labels.
 
     Attributes:
         spectra (np.array float): Un-pre-processed spectral data with shape [numSamples x numBands].
         spectraCube (np.array float): If data passed as image - un-pre-processed spectral datacube with \
-            shape [numSamples x numBands]. Else None.
-        spectraPrep (np.array float): Pre-processed spectral data with shape [numSamples x numBands].
+            shape [numRows x numCols x numBands]. A view of the same data as spectra (not a copy). Else None.
+        spectraPrep (np.array float): Pre-processed spectral data with shape [numSamples x numBands], or \
+            [numValid x numBands] if a mask is used.
+        preProcessor (obj): PreProcessor object used to make spectraPrep. Can be passed to a network's *train* \
+            function so that it is saved with the model and applied to data input into the trained model.
+        memmap (boolean): Whether the spectral data is a memory-map of a file on disk (see *load_memmap*). If so, \
+            spectra and spectraCube are views of the on-disk data and spectraPrep is written to disk.
+        chunkSize (int): Number of spectra processed at a time when pre-processing.
+        dtype (np.dtype): Data type of the spectral data and spectraPrep.
         numSamples (int): The number of spectra.
         numRows (int): If data passed as image - the number of image rows. Else None.
         numCols (int): If data passed as image - the number of image columns. Else None.
         wavelengths (np.array float): If provided - vector of wavelengths that spectra wavelengths lie within. Else None.
         bands (np.array int): If provided - wavelength indexes for each band of spectra with shape [numBands]. Else None.
-        labels (np.array int): If provided - class labels for each spectral sample with shape [numSamples]. Else None.
-        labelsOnehot (np.array int): If labels provided - the one-hot label vector for each sample. Samples with label \
-            zero (background class) have a one-hot vector of all zeros. Else None.
+        labels (np.array int): If provided - class labels for each spectral sample with shape [numSamples x 1], \
+            stored with the smallest integer type that holds them. If a mask is used, only those of the valid samples \
+            (shape [numValid x 1]). Else None.
+        validIdx (np.array int): If a mask is used - indexes of the valid samples in spectra, in increasing order. \
+            Shape [numValid]. Else None.
+        numValid (int): Number of valid samples (numSamples if no mask is used).
+        uniqueIdx (np.array int): If *deduplicate* has been called - indexes of the unique samples in spectraPrep. \
+            Shape [numUnique].
+        uniqueCounts (np.array int): If *deduplicate* has been called - number of copies of each unique sample. \
+            Shape [numUnique].
     """
 
 
-    def __init__( self , spectralInput , labels=None, wavelengths=None, bands=None  ):
+    def __init__( self , spectralInput , labels=None, wavelengths=None, bands=None, chunkSize=100000,
+                  dtype=np.float32, mask=None, noDataValue=None, maskNaN=False, maskBackground=False ):
+
+        self.memmap = isinstance( spectralInput, np.memmap )
+        self.dtype = np.dtype( dtype )
+
+        # cast to dtype (copies only if the input is not already contiguous data of that type). Memory-mapped data
+        # is kept as a view of the on-disk data rather than being read into memory.
+        if not self.memmap:
+            spectralInput = np.ascontiguousarray( spectralInput, dtype=self.dtype )
 
         # if input is of shape [numRows x numCols x numBands], convert to [numSamples x numBands]
         if len( spectralInput.shape ) == 3:
             self.numRows , self.numCols , self.numBands = spectralInput.shape
-            self.numSamples = self.numRows * self.numCols
-            self.spectra = (np.reshape( spectralInput , ( -1, self.numBands ) )).astype(np.float)
-            self.spectraCube = spectralInput.astype(np.float)
+            self.spectraCube = spectralInput
         else:
-            self.numSamples , self.numBands = spectralInput.shape
             self.numRows = None
             self.numCols = None
-            self.spectra = spectralInput.astype(np.float)
+            self.numBands = spectralInput.shape[1]
             self.spectraCube = None
+        self.spectra = np.reshape( spectralInput , ( -1, self.numBands ) )
+        self.numSamples = self.spectra.shape[0]
 
-        # if labels provided, determine number of classes and one-hot labels
-        if labels is not None:
-            if len(labels.shape) == 2:
-                self.labels = np.reshape(labels, -1)
-            else:
-                self.labels = labels
-            self.numClasses = len( np.unique(self.labels)[np.unique(self.labels)>0] )
+        self.chunkSize = chunkSize
 
-            # create one-hot labels for classes > 0
-            self.labelsOnehot = np.zeros((self.numSamples, self.numClasses))
-            self.labelsOnehot[np.arange(self.numSamples)[self.labels>0], (self.labels-1)[self.labels>0]] = 1
+        # indexes of the valid samples, if any are excluded
+        self.validIdx = None
+        if labels is not None:
+            labels = np.reshape(labels, -1)
+        elif maskBackground:
+            raise ValueError('maskBackground requires labels.')
+        if (mask is not None) | (noDataValue is not None) | maskNaN | maskBackground:
+            self.validIdx = self._valid_indexes( mask, noDataValue, maskNaN, labels if maskBackground else None )
+        self.numValid = self.numSamples if self.validIdx is None else len(self.validIdx)
 
-            self.labels = self.labels[:,np.newaxis]
+        # if labels provided, determine number of classes and store labels compactly
+        if labels is not None:
+            if self.validIdx is not None:
+                labels = labels[self.validIdx]
+            if len(labels) == 0:
+                self.numClasses = 0
+                self.labels = np.zeros( (0, 1), dtype=np.int8 )
+            else:
+                self.numClasses = len( np.unique(labels)[np.unique(labels)>0] )
+                self.labels = labels.astype( _compact_int_dtype(np.min(labels), np.max(labels)) )[:,np.newaxis]
         else:
             self.labels = None
-            self.labelsOnehot = None
             self.numClasses = None
 
 
         self.wavelengths = wavelengths
         self.bands = bands
 
-    def pre_process( self , method='minmax' ):
-        """Pre-process data for input into the network. Stores in the spectraPrep attribute.
+    def _valid_indexes( self, mask, noDataValue, maskNaN, labels ):
+        """Indexes of the valid samples, found a chunk of spectra at a time."""
+        if mask is not None:
+            mask = np.reshape( mask, -1 )
+
+        def valid_chunk( start ):
+            valid = np.ones( len(self.spectra[start:start+self.chunkSize]), dtype=bool )
+            if mask is not None:
+                valid &= mask[start:start+self.chunkSize].astype(bool)
+            if (noDataValue is not None) | maskNaN:
+                chunk = self.spectra[start:start+self.chunkSize, :]
+                if noDataValue is not None:
+                    valid &= ~np.all( chunk == noDataValue, axis=1 )
+                if maskNaN:
+                    valid &= ~np.any( np.isnan(chunk), axis=1 )
+            if labels is not None:
+                valid &= labels[start:start+self.chunkSize] > 0
+            return start + np.flatnonzero( valid )
+
+        validIdx = np.concatenate( [np.zeros(0, dtype=np.int64)] +
+                                   _map_chunks( valid_chunk, self.numSamples, self.chunkSize ) )
+        return validIdx.astype( _compact_int_dtype(0, self.numSamples) )
+
+    def scatter( self, values, fillValue=0, out=None ):
+        """Puts results for the valid samples (e.g. output by a network for spectraPrep) back into a full-size \
+            raster, filling the excluded samples.
+
+        Args:
+            values (np.array): Results for the valid samples. Shape [numValid x arbitrary] or [numValid].
+            fillValue (float): Value given to the excluded samples.
+            out (np.array): Array (e.g. a memmap) to write the raster into. Shape as returned. If None - a new array \
+                is made.
+
+        Returns:
+            (np.array): Raster with shape [numRows x numCols x arbitrary] (or [numRows x numCols]) if the data was \
+                passed as an image, else [numSamples x arbitrary] (or [numSamples]).
+        """
+        if np.shape(values)[0] != self.numValid:
+            raise ValueError('values must have numValid (%i) rows. Shape: %s' % (self.numValid, np.shape(values)))
+        spatialShape = (self.numSamples,) if self.numRows is None else (self.numRows, self.numCols)
+        shape = spatialShape + np.shape(values)[1:]
+        if out is None:
+            out = np.empty( shape, dtype=np.result_type(np.asarray(values).dtype, fillValue) )
+        flat = np.reshape( out, (self.numSamples,) + np.shape(values)[1:] )
+        if self.validIdx is None:
+            flat[...] = values
+        else:
+            flat[...] = fillValue
+            flat[self.validIdx] = values
+        if isinstance( out, np.memmap ):
+            out.flush()
+        return out
+
+    def pre_process( self , method='minmax', outAddr=None, out=None, numThreads=None ):
+        """Pre-process data for input into the network. Stores in the spectraPrep attribute, and the transform used in \
+            the preProcessor attribute. The data is processed in chunks of chunkSize spectra across a pool of threads. \
+            Each chunk is copied into the output and then processed in-place, so no more than one extra chunk of \
+            memory is needed per thread.
+
+        Args:
+            method (str or obj): Method of pre-processing (see *PreProcessor* for the options), in which case the \
+                statistics it needs are fitted to this dataset. Alternatively, a PreProcessor object that has \
+                already been fitted (e.g. to the training data, or loaded from a trained model directory).
+            outAddr (str): Address of a .npy file to memory-map spectraPrep to. If None and the spectral data is \
+                memory-mapped, a temporary file is used, which is deleted once spectraPrep (and any views of it) \
+                are no longer used, or at exit. Otherwise spectraPrep is stored in memory.
+            out (np.array float): Optional preallocated (or memory-mapped) array to write spectraPrep into. Shape \
+                [numValid x numBands]. Overrides outAddr.
+            numThreads (int): Number of threads used to process chunks. If None - set to the number of CPUs.
+        """
+        if isinstance( method, PreProcessor ):
+            self.preProcessor = method
+        else:
+            self.preProcessor = PreProcessor( method, wavelengths=self.band_wavelengths() )
+            if self.preProcessor.requires_fit():
+                self.preProcessor.fit( self.spectra, self.chunkSize, numThreads, self.validIdx )
+
+        if out is not None:
+            if np.shape(out) != (self.numValid, self.numBands):
+                raise ValueError('out must have shape [numValid x numBands]. Shape: %s' % (np.shape(out),))
+            self.spectraPrep = out
+        else:
+            if (outAddr is None) & self.memmap:
+                self.spectraPrep = _temp_memmap( (self.numValid, self.numBands), self.dtype )
+            elif outAddr is not None:
+                self.spectraPrep = np.lib.format.open_memmap( outAddr, mode='w+', dtype=self.dtype,
+                                                             shape=(self.numValid, self.numBands) )
+            else:
+                self.spectraPrep = np.empty( (self.numValid, self.numBands), dtype=self.dtype )
+
+        self.preProcessor.transform( self.spectra, self.spectraPrep, self.chunkSize, numThreads, self.validIdx )
+
+    def deduplicate( self, tolerance=None, numThreads=None ):
+        """Finds the unique pre-processed spectra (and labels), so that a network can be trained on one copy of each \
+            with its count as a loss weight (see *deduplicate*). Must be called after *pre_process*. Stores the result \
+            in the uniqueIdx and uniqueCounts attributes.
+
+        Args:
+            tolerance (float): Spectra are duplicates if they round to the same multiple of tolerance in every band. \
+                If None - only exactly equal spectra are duplicates.
+            numThreads (int): Number of threads used to hash chunks of spectra. If None - set to the number of CPUs.
+
+        Returns:
+            (tuple): 2-element tuple containing:
+
+            - (*np.array int*) - Indexes of one copy of each unique spectrum in spectraPrep. Shape [numUnique].
+            - (*np.array int*) - Number of copies of each unique spectrum. Shape [numUnique].
+        """
+        self.uniqueIdx, self.uniqueCounts = deduplicate( self.spectraPrep, tolerance, self.labels, self.chunkSize,
+                                                         numThreads )
+        return self.uniqueIdx, self.uniqueCounts
+
+    def band_wavelengths( self ):
+        """Returns the wavelength of each band. If wavelengths were not provided, the band indexes are returned.
+
+        Returns:
+            (np.array float): Wavelength of each band. Shape [numBands].
+        """
+        if self.wavelengths is None:
+            return np.arange( self.numBands, dtype=np.float64 )
+        if self.bands is None:
+            return np.asarray( self.wavelengths, dtype=np.float64 )
+        return np.asarray( self.wavelengths, dtype=np.float64 )[self.bands]
+
+    def labels_onehot( self, idx=None, out=None ):
+        """Makes one-hot label vectors for some (or all) of the samples. Samples with label zero (background class) \
+            have a one-hot vector of all zeros. The one-hot labels are not stored, so for large datasets pass labels \
+            and numClasses to an Iterator instead, which one-hot encodes each batch.
+
+        Args:
+            idx (np.array int): Indexes of the samples (rows of labels). If None - all samples.
+            out (np.array): Optional preallocated array to write the one-hot vectors into. Shape \
+                [numSamples x numClasses] (or [len(idx) x numClasses]).
+
+        Returns:
+            (np.array): One-hot label vector for each sample, or None if no labels were provided. Shape \
+                [numSamples x numClasses] (or [len(idx) x numClasses]).
+        """
+        if self.labels is None:
+            return None
+        labels = self.labels if idx is None else self.labels[idx]
+        return onehot( labels, self.numClasses, self.dtype, out )
+
+    @property
+    def labelsOnehot( self ):
+        """Deprecated - use *labels_onehot*, which this calls each time it is accessed."""
+        warnings.warn( 'HypImg.labelsOnehot is deprecated, use HypImg.labels_onehot() instead.', DeprecationWarning,
+                       stacklevel=2 )
+        return self.labels_onehot()
+
+    def memory_usage( self ):
+        """Reports the number of bytes of memory used by each of the data attributes. Attributes that are views of \
+            another attribute (e.g. spectraCube) or are memory-mapped to a file on disk use no extra memory.
+
+        Returns:
+            (dict): Number of bytes used by each attribute (spectra, spectraCube, spectraPrep, labels, validIdx), and \
+                the total under 'total'.
+        """
+        usage = {}
+        counted = []
+        for name in ['spectra', 'spectraCube', 'spectraPrep', 'labels', 'validIdx']:
+            arr = getattr( self, name, None )
+            if arr is None:
+                continue
+            if _is_memmap(arr) | any( np.shares_memory(arr, other) for other in counted ):
+                usage[name] = 0
+            else:
+                usage[name] = arr.nbytes
+                counted.append( arr )
+        usage['total'] = sum( usage.values() )
+
+        return usage
+
+
+class PreProcessor:
+    """Class for a pre-processing transform that is fitted to a dataset and can be saved, so that the same transform \
+        is applied to the data used to train a network and to any data later input into the trained network. \
+        Dataset-level statistics (per-band min, max, mean and variance) are accumulated in a single streaming pass \
+        over chunks of data, and statistics fitted to different chunks (e.g. by different workers) can be merged.
+
+    Args:
+        method (str): Method of pre-processing. Current options:
+            - 'minmax': scales each spectrum to lie between [0 1] (lower bound is a small non-zero number).
+            - 'bandminmax': scales each band to lie between [0 1] using its min and max over the dataset.
+            - 'zscore': standardises each band to zero mean and unit variance over the dataset.
+            - 'l2': scales each spectrum to unit L2 norm.
+            - 'log': natural logarithm of each spectrum (values are floored at 1e-6).
+            - 'continuum': divides each spectrum by its continuum (upper convex hull).
+        wavelengths (np.array float): Wavelength of each band, used by 'continuum'. If None - the band index is used.
+        configFile (str): Address of a .json file saved with the *save* class function. Overwrites the other \
+            arguments.
+
+    Attributes:
+        method (str): Method of pre-processing.
+        wavelengths (np.array float): Wavelength of each band, used by 'continuum'.
+        numSamples (int): Number of spectra the statistics have been fitted to.
+        min (np.array float): Minimum of each band. Shape [numBands].
+        max (np.array float): Maximum of each band. Shape [numBands].
+        mean (np.array float): Mean of each band. Shape [numBands].
+        m2 (np.array float): Sum of squared differences from the mean of each band. Shape [numBands].
+    """
+
+    def __init__( self, method='minmax', wavelengths=None, configFile=None ):
+
+        self.method = method
+        self.wavelengths = wavelengths
+        self.numSamples = 0
+        self.min = None
+        self.max = None
+        self.mean = None
+        self.m2 = None
+
+        if configFile is not None:
+            with open(configFile, 'r') as infile:
+                self.set_config( json.load(infile) )
+
+        if self.method not in ['minmax', 'bandminmax', 'zscore', 'l2', 'log', 'continuum']:
+            raise ValueError('unknown pre-processing method: %s. Use minmax, bandminmax, zscore, l2, log or '
+                             'continuum.' % self.method)
+
+    def requires_fit( self ):
+        """ Whether the method uses dataset-level statistics (and so must be fitted before it is applied).
+
+        Returns:
+            (boolean): True for 'bandminmax' and 'zscore'.
+        """
+        return self.method in ['bandminmax', 'zscore']
+
+    def variance( self ):
+        """ Variance of each band over the data fitted so far.
+
+        Returns:
+            (np.array float): Shape [numBands].
+        """
+        return self.m2 / max( self.numSamples, 1 )
+
+    def partial_fit( self, spectra ):
+        """ Updates the statistics with a chunk of spectra.
+
+        Args:
+            spectra (np.array float): Shape [numSamples x numBands].
+        """
+        spectra = np.asarray( spectra, dtype=np.float64 )
+        if spectra.shape[0] == 0:
+            return
+        chunkStats = PreProcessor( self.method, self.wavelengths )
+        chunkStats.numSamples = spectra.shape[0]
+        chunkStats.min = np.min( spectra, axis=0 )
+        chunkStats.max = np.max( spectra, axis=0 )
+        chunkStats.mean = np.mean( spectra, axis=0 )
+        chunkStats.m2 = np.sum( np.square( spectra - chunkStats.mean ), axis=0 )
+        self.merge( chunkStats )
+
+    def merge( self, other ):
+        """ Merges the statistics of another PreProcessor into this one (e.g. fitted by a different worker on a \
+            different chunk of the data).
+
+        Args:
+            other (obj): PreProcessor object.
+        """
+        if other.numSamples == 0:
+            return
+        if self.numSamples == 0:
+            self.numSamples, self.min, self.max, self.mean, self.m2 = \
+                other.numSamples, other.min.copy(), other.max.copy(), other.mean.copy(), other.m2.copy()
+            return
+
+        numSamples = self.numSamples + other.numSamples
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (float(other.numSamples) / numSamples)
+        self.m2 = self.m2 + other.m2 + np.square(delta) * (float(self.numSamples) * other.numSamples / numSamples)
+        self.min = np.minimum( self.min, other.min )
+        self.max = np.maximum( self.max, other.max )
+        self.numSamples = numSamples
+
+    def fit( self, spectra, chunkSize=100000, numThreads=None, idx=None ):
+        """ Fits the statistics to a dataset in a single pass over chunks of it. The chunks are fitted across a pool \
+            of threads and merged.
+
+        Args:
+            spectra (np.array float): Shape [numSamples x numBands]. Can be memory-mapped.
+            chunkSize (int): Number of spectra read at a time.
+            numThreads (int): Number of threads used to fit chunks. If None - set to the number of CPUs.
+            idx (np.array int): Indexes of the spectra to fit to (e.g. the valid pixels of a HypImg), in increasing \
+                order. If None - all spectra.
+        """
+        def fit_chunk( start ):
+            chunkStats = PreProcessor( self.method, self.wavelengths )
+            chunkStats.partial_fit( _read_rows( spectra, start, chunkSize, idx ) )
+            return chunkStats
+
+        numSamples = np.shape(spectra)[0] if idx is None else len(idx)
+        for chunkStats in _map_chunks( fit_chunk, numSamples, chunkSize, numThreads ):
+            self.merge( chunkStats )
+
+    def transform( self, spectra, out=None, chunkSize=100000, numThreads=None, idx=None ):
+        """ Applies the pre-processing to some spectra. Each chunk is copied into the output and then processed \
+            in-place, across a pool of threads.
+
+        Args:
+            spectra (np.array float): Shape [numSamples x numBands]. Can be memory-mapped.
+            out (np.array float): Array to write the result into. Can be the same array as spectra (i.e. in-place) or \
+                memory-mapped. If None - a new float32 array is made.
+            chunkSize (int): Number of spectra processed at a time.
+            numThreads (int): Number of threads used to process chunks. If None - set to the number of CPUs.
+            idx (np.array int): Indexes of the spectra to process (e.g. the valid pixels of a HypImg), in increasing \
+                order. If None - all spectra.
+
+        Returns:
+            (np.array float): Pre-processed spectra. Shape [numSamples x numBands], or [len(idx) x numBands] if idx \
+                is given.
+        """
+        if self.requires_fit() & (self.numSamples == 0):
+            raise Exception('the %s pre-processing method must be fitted before it is applied.' % self.method)
+
+        numSamples = np.shape(spectra)[0] if idx is None else len(idx)
+        if out is None:
+            out = np.empty( (numSamples, np.shape(spectra)[1]), dtype=np.float32 )
+
+        def process_chunk( start ):
+            chunk = out[start:start+chunkSize, :]
+            if out is not spectra:
+                chunk[...] = _read_rows( spectra, start, chunkSize, idx )
+            _pre_process_chunk( chunk, self )
+
+        _map_chunks( process_chunk, numSamples, chunkSize, numThreads )
+
+        if isinstance( out, np.memmap ):
+            out.flush()
+
+        return out
+
+    def get_config( self ):
+        """ Gets the pre-processing method and its statistics as a json-serialisable dictionary.
+
+        Returns:
+            (dict): The method and statistics, with arrays converted to lists.
+        """
+        config = {}
+        for key in ['method', 'wavelengths', 'numSamples', 'min', 'max', 'mean', 'm2']:
+            value = getattr( self, key )
+            if isinstance( value, np.ndarray ):
+                value = value.tolist()
+            config[key] = value
+        return config
+
+    def set_config( self, config ):
+        """ Sets the pre-processing method and its statistics from a dictionary made by *get_config*.
 
         Args:
-            method (str): Method of pre-processing. Current options: 'minmax'
+            config (dict): The method and statistics, with arrays as lists.
         """
-        if method == 'minmax':
-            # scales each spectra to be between [0 1] (lower bound is actually a small non-zero number)
-            self.spectraPrep = self.spectra - np.transpose(np.tile(np.min(self.spectra,axis=1)-(1e-3),(self.numBands,1)))
-            self.spectraPrep = self.spectraPrep / np.transpose(np.tile(np.max(self.spectra, axis=1), (self.numBands, 1)))
+        for key in config:
+            value = config[key]
+            if isinstance( value, list ):
+                value = np.array( value )
+            setattr( self, key, value )
+
+    def save( self, addr ):
+        """ Saves the pre-processing method and its statistics to a .json file.
+
+        Args:
+            addr (str): Address of the .json file.
+        """
+        with open(addr, 'w') as outfile:
+            json.dump(self.get_config(), outfile)
+
+
+def _map_chunks( func, numSamples, chunkSize, numThreads=None ):
+    """Calls func with the start index of each chunk of numSamples, across a pool of threads. Returns the results."""
+    if numThreads is None:
+        numThreads = multiprocessing.cpu_count()
+    starts = range( 0, numSamples, chunkSize )
+    if (numThreads > 1) & (len(starts) > 1):
+        pool = ThreadPool( min( numThreads, len(starts) ) )
+        try:
+            return pool.map( func, starts )
+        finally:
+            pool.close()
+            pool.join()
+    return [ func(start) for start in starts ]
+
+
+def _read_rows( spectra, start, chunkSize, idx=None ):
+    """Reads the chunk of spectra starting at start, or at the indexes idx[start:start+chunkSize] if idx is given."""
+    if idx is None:
+        return spectra[start:start+chunkSize, :]
+    return spectra[idx[start:start+chunkSize], :]
+
+
+def _pre_process_chunk( chunk, preProcessor ):
+    """Pre-processes a chunk of spectra in-place. Shape [chunkSize x numBands]."""
+    method = preProcessor.method
+    if method == 'minmax':
+        # scales each spectra to be between [0 1] (lower bound is actually a small non-zero number)
+        chunkMax = np.max( chunk, axis=1, keepdims=True )
+        chunk -= np.min( chunk, axis=1, keepdims=True ) - (1e-3)
+        chunk /= chunkMax
+    elif method == 'bandminmax':
+        bandRange = preProcessor.max - preProcessor.min
+        chunk -= preProcessor.min
+        chunk /= np.where( bandRange > 0, bandRange, 1 )
+    elif method == 'zscore':
+        std = np.sqrt( preProcessor.variance() )
+        chunk -= preProcessor.mean
+        chunk /= np.where( std > 0, std, 1 )
+    elif method == 'l2':
+        norm = np.sqrt( np.einsum( 'ij,ij->i', chunk, chunk ) )[:, np.newaxis]
+        norm[norm == 0] = 1
+        chunk /= norm
+    elif method == 'log':
+        np.maximum( chunk, 1e-6, out=chunk )
+        np.log( chunk, out=chunk )
+    elif method == 'continuum':
+        wavelengths = preProcessor.wavelengths
+        if wavelengths is None:
+            wavelengths = np.arange( chunk.shape[1], dtype=np.float64 )
+        chunk /= _continuum( chunk, np.asarray(wavelengths, dtype=np.float64) )
+
+
+def _continuum( spectra, wavelengths, blockSize=4096 ):
+    """Computes the continuum (upper convex hull) of each spectrum. Shape [numSamples x numBands]. The hulls of a \
+        block of spectra are found together: every point that lies on or below the line between its neighbouring \
+        hull points is removed, and this is repeated until no more points are removed. The continuum is then \
+        interpolated between the remaining points."""
+    continuum = np.empty_like( spectra )
+    numBands = spectra.shape[1]
+    bandIdx = np.arange( numBands )
+    for start in range( 0, spectra.shape[0], blockSize ):
+        block = np.asarray( spectra[start:start+blockSize], dtype=np.float64 )
+        rows = np.arange( block.shape[0] )[:, np.newaxis]
+
+        onHull = np.ones( block.shape, dtype=bool )
+        interior = np.ones( numBands, dtype=bool )
+        interior[[0, -1]] = False
+        active = np.arange( block.shape[0] )  # spectra whose hull changed in the last pass
+        while len(active) > 0:
+            activeHull = onHull[active]
+            activeBlock = block[active]
+            activeRows = rows[:len(active)]
+            before, after = _hull_neighbours( activeHull, bandIdx, strict=True )
+            valueBefore = activeBlock[activeRows, before]
+            wavelengthBefore = wavelengths[before]
+            below = ( (activeBlock - valueBefore) * (wavelengths[after] - wavelengthBefore) <=
+                      (activeBlock[activeRows, after] - valueBefore) * (wavelengths - wavelengthBefore) )
+            below &= activeHull & interior
+            changed = np.any( below, axis=1 )
+            onHull[active] = activeHull & ~below
+            active = active[changed]
+
+        # interpolate between the hull points either side of each band
+        before, after = _hull_neighbours( onHull, bandIdx, strict=False )
+        span = wavelengths[after] - wavelengths[before]
+        fraction = np.divide( wavelengths - wavelengths[before], span, out=np.zeros(span.shape), where=span > 0 )
+        valueBefore = block[rows, before]
+        continuum[start:start+len(block)] = valueBefore + fraction * (block[rows, after] - valueBefore)
+    continuum[continuum == 0] = 1
+
+    return continuum
+
+
+def _hull_neighbours( onHull, bandIdx, strict ):
+    """Indexes of the nearest hull points before and after each band (excluding the band itself if strict)."""
+    numBands = len(bandIdx)
+    before = np.maximum.accumulate( np.where( onHull, bandIdx, 0 ), axis=1 )
+    after = np.minimum.accumulate( np.where( onHull, bandIdx, numBands - 1 )[:, ::-1], axis=1 )[:, ::-1]
+    if strict:
+        before = np.concatenate( [before[:, :1], before[:, :-1]], axis=1 )
+        after = np.concatenate( [after[:, 1:], after[:, -1:]], axis=1 )
+    return before, after
+
+
+def onehot( labels, numClasses, dtype=np.float32, out=None ):
+    """Converts class labels to one-hot vectors. Labels <= 0 are considered as a background class and have a one-hot \
+        vector of all zeros.
+
+    Args:
+        labels (np.array int): Class labels. Shape [numSamples] or [numSamples x 1].
+        numClasses (int): Number of classes (not including the background class).
+        dtype (np.dtype): Data type of the one-hot vectors.
+        out (np.array): Optional preallocated array to write the one-hot vectors into. Shape \
+            [numSamples x numClasses].
+
+    Returns:
+        (np.array): One-hot label vector for each sample. Shape [numSamples x numClasses].
+    """
+    labels = np.reshape( labels, -1 )
+    if out is None:
+        labelsOnehot = np.zeros( (len(labels), numClasses), dtype=dtype )
+    else:
+        labelsOnehot = out
+        labelsOnehot[...] = 0
+    fg = np.nonzero( labels > 0 )[0]
+    labelsOnehot[fg, labels[fg].astype(np.intp) - 1] = 1
+
+    return labelsOnehot
+
+
+def deduplicate( spectra, tolerance=None, labels=None, chunkSize=100000, numThreads=None ):
+    """Finds the unique spectra in a dataset. Each spectrum (with its label) is hashed to a 64-bit value, a chunk of \
+        spectra at a time across a pool of threads, and spectra with the same hash are grouped by sorting the \
+        hashes (with np.unique), so the spectra themselves are never sorted or copied. Every spectrum is then compared with the first spectrum of its group, and any that differ (i.e. \
+        hash collisions) are split into groups of their own, so the result is exact. Training on the unique spectra, \
+        weighted by their counts (see the weights argument of *Iterator*), gives the same loss as training on all of \
+        them, in fewer steps per epoch.
+
+    Args:
+        spectra (np.array float): Spectra with shape [numSamples x numBands] (e.g. the spectraPrep of a HypImg). \
+            Can be a memmap.
+        tolerance (float): Spectra are duplicates if they round to the same multiple of tolerance in every band. \
+            If None - only exactly equal spectra are duplicates.
+        labels (np.array int): Class labels of the spectra. Shape [numSamples] or [numSamples x 1]. If given, \
+            spectra are only duplicates if they also have the same label.
+        chunkSize (int): Number of spectra hashed (and compared) at a time.
+        numThreads (int): Number of threads used to hash and compare chunks. If None - set to the number of CPUs.
+
+    Returns:
+        (tuple): 2-element tuple containing:
+
+        - (*np.array int*) - Index of the first copy of each unique spectrum, in increasing order. Shape [numUnique].
+        - (*np.array int*) - Number of copies of each unique spectrum. Shape [numUnique].
+    """
+    numSamples = np.shape( spectra )[0]
+    if labels is not None:
+        labels = np.reshape( labels, -1 )
+    hashes = np.empty( numSamples, dtype=np.uint64 )
+
+    def hash_chunk( start ):
+        words = _duplicate_words( spectra, labels, tolerance, slice(start, start+chunkSize) )
+        # FNV-1a over the bands, for all spectra in the chunk at once
+        h = np.full( len(words), FNV_OFFSET, dtype=np.uint64 )
+        for i in range( words.shape[1] ):
+            h ^= words[:, i]
+            h *= FNV_PRIME
+        hashes[start:start+len(words)] = h
+
+    with np.errstate( over='ignore' ):
+        _map_chunks( hash_chunk, numSamples, chunkSize, numThreads )
+
+    _, idx, inverse, counts = np.unique( hashes, return_index=True, return_inverse=True, return_counts=True )
+    del hashes
+
+    # compare each spectrum with the first of its group, to find hash collisions
+    mismatched = np.zeros( numSamples, dtype=bool )
+
+    def verify_chunk( start ):
+        rows = np.arange( start, min(start+chunkSize, numSamples) )
+        firstRows = idx[inverse[rows]]
+        check = rows != firstRows
+        if np.any( check ):
+            mismatched[rows[check]] = np.any( _duplicate_words( spectra, labels, tolerance, rows[check] ) !=
+                                              _duplicate_words( spectra, labels, tolerance, firstRows[check] ), axis=1 )
+
+    _map_chunks( verify_chunk, numSamples, chunkSize, numThreads )
+
+    # spectra that collided are grouped exactly, amongst themselves (spectra of different hashes always differ)
+    if np.any( mismatched ):
+        rows = np.flatnonzero( mismatched )
+        _, first, splitCounts = np.unique( _duplicate_words( spectra, labels, tolerance, rows ), axis=0,
+                                           return_index=True, return_counts=True )
+        np.subtract.at( counts, inverse[rows], 1 )
+        idx = np.concatenate( [idx, rows[first]] )
+        counts = np.concatenate( [counts, splitCounts] )
+
+    order = np.argsort( idx )
+
+    return idx[order].astype( _compact_int_dtype(0, numSamples) ), counts[order]
+
+
+def _duplicate_words( spectra, labels, tolerance, rows ):
+    """Returns the values that spectra (and their labels) must share to be duplicates, as 64-bit words, for the rows \
+        given by a slice or an array of indexes. Shape [numRows x numBands(+1)]."""
+    chunk = np.asarray( spectra[rows, :], dtype=np.float32 )
+    if tolerance is None:
+        # bit patterns of the values (adding zero makes -0.0 equal to 0.0)
+        words = (chunk + np.float32(0)).view( np.uint32 ).astype( np.uint64 )
+    else:
+        words = np.round( chunk / np.float32(tolerance) ).astype( np.int64 ).view( np.uint64 )
+    if labels is not None:
+        chunkLabels = labels[rows].astype( np.int64 ).view( np.uint64 )
+        words = np.concatenate( [words, chunkLabels[:, np.newaxis]], axis=1 )
+    return words
+
+
+def _compact_int_dtype( low, high ):
+    """Returns the smallest signed integer type that holds values between low and high."""
+    for dtype in [np.int8, np.int16, np.int32]:
+        if (low >= np.iinfo(dtype).min) & (high <= np.iinfo(dtype).max):
+            return dtype
+    return np.int64
+
+
+def _temp_memmap( shape, dtype ):
+    """Makes a .npy memmap in a temporary file, which is deleted once the memmap (and any views of it) are no longer \
+        used, or at exit."""
+    fd, addr = tempfile.mkstemp( suffix='.npy' )
+    os.close( fd )
+    arr = np.lib.format.open_memmap( addr, mode='w+', dtype=dtype, shape=shape )
+    weakref.finalize( arr, _remove_file, addr )
+    return arr
+
+
+def _remove_file( addr ):
+    """Deletes a file if it still exists (and can be deleted)."""
+    try:
+        os.remove( addr )
+    except OSError:
+        pass
+
+
+def _is_memmap( arr ):
+    """Checks whether an array is (a view of) a memory-mapped file."""
+    while arr is not None:
+        if isinstance( arr, (np.memmap, mmap.mmap) ):
+            return True
+        arr = getattr( arr, 'base', None )
+    return False
+
+
+def load_memmap( addr, shape=None, dtype='float32', offset=0, mode='r' ):
+    """Opens a spectral dataset stored on disk as a memory-map, so that it can be passed to HypImg without being \
+        read into memory. Accepts .npy files or flat binary files (in which case the shape must be given).
+
+    Args:
+        addr (str): Address of the .npy or flat binary file.
+        shape (int list): Shape of the data in a flat binary file. Can be [numRows x numCols x numBands] or \
+            [numSamples x numBands]. Ignored for .npy files.
+        dtype (str): Data type of a flat binary file. Ignored for .npy files.
+        offset (int): Number of bytes to skip at the start of a flat binary file (e.g. a header).
+        mode (str): Mode to open the file with ('r', 'r+' or 'c').
+
+    Returns:
+        (np.memmap): Memory-mapped spectral data.
+    """
+    if addr.endswith('.npy'):
+        return np.load( addr, mmap_mode=mode )
+
+    if shape is None:
+        raise ValueError('shape must be given for flat binary files.')
+
+    return np.memmap( addr, dtype=dtype, mode=mode, offset=offset, shape=tuple(shape) )
 
 
 
 class Iterator:
-    """ Class for iterating through data, to train the network.
+    """ Class for iterating through data, to train the network. The data is never copied or reordered - shuffling \
+        permutes a vector of sample indexes, and each batch is gathered from the data at those indexes into buffers \
+        that are reused for every batch.
 
         Args:
             dataSamples (np.array float): Data to be input into the network. Shape [numSamples x numBands].
             targets (np.array int): Network output target of each dataSample. For classification, these are the class \
                 labels, and it could be the dataSamples for autoencoders. Shape [numSamples x arbitrary]
             batchSize (int): Number of dataSamples per batch
+            numClasses (int): If given, targets are class labels (shape [numSamples] or [numSamples x 1]) and are \
+                converted to one-hot vectors one batch at a time. Samples with label zero (background class) have a \
+                one-hot vector of all zeros.
+            reshuffle (boolean): Whether to shuffle the data at the start of every epoch when iterating through it.
+            idx (np.array int): Indexes of the samples to iterate through (e.g. the validIdx of a HypImg, if passing \
+                its full-size spectra). If None - all samples.
+            weights (np.array float): Weight of each dataSample (e.g. the counts of duplicate spectra made by \
+                *deduplicate*). Shape [numSamples]. If given, each batch includes the weights of its samples, which \
+                weight their loss when training. If None - all samples are weighted equally.
+            sampleByWeight (boolean): Whether to use the weights as sampling probabilities instead: each epoch draws \
+                numSamples samples (with replacement) with probability proportional to their weight, and the batches \
+                do not include weights. The samples are redrawn each time the data is shuffled.
 
         Attributes:
             dataSamples (np.array float): Data to be input into the network. Shape [numSamples x numBands].
             targets (np.array int): Network output target of each dataSample. For classification, these are the class \
                 labels, and it could be the dataSamples for autoencoders. Shape [numSamples x arbitrary]
             batchSize (int): Number of dataSamples per batch. If None - set to numSamples (i.e. whole dataset).
-            numSamples (int): The number of data samples.
+            numSamples (int): The number of data samples iterated through (len(idx) if idx is given).
+            numClasses (int): If not None - the number of classes targets are one-hot encoded to in each batch.
+            reshuffle (boolean): Whether the data is shuffled at the start of every epoch when iterating through it.
+            epoch (int): Number of epochs iterated through.
+            permutation (np.array int): Order in which the data samples are iterated through. Shape [numSamples].
             currentBatch (int list): A list of indexes specifying the data samples in the current batch. \
                 Shape [batchSize]
+            weights (np.array float): Weight of each dataSample (float32), or None.
+            sampleByWeight (boolean): Whether the weights are used as sampling probabilities.
 
     """
 
-    def __init__(self, dataSamples,targets,batchSize=None):
+    def __init__(self, dataSamples,targets,batchSize=None,numClasses=None,reshuffle=False,idx=None,weights=None,
+                 sampleByWeight=False):
 
         self.dataSamples = dataSamples
         self.targets = targets
-        self.numSamples = np.shape(dataSamples)[0]
+        self.numClasses = numClasses
+        if (numClasses is not None) and (np.ndim(targets) == 1):
+            self.targets = np.reshape( targets, (-1,1) )
+        if idx is None:
+            self.permutation = np.arange(np.shape(dataSamples)[0])
+        else:
+            self.permutation = np.array(idx)
+        self.numSamples = len(self.permutation)
+        self.weights = None if weights is None else np.asarray( weights, dtype=np.float32 )
+        self.sampleByWeight = sampleByWeight
+        if sampleByWeight:
+            if weights is None:
+                raise ValueError('weights must be given to sample by weight.')
+            self.idx = self.permutation
+            self.probabilities = self.weights[self.idx] / np.sum( self.weights[self.idx], dtype=np.float64 )
+            self.permutation = np.random.choice( self.idx, self.numSamples, p=self.probabilities )
         if batchSize is not None:
             self.batchSize = batchSize
         else:
             self.batchSize = self.numSamples
-        self.currentBatch = np.arange(self.batchSize)
+        self.reshuffle = reshuffle
+        self.epoch = 0
+        self.batchStart = 0
+        self.currentBatch = self.permutation[np.arange(self.batchSize) % self.numSamples]
 
+        # buffers that batches are gathered into
+        self.dataBuffer = np.empty( (self.batchSize,) + np.shape(dataSamples)[1:], dtype=dataSamples.dtype )
+        if self.targets is self.dataSamples:
+            self.targetsBuffer = self.dataBuffer
+        elif self.numClasses is None:
+            self.targetsBuffer = np.empty( (self.batchSize,) + np.shape(self.targets)[1:], dtype=self.targets.dtype )
+        else:
+            self.targetsBuffer = np.empty( (self.batchSize, self.numClasses), dtype=np.float32 )
+        if self.loss_weights() is not None:
+            self.weightsBuffer = np.empty( self.batchSize, dtype=np.float32 )
+        else:
+            self.weightsBuffer = None
+
+    def loss_weights(self):
+        """ The weights of the samples in the loss.
+
+        Returns:
+            (np.array float): Weight of each dataSample, or None if the samples are weighted equally (including when \
+                the weights are used as sampling probabilities).
+        """
+        if self.sampleByWeight:
+            return None
+        return self.weights
 
     def next_batch(self):
         """ Return next batch of samples and targets (with batchSize number of samples). The currentBatch indexes are \
-            incremented. If end of dataset reached, the indexes wraps around to the beginning.
+            incremented. If end of dataset reached, the indexes wraps around to the beginning. The returned arrays \
+            are reused by the next call, so copy them to keep them.
 
         Returns:
             (tuple): 2-element tuple containing:
 
             - (*np.array float*) - Batch of data samples at currentBatch indexes. Shape [batchSize x numBands].
             - (*np.array int*) - Batch of targets at currentBatch indexes. Shape [batchSize x arbitrary].
+
+            If the samples are weighted, a third element holds their weights. Shape [batchSize].
         """
 
-        batchData = self.dataSamples[self.currentBatch, :]
-        batchTargets = self.targets[self.currentBatch, :]
+        batch = self._gather( self.currentBatch )
 
         # update current batch
-        self.currentBatch += self.batchSize
-        self.currentBatch[self.currentBatch >= self.numSamples] = \
-            self.currentBatch[self.currentBatch >= self.numSamples] - self.numSamples
+        self.batchStart = (self.batchStart + self.batchSize) % self.numSamples
+        self.currentBatch = self.permutation[(self.batchStart + np.arange(self.batchSize)) % self.numSamples]
+
+        return batch
 
-        return batchData , batchTargets
+    def __iter__(self):
+        """ Iterates through one epoch of the data, in batches of batchSize samples (the last batch holds the \
+            remaining samples, so may be smaller). Shuffles the data first if reshuffle is True. The yielded arrays \
+            are reused by the next batch, so copy them to keep them.
+
+        Yields:
+            (tuple): 2-element tuple containing:
+
+            - (*np.array float*) - Batch of data samples. Shape [batchSize x numBands].
+            - (*np.array int*) - Batch of targets. Shape [batchSize x arbitrary].
+
+            If the samples are weighted, a third element holds their weights. Shape [batchSize].
+        """
+
+        if self.reshuffle:
+            self.shuffle()
+        for start in range( 0, self.numSamples, self.batchSize ):
+            yield self._gather( self.permutation[start:start+self.batchSize] )
+        self.epoch += 1
+
+    def __len__(self):
+        """ Number of batches in an epoch.
+
+        """
+        return int( np.ceil( float(self.numSamples) / self.batchSize ) )
 
     def get_batch(self, idx):
         """ Returns a specified set of samples and targets.
@@ -155,34 +936,160 @@ class Iterator:
 
             - (*np.array float*) - Batch of data samples at [idx] indexes. Shape [length(idx) x numBands].
             - (*np.array int*) - Batch of targets at [idx] indexes. Shape [length(idx) x arbitrary].
+
+            If the samples are weighted, a third element holds their weights. Shape [length(idx)].
         """
 
         batchData = self.dataSamples[idx, :]
-        batchTargets = self.targets[idx, :]
+        batchTargets = self._encode_targets( self.targets[idx, :] )
 
+        if self.loss_weights() is not None:
+            return batchData, batchTargets, self.weights[idx]
         return batchData, batchTargets
 
+    def _gather(self, idx):
+        """ Gathers the samples and targets at idx into the batch buffers.
+
+        """
+        numBatch = len(idx)
+        batchData = np.take( self.dataSamples, idx, axis=0, out=self.dataBuffer[:numBatch] )
+        if self.targets is self.dataSamples:
+            # autoencoder targets are the data samples
+            batchTargets = batchData
+        elif self.numClasses is None:
+            batchTargets = np.take( self.targets, idx, axis=0, out=self.targetsBuffer[:numBatch] )
+        else:
+            batchTargets = onehot( np.take( self.targets, idx, axis=0 ), self.numClasses,
+                                   out=self.targetsBuffer[:numBatch] )
+
+        if self.weightsBuffer is not None:
+            return batchData, batchTargets, np.take( self.weights, idx, axis=0, out=self.weightsBuffer[:numBatch] )
+        return batchData, batchTargets
+
+    def _encode_targets(self, batchTargets):
+        """ One-hot encodes a batch of class label targets if numClasses was given.
+
+        """
+        if self.numClasses is None:
+            return batchTargets
+        return onehot( batchTargets, self.numClasses )
+
 
     def reset_batch(self):
         """ Resets the current batch to the beginning.
 
         """
 
-        self.currentBatch = np.arange(self.batchSize)
+        self.batchStart = 0
+        self.currentBatch = self.permutation[np.arange(self.batchSize) % self.numSamples]
 
     def shuffle(self):
-        """ Randomly permutes all dataSamples (and corresponding targets).
+        """ Randomly permutes the order in which the dataSamples (and corresponding targets) are iterated through. \
+            Only the vector of sample indexes is permuted, the data itself is not copied. If sampling by weight, the \
+            samples are redrawn instead. Resets the current batch.
 
         """
-        idx = np.random.permutation(np.shape(self.dataSamples)[0])
-        self.dataSamples = self.dataSamples[idx,:]
-        self.targets = self.targets[idx,:]
+        if self.sampleByWeight:
+            self.permutation = np.random.choice( self.idx, self.numSamples, p=self.probabilities )
+        else:
+            np.random.shuffle(self.permutation)
+        self.reset_batch()
 
 
+class PrefetchIterator(Iterator):
+    """ Class for iterating through data to train the network, which assembles batches in a background thread while \
+        the network trains on the previous ones. Ready batches are held in a bounded queue. It can be used anywhere an \
+        Iterator is used.
 
+        Args:
+            dataSamples (np.array float): Data to be input into the network. Shape [numSamples x numBands].
+            targets (np.array int): Network output target of each dataSample. Shape [numSamples x arbitrary]
+            batchSize (int): Number of dataSamples per batch
+            numClasses (int): If given, targets are class labels and are converted to one-hot vectors one batch at a \
+                time.
+            reshuffle (boolean): Whether to shuffle the data at the start of every epoch when iterating through it.
+            idx (np.array int): Indexes of the samples to iterate through. If None - all samples.
+            weights (np.array float): Weight of each dataSample. If None - all samples are weighted equally.
+            sampleByWeight (boolean): Whether to use the weights as sampling probabilities instead.
+            depth (int): Maximum number of ready batches held in the queue.
 
+        Attributes:
+            depth (int): Maximum number of ready batches held in the queue.
+            waitTime (float): Seconds spent waiting for batches to be ready during the last epoch.
+
+    """
+
+    def __init__(self, dataSamples, targets, batchSize=None, numClasses=None, reshuffle=False, idx=None, weights=None,
+                 sampleByWeight=False, depth=2):
+
+        Iterator.__init__(self, dataSamples, targets, batchSize, numClasses, reshuffle, idx, weights, sampleByWeight)
+        self.depth = depth
+        self.waitTime = 0.0
+
+        # a batch can be in the queue, being assembled or being used by the network, so each needs its own buffer
+        self.buffers = [(self.dataBuffer, self.targetsBuffer, self.weightsBuffer)]
+        for i in range( self.depth + 1 ):
+            dataBuffer = np.empty_like( self.dataBuffer )
+            if self.targetsBuffer is self.dataBuffer:
+                targetsBuffer = dataBuffer
+            else:
+                targetsBuffer = np.empty_like( self.targetsBuffer )
+            weightsBuffer = None if self.weightsBuffer is None else np.empty_like( self.weightsBuffer )
+            self.buffers.append( (dataBuffer, targetsBuffer, weightsBuffer) )
+
+    def __iter__(self):
+        """ Iterates through one epoch of the data, in batches of batchSize samples, which are assembled in a \
+            background thread. The yielded arrays are reused, so copy them to keep them.
+
+        Yields:
+            (tuple): 2-element tuple containing:
+
+            - (*np.array float*) - Batch of data samples. Shape [batchSize x numBands].
+            - (*np.array int*) - Batch of targets. Shape [batchSize x arbitrary].
+
+            If the samples are weighted, a third element holds their weights. Shape [batchSize].
+        """
 
+        if self.reshuffle:
+            self.shuffle()
+        batchQueue = queue.Queue( maxsize=self.depth )
+        stop = threading.Event()
 
+        def put( item ):
+            while not stop.is_set():
+                try:
+                    batchQueue.put( item, timeout=0.1 )
+                    return
+                except queue.Full:
+                    pass
 
+        def produce():
+            try:
+                for batchNum, start in enumerate( range( 0, self.numSamples, self.batchSize ) ):
+                    if stop.is_set():
+                        return
+                    self.dataBuffer, self.targetsBuffer, self.weightsBuffer = self.buffers[batchNum % len(self.buffers)]
+                    put( self._gather( self.permutation[start:start+self.batchSize] ) )
+                put( None )
+            except Exception as e:
+                put( e )
 
+        producer = threading.Thread( target=produce )
+        producer.daemon = True
+        producer.start()
 
+        self.waitTime = 0.0
+        try:
+            while True:
+                waitStart = time.time()
+                batch = batchQueue.get()
+                self.waitTime += time.time() - waitStart
+                if batch is None:
+                    break
+                if isinstance( batch, Exception ):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            producer.join()
+        self.epoch += 1
@@ -0,0 +1,363 @@
+'''
+    Description: reading and writing hyperspectral images in the ENVI format (a raw binary file with a text header). \
+    Images are memory-mapped, so windows of rows, columns and bands are read from disk only when they are used, and \
+    outputs are written tile by tile.
+
+    - File name: envi.py
+    - Author: deephyp contributors
+    - Date created: October 2026
+    - Python package: deephyp
+
+'''
+
+import numpy as np
+import os
+import sys
+from deephyp import data
+
+
+# numpy data types of the ENVI data type codes
+DATA_TYPES = {1:np.uint8, 2:np.int16, 3:np.int32, 4:np.float32, 5:np.float64, 6:np.complex64, 9:np.complex128,
+              12:np.uint16, 13:np.uint32, 14:np.int64, 15:np.uint64}
+
+# data types ENVI has no code for, and the types they are widened to when written
+WIDENED_TYPES = {np.dtype(np.int8):np.int16, np.dtype(bool):np.uint8}
+
+# axes of the raw data in the file (in order) for each interleave, as axes of a [numRows x numCols x numBands] cube
+INTERLEAVE_AXES = {'bsq':(2, 0, 1), 'bil':(0, 2, 1), 'bip':(0, 1, 2)}
+
+# header fields parsed as integers, lists of floats and lists of strings
+INT_FIELDS = ['samples', 'lines', 'bands', 'header offset', 'data type', 'byte order', 'classes']
+FLOAT_LIST_FIELDS = ['wavelength', 'fwhm', 'bbl', 'data gain values', 'data offset values']
+STR_LIST_FIELDS = ['band names', 'class names']
+
+# extensions tried for the data file of a header
+DATA_EXTENSIONS = ['', '.img', '.dat', '.raw', '.bsq', '.bil', '.bip']
+
+
+class EnviImage():
+    """ Class for reading an ENVI image. The raw data is memory-mapped and exposed as a cube of shape \
+        [numRows x numCols x numBands], which is a view of the file whatever its interleave (nothing is read until it \
+        is used). Windows of the cube are also views, read from disk as they are used. They are contiguous in the file \
+        (and so fastest to read) for: ranges of rows of a BIP or BIL image, ranges of bands of a BSQ image.
+
+    Args:
+        addr (str): Address of the header (.hdr) or of the data file. The other is found from it.
+        mode (str): Mode to open the data file with ('r', 'r+' or 'c').
+
+    Attributes:
+        header (dict): Fields of the header. Integer fields, wavelengths and names are parsed, others are strings.
+        headerAddr (str): Address of the header.
+        dataAddr (str): Address of the data file.
+        interleave (str): Interleave of the data file. Current options: ['bsq', 'bil', 'bip'].
+        numRows (int): Number of image rows (ENVI lines).
+        numCols (int): Number of image columns (ENVI samples).
+        numBands (int): Number of bands.
+        dtype (np.dtype): Data type of the data file (including its byte order).
+        wavelengths (np.array float): Wavelength of each band if given in the header. Else None.
+        raw (np.memmap): Data in the order it is stored in the file.
+        cube (np.memmap): View of the data with shape [numRows x numCols x numBands].
+    """
+
+    def __init__(self, addr, mode='r'):
+
+        self.headerAddr, self.dataAddr = find_files(addr)
+        self.header = read_header(self.headerAddr)
+
+        self.interleave = self.header.get('interleave', 'bsq').lower()
+        if self.interleave not in INTERLEAVE_AXES:
+            raise ValueError('unknown interleave: %s. Use bsq, bil or bip.' % self.interleave)
+        if self.header['data type'] not in DATA_TYPES:
+            raise ValueError('unsupported ENVI data type: %i.' % self.header['data type'])
+
+        self.numRows = self.header['lines']
+        self.numCols = self.header['samples']
+        self.numBands = self.header['bands']
+        self.dtype = np.dtype(DATA_TYPES[self.header['data type']]).newbyteorder(
+            '>' if self.header.get('byte order', 0) == 1 else '<')
+        self.wavelengths = None
+        if 'wavelength' in self.header:
+            self.wavelengths = np.asarray(self.header['wavelength'], dtype=np.float64)
+
+        cubeShape = (self.numRows, self.numCols, self.numBands)
+        axes = INTERLEAVE_AXES[self.interleave]
+        self.raw = np.memmap(self.dataAddr, dtype=self.dtype, mode=mode, offset=self.header.get('header offset', 0),
+                             shape=tuple(cubeShape[axis] for axis in axes))
+        self.cube = np.transpose(self.raw, np.argsort(axes))
+
+    def window(self, rows=None, cols=None, bands=None):
+        """ View of a window of the image. Nothing is read from disk until the view is used.
+
+        Args:
+            rows (slice): Rows of the window. If None - all rows.
+            cols (slice): Columns of the window. If None - all columns.
+            bands (slice): Bands of the window. If None - all bands.
+
+        Returns:
+            (np.memmap): Window with shape [numRows x numCols x numBands].
+        """
+        return self.cube[_to_slice(rows), _to_slice(cols), _to_slice(bands)]
+
+    def read(self, rows=None, cols=None, bands=None, dtype=None):
+        """ Reads a window of the image into memory.
+
+        Args:
+            rows (slice): Rows of the window. If None - all rows.
+            cols (slice): Columns of the window. If None - all columns.
+            bands (slice or int list): Bands of the window. If None - all bands.
+            dtype (np.dtype): Data type to read the window as. If None - the data type of the file (in native byte \
+                order).
+
+        Returns:
+            (np.array): Window with shape [numRows x numCols x numBands].
+        """
+        if dtype is None:
+            dtype = self.dtype.newbyteorder('=')
+        window = self.cube[_to_slice(rows), _to_slice(cols)]
+        if bands is not None:
+            window = window[:, :, bands]
+        return np.ascontiguousarray(window, dtype=dtype)
+
+    def to_hypimg(self, labels=None, bands=None, outAddr=None, tileRows=256, chunkSize=100000, dtype=np.float32):
+        """ Makes a data.HypImg of the image, with its wavelengths and bands set from the header. HypImg needs the \
+            spectra of each pixel to be contiguous, so a BIP image with all its bands is used directly (as a \
+            memmap). Otherwise the image is copied tile by tile into a BIP memmap on disk. The whole image is never \
+            read into memory.
+
+        Args:
+            labels (np.array int): Class labels of each pixel. Shape [numRows x numCols].
+            bands (int list): Indexes of the bands to use. If None - all bands.
+            outAddr (str): Address of a .npy file to copy the image to, if it needs copying. If None - a temporary \
+                file is used, which is deleted once the HypImg's spectra are no longer used, or at exit.
+            tileRows (int): Number of rows copied at a time.
+            chunkSize (int): Number of spectra processed at a time by the HypImg when pre-processing.
+            dtype (np.dtype): Data type the HypImg stores spectraPrep as.
+
+        Returns:
+            (obj): data.HypImg of the image. Its spectra are a memmap.
+        """
+
+        if (self.interleave == 'bip') & (bands is None) & self.dtype.isnative:
+            cube = self.cube
+        else:
+            bandIdx = np.arange(self.numBands) if bands is None else np.asarray(bands)
+            shape = (self.numRows, self.numCols, len(bandIdx))
+            if outAddr is None:
+                cube = data._temp_memmap(shape, self.dtype.newbyteorder('='))
+            else:
+                cube = np.lib.format.open_memmap(outAddr, mode='w+', dtype=self.dtype.newbyteorder('='), shape=shape)
+            for start in range(0, self.numRows, tileRows):
+                cube[start:start+tileRows] = self.cube[start:start+tileRows][:, :, bandIdx]
+            cube.flush()
+
+        if bands is None:
+            bands = np.arange(self.numBands)
+        wavelengths = self.wavelengths
+        if wavelengths is None:
+            bands = None
+
+        return data.HypImg(cube, labels=labels, wavelengths=wavelengths, bands=bands, chunkSize=chunkSize,
+                           dtype=dtype)
+
+
+class EnviWriter():
+    """ Class for writing an ENVI image tile by tile, e.g. the latent vectors or class labels output by a network for \
+        a scene. The header is written when the writer is made, and the data file is memory-mapped, so tiles can be \
+        written in any order. The *cube* attribute can be passed as the output array of functions that write into one \
+        (e.g. scene.SceneProcessor.process).
+
+    Args:
+        addr (str): Address of the data file. The header is written alongside it, with the extension .hdr.
+        numRows (int): Number of image rows.
+        numCols (int): Number of image columns.
+        numBands (int): Number of bands. If None - a single-band image (e.g. a label map), for which tiles have shape \
+            [tileRows x numCols].
+        dtype (np.dtype): Data type of the image. Must be one of the types in DATA_TYPES, or in WIDENED_TYPES (e.g. \
+            the compact int8 labels of a HypImg), which are written as the wider type they map to.
+        interleave (str): Interleave of the data file. Current options: ['bsq', 'bil', 'bip'].
+        wavelengths (np.array float): Wavelength of each band written to the header. If None - not written.
+        bandNames (str list): Name of each band written to the header (e.g. 'z1', 'z2', ...). If None - not written.
+        classNames (str list): Name of each class of a label map (including the background class 0). If given, the \
+            image is written as an ENVI classification file.
+        description (str): Description written to the header.
+
+    Attributes:
+        headerAddr (str): Address of the header.
+        dataAddr (str): Address of the data file.
+        header (dict): Fields of the header.
+        raw (np.memmap): Data in the order it is stored in the file.
+        cube (np.memmap): View of the data with shape [numRows x numCols x numBands], or [numRows x numCols] for a \
+            single-band image.
+    """
+
+    def __init__(self, addr, numRows, numCols, numBands=None, dtype=np.float32, interleave='bsq', wavelengths=None,
+                 bandNames=None, classNames=None, description='deephyp output'):
+
+        interleave = interleave.lower()
+        if interleave not in INTERLEAVE_AXES:
+            raise ValueError('unknown interleave: %s. Use bsq, bil or bip.' % interleave)
+        dataTypes = dict((np.dtype(value), key) for key, value in DATA_TYPES.items())
+        dtype = np.dtype(WIDENED_TYPES.get(np.dtype(dtype), dtype)).newbyteorder('=')
+        if dtype not in dataTypes:
+            raise ValueError('data type %s cannot be written to an ENVI file.' % dtype)
+
+        self.dataAddr = addr
+        self.headerAddr = os.path.splitext(addr)[0] + '.hdr'
+        self.header = {'description':description, 'samples':numCols, 'lines':numRows,
+                       'bands':1 if numBands is None else numBands, 'header offset':0, 'file type':'ENVI Standard',
+                       'data type':dataTypes[dtype], 'interleave':interleave,
+                       'byte order':int(sys.byteorder == 'big')}
+        if wavelengths is not None:
+            self.header['wavelength'] = list(wavelengths)
+        if bandNames is not None:
+            self.header['band names'] = list(bandNames)
+        if classNames is not None:
+            self.header['file type'] = 'ENVI Classification'
+            self.header['classes'] = len(classNames)
+            self.header['class names'] = list(classNames)
+        write_header(self.headerAddr, self.header)
+
+        cubeShape = (numRows, numCols, self.header['bands'])
+        axes = INTERLEAVE_AXES[interleave]
+        self.raw = np.memmap(addr, dtype=dtype, mode='w+', shape=tuple(cubeShape[axis] for axis in axes))
+        self.cube = np.transpose(self.raw, np.argsort(axes))
+        if numBands is None:
+            self.cube = self.cube[:, :, 0]
+
+    def write(self, start, tile):
+        """ Writes a tile of rows.
+
+        Args:
+            start (int): First row of the tile.
+            tile (np.array): Shape [tileRows x numCols x numBands], or [tileRows x numCols] for a single-band image. \
+                Tiles of spectra with shape [tileRows*numCols x numBands] (e.g. output by a network) are also accepted.
+        """
+        numTileRows = np.shape(tile)[0]
+        if np.ndim(tile) != self.cube.ndim:
+            numTileRows //= self.cube.shape[1]
+        rows = self.cube[start:start+numTileRows]
+        rows[...] = np.reshape(tile, rows.shape)
+
+    def close(self):
+        """ Flushes the data to disk.
+        """
+        self.raw.flush()
+
+
+def write_envi(addr, array, interleave='bsq', wavelengths=None, bandNames=None, classNames=None, tileRows=256):
+    """ Writes an image (e.g. the latent vectors of a scene, reshaped to [numRows x numCols x zDim], or a label map) \
+        to an ENVI file, tile by tile.
+
+    Args:
+        addr (str): Address of the data file. The header is written alongside it, with the extension .hdr.
+        array (np.array): Image with shape [numRows x numCols x numBands], or [numRows x numCols] for a single-band \
+            image. Can be a memmap. int8 and bool images are written as int16 and uint8 (see WIDENED_TYPES).
+        interleave (str): Interleave of the data file. Current options: ['bsq', 'bil', 'bip'].
+        wavelengths (np.array float): Wavelength of each band written to the header. If None - not written.
+        bandNames (str list): Name of each band written to the header. If None - not written.
+        classNames (str list): Name of each class of a label map. If given, written as an ENVI classification file.
+        tileRows (int): Number of rows written at a time.
+    """
+    shape = np.shape(array)
+    writer = EnviWriter(addr, shape[0], shape[1], shape[2] if len(shape) == 3 else None, np.asarray(array).dtype,
+                        interleave, wavelengths, bandNames, classNames)
+    for start in range(0, shape[0], tileRows):
+        writer.write(start, array[start:start+tileRows])
+    writer.close()
+
+
+def read_header(addr):
+    """ Reads the fields of an ENVI header.
+
+    Args:
+        addr (str): Address of the header.
+
+    Returns:
+        (dict): Fields of the header, keyed by their lower-case names. Integer fields (e.g. 'samples'), lists of \
+            numbers (e.g. 'wavelength') and lists of names (e.g. 'band names') are parsed. Other fields are strings \
+            (with any braces removed).
+    """
+
+    with open(addr, 'r') as f:
+        lines = f.read().splitlines()
+    if (len(lines) == 0) or (lines[0].strip() != 'ENVI'):
+        raise ValueError('not an ENVI header: %s' % addr)
+
+    header = {}
+    key = None
+    for line in lines[1:]:
+        if key is None:
+            if ('=' not in line) or line.strip().startswith(';'):
+                continue
+            key, value = line.split('=', 1)
+            key, value = key.strip().lower(), value.strip()
+        else:
+            # braced values can span several lines
+            value += '\n' + line
+        if value.startswith('{') and ('}' not in value):
+            continue
+        header[key] = _parse_field(key, value)
+        key = None
+
+    return header
+
+
+def write_header(addr, header):
+    """ Writes an ENVI header.
+
+    Args:
+        addr (str): Address of the header.
+        header (dict): Fields of the header. Lists are written in braces.
+    """
+    with open(addr, 'w') as f:
+        f.write('ENVI\n')
+        for key, value in header.items():
+            if isinstance(value, (list, tuple, np.ndarray)):
+                value = '{' + ', '.join(str(v) for v in value) + '}'
+            elif key == 'description':
+                value = '{' + str(value) + '}'
+            f.write('%s = %s\n' % (key, value))
+
+
+def find_files(addr):
+    """ Finds the header and data file of an ENVI image, from the address of either.
+
+    Args:
+        addr (str): Address of the header (.hdr) or of the data file.
+
+    Returns:
+        (tuple): 2-element tuple containing the addresses of the header and the data file.
+    """
+    if addr.lower().endswith('.hdr'):
+        headerAddr = addr
+        base = addr[:-len('.hdr')]
+        candidates = [base + extension for extension in DATA_EXTENSIONS]
+        candidates += [base + extension.upper() for extension in DATA_EXTENSIONS]
+        dataAddr = next((candidate for candidate in candidates if os.path.isfile(candidate)), None)
+        if dataAddr is None:
+            raise IOError('no data file found for header: %s' % addr)
+    else:
+        dataAddr = addr
+        candidates = [addr + '.hdr', os.path.splitext(addr)[0] + '.hdr', os.path.splitext(addr)[0] + '.HDR']
+        headerAddr = next((candidate for candidate in candidates if os.path.isfile(candidate)), None)
+        if headerAddr is None:
+            raise IOError('no header found for data file: %s' % addr)
+    return headerAddr, dataAddr
+
+
+def _parse_field(key, value):
+    """Parses the value of a header field."""
+    if value.startswith('{'):
+        value = value[1:value.rindex('}')].strip()
+    if key in INT_FIELDS:
+        return int(value)
+    if key in FLOAT_LIST_FIELDS:
+        return [float(v) for v in value.replace('\n', ' ').split(',') if v.strip() != '']
+    if key in STR_LIST_FIELDS:
+        return [v.strip() for v in value.split(',')]
+    return value
+
+
+def _to_slice(window):
+    """Slice of a window (all if None)."""
+    return slice(None) if window is None else window
@@ -0,0 +1,319 @@
+'''
+    Description: class for using models exported as frozen inference graphs, which load without rebuilding the \
+    network or restoring a checkpoint.
+
+    - File name: frozen.py
+    - Author: deephyp contributors
+    - Date created: October 2026
+    - Python package: deephyp
+
+'''
+
+import tensorflow as tf
+import json
+from os.path import join
+from deephyp import network_ops as net_ops
+
+
+class FrozenModel():
+    """ Class for using a model exported with the export_frozen class function of the networks. The frozen graph is \
+        imported into its own graph and session, which stay open until the *close* class function is called. It has \
+        the same inference functions as the network it was exported from. If the model was saved with a \
+        pre-processor, it is applied to the data samples input into the model when the inference functions are \
+        called with applyPreProcessor=True, so it is a drop-in replacement for the network's inference functions.
+
+    Args:
+        addr (str): Directory the model was exported to.
+
+    Attributes:
+        network (str): Network the model was exported from. Current options: ['autoencoder.mlp_1D_network', \
+            'autoencoder.cnn_1D_network', 'classifier.cnn_1D_network'].
+        config (dict): Config of the network, and the names of its output tensors.
+        graph (obj): Tensor flow graph holding the frozen model.
+        sess (obj): Tensor flow session the model is run in.
+        outputs (dict): Output tensors of the model, keyed by name (see network_ops.network_outputs).
+        preProcessor (obj): data.PreProcessor saved with the model, or None.
+    """
+
+    def __init__(self, addr):
+
+        with open(join(addr, 'frozen_model.json'), 'r') as infile:
+            self.config = json.load(infile)
+        self.network = self.config['network']
+
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(join(addr, 'frozen_model.pb'), 'rb') as infile:
+            graph_def.ParseFromString(infile.read())
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.outputs = {}
+        for name in self.config['outputs']:
+            self.outputs[name] = self.graph.get_tensor_by_name(self.config['outputs'][name])
+
+        self.sess = tf.Session(graph=self.graph)
+        self.preProcessor = net_ops.load_preprocessor(addr)
+
+    def close(self):
+        """ Closes the session the model is run in.
+        """
+        self.sess.close()
+
+    def _preprocessor(self, applyPreProcessor):
+        return self.preProcessor if applyPreProcessor else None
+
+    def _output(self, name, function):
+        if name not in self.outputs:
+            raise Exception('the %s function is not available for a %s model.' % (function, self.network))
+        return self.outputs[name]
+
+    def encoder(self, dataSamples, batchSize=None, out=None, generator=False, applyPreProcessor=False):
+        """ Extract the latent variable of some dataSamples.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Latent representation z of dataSamples. Shape [numSamples x arbitrary].
+        """
+        return net_ops.run_batched(self.sess, self._output('z', 'encoder'), self.outputs['x'], dataSamples,
+                                   batchSize, out, generator, self._preprocessor(applyPreProcessor))
+
+    def decoder(self, dataZ, batchSize=None, out=None, generator=False):
+        """ Extract the reconstruction of some dataSamples from their latent representation encoding.
+
+        Args:
+            dataZ (np.array): Latent representation of data samples to reconstruct. Shape [numSamples x arbitrary].
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+
+        Returns:
+            (np.array or generator): Reconstructed data. Shape [numSamples x inputSize].
+        """
+        return net_ops.run_batched(self.sess, self._output('y_recon', 'decoder'), self._output('z', 'decoder'), dataZ,
+                                   batchSize, out, generator)
+
+    def encoder_decoder(self, dataSamples, batchSize=None, out=None, generator=False, applyPreProcessor=False):
+        """ Extract the reconstruction of some dataSamples.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Reconstructed data. Shape [numSamples x inputSize].
+        """
+        return net_ops.run_batched(self.sess, self._output('y_recon', 'encoder_decoder'), self.outputs['x'],
+                                   dataSamples, batchSize, out, generator, self._preprocessor(applyPreProcessor))
+
+    def predict_scores(self, dataSamples, useSoftmax=True, batchSize=None, out=None, generator=False,
+                       applyPreProcessor=False):
+        """ Extract the predicted classification scores of some dataSamples.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            useSoftmax (boolean): Pass predicted scores output by the model through a softmax function.
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Predicted classification scores of dataSamples. Shape [numSamples x numClasses].
+        """
+        if useSoftmax:
+            scores = self._output('y_scores', 'predict_scores')
+        else:
+            scores = self._output('y_pred', 'predict_scores')
+        return net_ops.run_batched(self.sess, scores, self.outputs['x'], dataSamples, batchSize, out, generator,
+                                   self._preprocessor(applyPreProcessor))
+
+    def predict_labels(self, dataSamples, batchSize=None, out=None, generator=False, applyPreProcessor=False):
+        """ Extract the predicted classification labels of some dataSamples.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Predicted classification labels of dataSamples. Shape [numSamples].
+        """
+        return net_ops.run_batched(self.sess, self._output('y_labels', 'predict_labels'), self.outputs['x'],
+                                   dataSamples, batchSize, out, generator, self._preprocessor(applyPreProcessor))
+
+    def predict_features(self, dataSamples, layer, batchSize=None, out=None, generator=False, applyPreProcessor=False):
+        """ Extract the feature values at a particular layer of the model.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            layer (int): Layer at which to extract features.
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Values of neurons at layer. Shape [numSamples x numNeurons] if fully-connected \
+                layer and [numSamples x convDim1 x convDim2] if convolutional layer.
+        """
+        return net_ops.run_batched(self.sess, self._output('a%i' % layer, 'predict_features'), self.outputs['x'],
+                                   dataSamples, batchSize, out, generator, self._preprocessor(applyPreProcessor))
+
+
+class Ensemble():
+    """ Class for inferring several models of the same network at once. The frozen graphs of the models are imported \
+        into one graph, all fed by the same input placeholder, so the data samples are pre-processed and fed once \
+        and every model's outputs are computed in a single session run. Outputs can be returned for each model or \
+        reduced across the models.
+
+    Args:
+        graphDefs (list): Frozen tensor flow GraphDef of each model (see network_ops.freeze_graph).
+        outputNames (list): Names of the output tensors in each GraphDef, keyed as in network_ops.network_outputs.
+        preProcessor (obj): data.PreProcessor applied to data samples before they are fed. If None - data samples \
+            are fed unchanged.
+
+    Attributes:
+        numModels (int): Number of models in the ensemble.
+        graph (obj): Tensor flow graph holding the models.
+        sess (obj): Tensor flow session the models are run in.
+        x (tensor): Input placeholder shared by the models.
+        outputs (dict): List of each model's output tensors, keyed by name (see network_ops.network_outputs).
+        reduced (dict): Tensors combining the models' outputs built by the *output* class function, keyed by \
+            (name, reduce).
+        preProcessor (obj): data.PreProcessor applied to data samples, or None.
+    """
+
+    def __init__(self, graphDefs, outputNames, preProcessor=None):
+
+        self.numModels = len(graphDefs)
+        self.preProcessor = preProcessor
+        self.graph = tf.Graph()
+        self.outputs = {}
+        self.reduced = {}
+        with self.graph.as_default():
+            for modelNum in range(self.numModels):
+                names = sorted(outputNames[modelNum])
+                inputMap = None
+                if modelNum > 0:
+                    inputMap = {outputNames[modelNum]['x']: self.x}
+                tensors = tf.import_graph_def(graphDefs[modelNum], input_map=inputMap,
+                                              return_elements=[outputNames[modelNum][name] for name in names],
+                                              name='model_%i' % modelNum)
+                for name, tensor in zip(names, tensors):
+                    self.outputs.setdefault(name, []).append(tensor)
+                if modelNum == 0:
+                    self.x = self.outputs['x'][0]
+        del self.outputs['x']
+
+        self.sess = tf.Session(graph=self.graph)
+
+    def close(self):
+        """ Closes the session the models are run in.
+        """
+        self.sess.close()
+
+    def output(self, name, reduce=None):
+        """ Gets a tensor computing an output of all the models. Tensors are built once and reused.
+
+        Args:
+            name (str): Name of the output (see network_ops.network_outputs), e.g. 'z', 'y_recon', 'y_scores' or \
+                'y_labels'.
+            reduce (str): How to combine the models' outputs. Current options: [None, 'mean', 'vote']. None stacks \
+                them along the second axis, 'mean' averages them and 'vote' gives the most common of the models' \
+                labels (only for 'y_labels', ties go to the lowest label).
+
+        Returns:
+            (tensor): Shape [numSamples x numModels x arbitrary] if reduce is None, else [numSamples x arbitrary].
+        """
+        if name not in self.outputs:
+            raise ValueError('unknown output: %s. Use %s.' % (name, ', '.join(sorted(self.outputs))))
+        if (reduce is not None) & (reduce != 'mean') & (reduce != 'vote'):
+            raise ValueError('unknown reduce method: %s. Use None, mean or vote.' % reduce)
+        if (reduce == 'vote') & (name != 'y_labels'):
+            raise ValueError('the vote reduce method is only for the y_labels output.')
+
+        if (name, reduce) not in self.reduced:
+            with self.graph.as_default():
+                stacked = tf.stack(self.outputs[name], axis=1)
+                if reduce is None:
+                    tensor = stacked
+                elif reduce == 'mean':
+                    tensor = tf.reduce_mean(tf.cast(stacked, tf.float32), axis=1)
+                else:
+                    numClasses = self.outputs['y_pred'][0].get_shape().as_list()[-1]
+                    votes = tf.reduce_sum(tf.one_hot(stacked - 1, numClasses), axis=1)
+                    tensor = tf.math.argmax(votes, axis=1) + 1
+            self.reduced[(name, reduce)] = tensor
+        return self.reduced[(name, reduce)]
+
+    def predict(self, dataSamples, name, reduce=None, batchSize=None, out=None, generator=False,
+                applyPreProcessor=False):
+        """ Computes an output of all the models for some dataSamples, feeding each batch once.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            name (str): Name of the output (see network_ops.network_outputs), e.g. 'z', 'y_recon', 'y_scores' or \
+                'y_labels'.
+            reduce (str): How to combine the models' outputs. Current options: [None, 'mean', 'vote'] (see *output*).
+            batchSize (int): Number of samples to run through the models at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the models' saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Shape [numSamples x numModels x arbitrary] if reduce is None, else \
+                [numSamples x arbitrary].
+        """
+        return net_ops.run_batched(self.sess, self.output(name, reduce), self.x, dataSamples, batchSize, out,
+                                   generator, self.preProcessor if applyPreProcessor else None)
+
+
+def ensemble_from_network(net_obj, modelNames):
+    """ Makes an ensemble of models added to a network, by freezing the graph of each model.
+
+    Args:
+        net_obj (obj): Network object.
+        modelNames (list): Names of the models (previously added with add_model() ).
+
+    Returns:
+        (obj): Ensemble object.
+    """
+    preProcessors = [net_obj.modelsPreProcessors.get(modelName) for modelName in modelNames]
+    configs = [preProcessor.get_config() if preProcessor is not None else None for preProcessor in preProcessors]
+    if any(config != configs[0] for config in configs):
+        raise Exception('the models of an ensemble must be saved with the same pre-processing, so that the data '
+                        'samples can be fed to them once.')
+
+    graphDefs = []
+    outputNames = []
+    for modelName in modelNames:
+        graph_def, names = net_ops.freeze_graph(net_obj, modelName)
+        graphDefs.append(graph_def)
+        outputNames.append(names)
+
+    return Ensemble(graphDefs, outputNames, preProcessors[0])
@@ -0,0 +1,332 @@
+'''
+    Description: approximate nearest-neighbour index over the latent vectors output by the encoder of an autoencoder, \
+    for retrieving the pixels most similar to some spectra. The index is an inverted file: a coarse k-means quantiser \
+    splits the latent space into lists, and a query only searches the lists nearest to it.
+
+    - File name: index.py
+    - Author: deephyp contributors
+    - Date created: October 2026
+    - Python package: deephyp
+
+'''
+
+import numpy as np
+import json
+import os
+import shutil
+import tempfile
+from os.path import join
+
+
+# number of rows of codes compared with the queries at a time
+BLOCK_SIZE = 65536
+
+
+class LatentIndex():
+    """ Class for indexing latent vectors (e.g. output by the encoder function of autoencoder.mlp_1D_network or \
+        autoencoder.cnn_1D_network), and searching them for the nearest neighbours of some queries. The index must \
+        be trained on a sample of the vectors (to learn the centroids of its lists) before vectors are added. \
+        Vectors can be added incrementally (e.g. one scene at a time). A query searches only the numProbes lists with \
+        centroids nearest to it, so the time taken grows with the size of the lists rather than the number of \
+        vectors indexed. Vectors are stored as residuals from the centroid of their list, which keeps the distances \
+        computed from them accurate in float32.
+
+    Args:
+        numLists (int): Number of lists (k-means centroids) the vectors are split into.
+        metric (str): Distance between vectors. Current options: ['euclidean', 'cosine'].
+        numProbes (int): Default number of lists searched for each query. More lists gives more accurate results, \
+            in more time.
+        addr (str): Address of a directory an index was saved to with the *save* class function. If given, the index \
+            is loaded from it (and the other arguments are ignored).
+        mmapMode (str): Mode to open the saved vectors with as memmaps when loading an index (e.g. 'r'). If None - \
+            they are read into memory.
+
+    Attributes:
+        numLists (int): Number of lists the vectors are split into.
+        metric (str): Distance between vectors.
+        numProbes (int): Default number of lists searched for each query.
+        centroids (np.array): Centroids of the lists. Shape [numLists x codeSize]. None until the index is trained.
+        numIndexed (int): Number of vectors added to the index.
+    """
+
+    def __init__(self, numLists=256, metric='euclidean', numProbes=8, addr=None, mmapMode=None):
+
+        if addr is not None:
+            with open(join(addr, 'index.json'), 'r') as f:
+                config = json.load(f)
+            numLists, metric, numProbes = config['numLists'], config['metric'], config['numProbes']
+
+        if metric not in ['euclidean', 'cosine']:
+            raise ValueError('unknown metric: %s. Use euclidean or cosine.' % metric)
+
+        self.numLists = numLists
+        self.metric = metric
+        self.numProbes = numProbes
+        self.centroids = None
+        self.numIndexed = 0
+        self._residuals = [[] for l in range(numLists)]
+        self._ids = [[] for l in range(numLists)]
+        self._sqNorms = [None] * numLists
+
+        if addr is not None:
+            self.centroids = np.load(join(addr, 'centroids.npy'))
+            residuals = np.load(join(addr, 'residuals.npy'), mmap_mode=mmapMode)
+            ids = np.load(join(addr, 'ids.npy'), mmap_mode=mmapMode)
+            offsets = np.load(join(addr, 'offsets.npy'))
+            for l in range(numLists):
+                if offsets[l+1] > offsets[l]:
+                    self._residuals[l].append(residuals[offsets[l]:offsets[l+1]])
+                    self._ids[l].append(ids[offsets[l]:offsets[l+1]])
+            self.numIndexed = int(offsets[-1])
+
+    def _prepare(self, codes):
+        """Copies codes as float32, and normalises them to unit length for the cosine metric."""
+        codes = np.array(codes, dtype=np.float32)
+        if self.metric == 'cosine':
+            norms = np.sqrt(np.sum(codes**2, axis=1, keepdims=True))
+            codes /= np.maximum(norms, np.finfo(np.float32).tiny)
+        return codes
+
+    def _nearest_lists(self, codes, numNearest=1):
+        """Indexes of the numNearest centroids nearest to each of some (prepared) codes."""
+        distances = np.sum(self.centroids**2, axis=1) - 2 * np.dot(codes, self.centroids.T)
+        if numNearest >= self.numLists:
+            return np.tile(np.arange(self.numLists), (len(codes), 1))
+        if numNearest == 1:
+            return np.argmin(distances, axis=1)[:, None]
+        return np.argpartition(distances, numNearest-1, axis=1)[:, :numNearest]
+
+    def train(self, codes, numIters=100, batchSize=10000, seed=None, centroids=None):
+        """ Learns the centroids of the lists with mini-batch k-means, from a sample of the latent vectors to be \
+            indexed. Random batches of codes are read at each iteration, so codes can be a large memmap.
+
+        Args:
+            codes (np.array): Latent vectors. Shape [numSamples x codeSize]. Needs at least numLists samples.
+            numIters (int): Number of mini-batch iterations.
+            batchSize (int): Number of codes in each mini-batch.
+            seed (int): Seed of the random sampling. If None - not seeded.
+            centroids (np.array): Initial centroids. Shape [numLists x codeSize]. If None - randomly sampled codes.
+        """
+
+        numSamples = np.shape(codes)[0]
+        if numSamples < self.numLists:
+            raise ValueError('at least numLists (%i) codes are needed to train the index.' % self.numLists)
+        rng = np.random.RandomState(seed)
+
+        if centroids is None:
+            centroids = codes[_sample_rows(numSamples, self.numLists, rng)]
+        self.centroids = self._prepare(centroids)
+        counts = np.zeros(self.numLists)
+        for i in range(numIters):
+            batch = self._prepare(codes[_sample_rows(numSamples, batchSize, rng)])
+            assigned = self._nearest_lists(batch)[:, 0]
+
+            # each centroid moves towards the mean of its batch codes, at a rate falling with the codes it has seen
+            order = np.argsort(assigned, kind='stable')
+            lists, starts, batchCounts = np.unique(assigned[order], return_index=True, return_counts=True)
+            batchMeans = np.add.reduceat(batch[order], starts, axis=0) / batchCounts[:, None]
+            counts[lists] += batchCounts
+            rates = (batchCounts / counts[lists])[:, None].astype(np.float32)
+            self.centroids[lists] += rates * (batchMeans - self.centroids[lists])
+            if self.metric == 'cosine':
+                self.centroids = self._prepare(self.centroids)
+
+    def add(self, codes, ids=None, chunkSize=100000):
+        """ Adds latent vectors to the index.
+
+        Args:
+            codes (np.array): Latent vectors. Shape [numSamples x codeSize]. Can be a memmap.
+            ids (np.array): Integer id of each vector, returned by *search* (e.g. the index of the pixel in the \
+                scene). Shape [numSamples]. If None - vectors are numbered in the order they are added to the index.
+            chunkSize (int): Number of vectors assigned to lists at a time.
+        """
+
+        if self.centroids is None:
+            raise Exception('the index must be trained before codes are added.')
+
+        numSamples = np.shape(codes)[0]
+        if ids is None:
+            ids = np.arange(self.numIndexed, self.numIndexed + numSamples)
+
+        for start in range(0, numSamples, chunkSize):
+            chunk = self._prepare(codes[start:start+chunkSize])
+            chunkIds = np.asarray(ids[start:start+chunkSize], dtype=np.int64)
+            assigned = self._nearest_lists(chunk)[:, 0]
+            order = np.argsort(assigned, kind='stable')
+            lists, starts = np.unique(assigned[order], return_index=True)
+            for l, listCodes, listIds in zip(lists, np.split(chunk[order], starts[1:]),
+                                             np.split(chunkIds[order], starts[1:])):
+                self._residuals[l].append(listCodes - self.centroids[l])
+                self._ids[l].append(listIds)
+                self._sqNorms[l] = None
+
+        self.numIndexed += numSamples
+
+    def add_samples(self, net, modelName, dataSamples, ids=None, batchSize=10000, applyPreProcessor=False):
+        """ Encodes data samples with a network, and adds their latent vectors to the index. The samples are encoded \
+            and added a batch at a time, so the latent vectors of a whole scene are never held in memory together.
+
+        Args:
+            net (obj): Autoencoder object with the model added (e.g. autoencoder.mlp_1D_network).
+            modelName (str): Name of the model to use (previously added with add_model() ).
+            dataSamples (np.array): Shape [numSamples x inputSize]. Can be a memmap.
+            ids (np.array): Integer id of each sample. Shape [numSamples]. If None - samples are numbered in the order \
+                they are added to the index.
+            batchSize (int): Number of samples encoded at a time.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+        """
+
+        if ids is None:
+            ids = np.arange(self.numIndexed, self.numIndexed + np.shape(dataSamples)[0])
+        start = 0
+        for batchZ in net.encoder(modelName, dataSamples, batchSize=batchSize, generator=True,
+                                  applyPreProcessor=applyPreProcessor):
+            self.add(batchZ, ids[start:start+len(batchZ)])
+            start += len(batchZ)
+
+    def _list(self, l):
+        """Residuals, squared norms of the residuals and ids of a list, merging any chunks added since it was last \
+            used."""
+        if len(self._residuals[l]) > 1:
+            self._residuals[l] = [np.concatenate(self._residuals[l])]
+            self._ids[l] = [np.concatenate(self._ids[l])]
+        if len(self._residuals[l]) == 0:
+            return None, None, None
+        if self._sqNorms[l] is None:
+            self._sqNorms[l] = np.sum(np.asarray(self._residuals[l][0], dtype=np.float32)**2, axis=1)
+        return self._residuals[l][0], self._sqNorms[l], self._ids[l][0]
+
+    def search(self, queries, k=10, numProbes=None, batchSize=1024):
+        """ Finds the approximate k nearest indexed vectors to each query.
+
+        Args:
+            queries (np.array): Latent vectors to search for. Shape [numQueries x codeSize].
+            k (int): Number of neighbours returned for each query.
+            numProbes (int): Number of lists searched for each query. If None - the default of the index is used.
+            batchSize (int): Number of queries searched at a time.
+
+        Returns:
+            (tuple): 2-element tuple containing:
+
+            - (*np.array*) - Distances to the neighbours, nearest first. Euclidean distance, or one minus the cosine \
+                similarity. Shape [numQueries x k]. Inf where fewer than k vectors were found.
+            - (*np.array*) - Ids of the neighbours. Shape [numQueries x k]. -1 where fewer than k vectors were found.
+        """
+
+        if self.centroids is None:
+            raise Exception('the index must be trained before it is searched.')
+        if numProbes is None:
+            numProbes = self.numProbes
+
+        queries = self._prepare(queries)
+        numQueries = len(queries)
+        distances = np.full((numQueries, k), np.inf, dtype=np.float32)
+        ids = np.full((numQueries, k), -1, dtype=np.int64)
+
+        for start in range(0, numQueries, batchSize):
+            batch = queries[start:start+batchSize]
+            batchDistances = distances[start:start+batchSize]
+            batchIds = ids[start:start+batchSize]
+
+            # group the queries by the lists they probe, so each list is compared with all its queries at once
+            probes = self._nearest_lists(batch, numProbes)
+            queryIdx = np.repeat(np.arange(len(batch)), probes.shape[1])
+            order = np.argsort(probes.ravel(), kind='stable')
+            lists, starts = np.unique(probes.ravel()[order], return_index=True)
+            for l, listQueries in zip(lists, np.split(queryIdx[order], starts[1:])):
+                residuals, sqNorms, listIds = self._list(l)
+                if residuals is None:
+                    continue
+                queryResiduals = batch[listQueries] - self.centroids[l]
+                querySqNorms = np.sum(queryResiduals**2, axis=1)
+                for blockStart in range(0, len(residuals), BLOCK_SIZE):
+                    block = slice(blockStart, blockStart + BLOCK_SIZE)
+                    blockDistances = sqNorms[block][None, :] + querySqNorms[:, None] - \
+                        2 * np.dot(queryResiduals, np.asarray(residuals[block], dtype=np.float32).T)
+                    _merge(batchDistances, batchIds, listQueries, blockDistances, listIds[block], k)
+
+            order = np.argsort(batchDistances, axis=1)
+            batchDistances[...] = np.take_along_axis(batchDistances, order, axis=1)
+            batchIds[...] = np.take_along_axis(batchIds, order, axis=1)
+
+        # squared euclidean distances between unit vectors are twice the cosine distance
+        found = np.isfinite(distances)
+        distances[found] = np.maximum(distances[found], 0)
+        if self.metric == 'euclidean':
+            distances[found] = np.sqrt(distances[found])
+        else:
+            distances[found] /= 2
+
+        return distances, ids
+
+    def save(self, addr):
+        """ Saves the index to a directory. The residuals are written list by list, so they can be loaded back as \
+            memmaps. The files are written to a temporary directory and then moved into place, so an index can be \
+            saved back to the directory it was memory-mapped from (e.g. after adding vectors to it).
+
+        Args:
+            addr (str): Address of the directory to save the index to. Created if it does not exist.
+        """
+
+        if not os.path.exists(addr):
+            os.makedirs(addr)
+        tempAddr = tempfile.mkdtemp(dir=addr)
+        try:
+            self._write(tempAddr)
+            # replacing a file leaves any memmaps of the old file (e.g. the lists of this index) unchanged
+            for name in os.listdir(tempAddr):
+                os.replace(join(tempAddr, name), join(addr, name))
+        finally:
+            shutil.rmtree(tempAddr, ignore_errors=True)
+
+    def _write(self, addr):
+        """Writes the files of the index to an (empty) directory."""
+
+        sizes = [sum(len(chunk) for chunk in self._ids[l]) for l in range(self.numLists)]
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        codeSize = self.centroids.shape[1] if self.centroids is not None else 0
+        residuals = np.lib.format.open_memmap(join(addr, 'residuals.npy'), mode='w+', dtype=np.float32,
+                                              shape=(int(offsets[-1]), codeSize))
+        ids = np.lib.format.open_memmap(join(addr, 'ids.npy'), mode='w+', dtype=np.int64, shape=(int(offsets[-1]),))
+        for l in range(self.numLists):
+            start = offsets[l]
+            for residualsChunk, idsChunk in zip(self._residuals[l], self._ids[l]):
+                residuals[start:start+len(idsChunk)] = residualsChunk
+                ids[start:start+len(idsChunk)] = idsChunk
+                start += len(idsChunk)
+        residuals.flush()
+        ids.flush()
+        del residuals, ids
+
+        np.save(join(addr, 'offsets.npy'), offsets)
+        if self.centroids is not None:
+            np.save(join(addr, 'centroids.npy'), self.centroids)
+        with open(join(addr, 'index.json'), 'w') as f:
+            json.dump({'numLists':self.numLists, 'metric':self.metric, 'numProbes':self.numProbes}, f)
+
+
+def _sample_rows(numSamples, size, rng):
+    """Sorted indexes of size distinct rows drawn at random, without making a permutation of all the rows."""
+    if size >= numSamples:
+        return np.arange(numSamples)
+    idx = np.unique(rng.randint(0, numSamples, size=size))
+    while len(idx) < size:
+        idx = np.unique(np.concatenate([idx, rng.randint(0, numSamples, size=size-len(idx))]))
+    return idx
+
+
+def _merge(bestDistances, bestIds, rows, distances, ids, k):
+    """Merges candidate distances (shape [len(rows) x numCandidates]) and their ids into the k best found so far for \
+        some rows of the results."""
+    if distances.shape[1] > k:
+        part = np.argpartition(distances, k-1, axis=1)[:, :k]
+        distances = np.take_along_axis(distances, part, axis=1)
+        ids = ids[part]
+    else:
+        ids = np.broadcast_to(ids, distances.shape)
+    allDistances = np.concatenate([bestDistances[rows], distances], axis=1)
+    allIds = np.concatenate([bestIds[rows], ids], axis=1)
+    part = np.argpartition(allDistances, k-1, axis=1)[:, :k]
+    bestDistances[rows] = np.take_along_axis(allDistances, part, axis=1)
+    bestIds[rows] = np.take_along_axis(allIds, part, axis=1)
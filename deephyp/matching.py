@@ -0,0 +1,130 @@
+'''
+    Description: matching hyperspectral pixels against a spectral library by spectral angle. Pixels and library are \
+    compared in blocks with matrix multiplications, so the full pixel x library matrix is never held in memory.
+
+    - File name: matching.py
+    - Author: deephyp contributors
+    - Date created: October 2026
+    - Python package: deephyp
+
+'''
+
+import numpy as np
+from deephyp import data
+
+
+class SpectralMatcher():
+    """ Class for finding the spectra in a library (e.g. of endmembers) most similar to each pixel of a scene. \
+        Similarity is measured as in the reconstruction losses of the networks (see \
+        network_ops.loss_function_reconstruction_1D): 'SA' is the spectral angle and 'CSA' is one minus its cosine. \
+        The library is normalised once. Each block of pixels is normalised and compared with blocks of the library \
+        through a matrix multiplication, keeping only the best k matches seen so far, and blocks of pixels are \
+        processed across a pool of threads.
+
+    Args:
+        library (np.array): Library spectra. Shape [numSpectra x numBands]. Must have the same bands as the pixels.
+        metric (str): Measure of dissimilarity. Current options: ['SA', 'CSA'].
+        blockSize (int): Number of pixels compared at a time (by each thread).
+        libraryBlockSize (int): Number of library spectra compared at a time. The scratch memory used by each \
+            thread is blockSize x libraryBlockSize floats.
+        numThreads (int): Number of threads processing blocks of pixels. If None - set to the number of CPUs.
+
+    Attributes:
+        library (np.array): Normalised library spectra, transposed. Shape [numBands x numSpectra].
+        numSpectra (int): Number of library spectra.
+        metric (str): Measure of dissimilarity.
+        blockSize (int): Number of pixels compared at a time.
+        libraryBlockSize (int): Number of library spectra compared at a time.
+        numThreads (int): Number of threads processing blocks of pixels.
+    """
+
+    def __init__(self, library, metric='SA', blockSize=1024, libraryBlockSize=4096, numThreads=None):
+
+        if metric not in ['SA', 'CSA']:
+            raise ValueError('unknown metric: %s. Use SA or CSA.' % metric)
+
+        self.library = np.ascontiguousarray(_normalise(library).T)
+        self.numSpectra = self.library.shape[1]
+        self.metric = metric
+        self.blockSize = blockSize
+        self.libraryBlockSize = libraryBlockSize
+        self.numThreads = numThreads
+
+    def match(self, spectra, k=1, maxScore=None, out=None):
+        """ Finds the k library spectra most similar to each pixel.
+
+        Args:
+            spectra (np.array): Pixels with shape [numSamples x numBands] or [numRows x numCols x numBands] (e.g. \
+                the spectra or spectraCube of a data.HypImg). Can be a memmap, read a block at a time.
+            k (int): Number of matches returned for each pixel.
+            maxScore (float): Matches with a higher score (e.g. a spectral angle above a threshold) are discarded, \
+                and given an index of -1. If None - all matches are kept.
+            out (tuple): 2-element tuple of arrays (e.g. memmaps) to write the scores and indexes into. Shapes as \
+                returned. If None - new arrays are made.
+
+        Returns:
+            (tuple): 2-element tuple containing:
+
+            - (*np.array*) - Scores of the matches, best first. Spectral angles in radians for 'SA', or one minus \
+                their cosine for 'CSA'. Shape [numSamples x k] or [numRows x numCols x k].
+            - (*np.array*) - Indexes of the matched library spectra. Shape [numSamples x k] or \
+                [numRows x numCols x k].
+        """
+
+        k = min(k, self.numSpectra)
+        shape = np.shape(spectra)
+        spectra = np.reshape(spectra, (-1, shape[-1]))
+        numSamples = spectra.shape[0]
+        if out is None:
+            out = (np.empty((numSamples, k), dtype=np.float32),
+                   np.empty((numSamples, k), dtype=data._compact_int_dtype(-1, self.numSpectra)))
+        scores = np.reshape(out[0], (numSamples, k))
+        indexes = np.reshape(out[1], (numSamples, k))
+
+        def match_block(start):
+            block = _normalise(spectra[start:start+self.blockSize])
+            bestSimilarities = np.full((len(block), k), -np.inf, dtype=np.float32)
+            bestIndexes = np.zeros((len(block), k), dtype=np.int64)
+            for libraryStart in range(0, self.numSpectra, self.libraryBlockSize):
+                similarities = np.dot(block, self.library[:, libraryStart:libraryStart+self.libraryBlockSize])
+                candidates = np.arange(libraryStart, libraryStart + similarities.shape[1])
+                if similarities.shape[1] > k:
+                    part = np.argpartition(-similarities, k-1, axis=1)[:, :k]
+                    similarities = np.take_along_axis(similarities, part, axis=1)
+                    candidates = candidates[part]
+                else:
+                    candidates = np.broadcast_to(candidates, similarities.shape)
+                allSimilarities = np.concatenate([bestSimilarities, similarities], axis=1)
+                allIndexes = np.concatenate([bestIndexes, candidates], axis=1)
+                part = np.argpartition(-allSimilarities, k-1, axis=1)[:, :k]
+                bestSimilarities = np.take_along_axis(allSimilarities, part, axis=1)
+                bestIndexes = np.take_along_axis(allIndexes, part, axis=1)
+
+            order = np.argsort(-bestSimilarities, axis=1)
+            bestSimilarities = np.clip(np.take_along_axis(bestSimilarities, order, axis=1), -1, 1)
+            bestIndexes = np.take_along_axis(bestIndexes, order, axis=1)
+            if self.metric == 'SA':
+                blockScores = np.arccos(bestSimilarities)
+            else:
+                blockScores = 1 - bestSimilarities
+            if maxScore is not None:
+                bestIndexes[blockScores > maxScore] = -1
+            scores[start:start+len(block)] = blockScores
+            indexes[start:start+len(block)] = bestIndexes
+
+        data._map_chunks(match_block, numSamples, self.blockSize, self.numThreads)
+
+        for arr in out:
+            if isinstance(arr, np.memmap):
+                arr.flush()
+
+        return np.reshape(scores, shape[:-1] + (k,)), np.reshape(indexes, shape[:-1] + (k,))
+
+
+def _normalise(spectra):
+    """Copies spectra as float32, scaled to unit length. Spectra of all zeros are left as zeros."""
+    spectra = np.array(spectra, dtype=np.float32)
+    norms = np.sqrt(np.einsum('ij,ij->i', spectra, spectra))[:, np.newaxis]
+    norms[norms == 0] = 1
+    spectra /= norms
+    return spectra
@@ -14,6 +14,9 @@ import math
 import numpy as np
 from os.path import join, exists, basename, split
 import json
+import time
+from collections import OrderedDict
+from deephyp import data
 
 def create_variable(shape,method='gaussian',wd=False):
     """ Setup a trainable variable (collection of parameters) of a particular shape.
@@ -177,7 +180,7 @@ def train_step(loss, learning_rate=1e-3, decay_steps=None, decay_rate=None, piec
     return train_op
 
 
-def loss_function_reconstruction_1D(y_reconstructed,y_target,func='SSE'):
+def loss_function_reconstruction_1D(y_reconstructed,y_target,func='SSE',sample_weights=None):
     """ Reconstruction loss function op, comparing 1D tensors for network reconstruction and target.
 
     Args:
@@ -185,39 +188,46 @@ def loss_function_reconstruction_1D(y_reconstructed,y_target,func='SSE'):
         y_target (tensor): What the network is trying to reconstruct (1D vector). Shape [numSamples x inputSize].
         func (string): The name of the loss function to be used. 'SSE'-sum of square errors,'CSA'-cosine spectral angle, \
             'SA'-spectral angle, 'SID'-spectral information divergence.
+        sample_weights (tensor): Weight of the loss of each sample (e.g. the number of duplicates it represents). \
+            Shape [numSamples]. If None - each sample has a weight of 1.
 
     Returns:
         (tensor): Reconstruction loss.
     """
     if func == 'SSE':
         # sum of squared errors loss
-        loss = tf.reduce_sum( tf.square(y_target - y_reconstructed) )
+        sample_loss = tf.reduce_sum( tf.square(y_target - y_reconstructed), axis=1 )
 
     elif func == 'CSA':
         # cosine of spectral angle loss
         normalize_r = tf.math.l2_normalize(tf.transpose(y_reconstructed),axis=0)
         normalize_t = tf.math.l2_normalize(tf.transpose(y_target),axis=0)
-        loss = tf.reduce_sum( 1 - tf.reduce_sum(tf.multiply(normalize_r, normalize_t),axis=0 ) )
+        sample_loss = 1 - tf.reduce_sum(tf.multiply(normalize_r, normalize_t),axis=0 )
 
     elif func == 'SA':
         # spectral angle loss
         normalize_r = tf.math.l2_normalize(tf.transpose(y_reconstructed),axis=0)
         normalize_t = tf.math.l2_normalize(tf.transpose(y_target),axis=0)
-        loss = tf.reduce_sum( tf.math.acos(tf.reduce_sum(tf.multiply(normalize_r, normalize_t),axis=0 ) ) )
+        sample_loss = tf.math.acos(tf.reduce_sum(tf.multiply(normalize_r, normalize_t),axis=0 ) )
 
     elif func == 'SID':
         # spectral information divergence loss
         t = tf.divide( tf.transpose(y_target) , tf.reduce_sum(tf.transpose(y_target),axis=0) )
         r = tf.divide( tf.transpose(y_reconstructed) , tf.reduce_sum(tf.transpose(y_reconstructed),axis=0) )
-        loss = tf.reduce_sum( tf.reduce_sum( tf.multiply(t,tf.log(tf.divide(t,r))) , axis=0)
-                              + tf.reduce_sum( tf.multiply(r,tf.log(tf.divide(r,t))) , axis=0) )
+        sample_loss = tf.reduce_sum( tf.multiply(t,tf.log(tf.divide(t,r))) , axis=0) \
+                      + tf.reduce_sum( tf.multiply(r,tf.log(tf.divide(r,t))) , axis=0)
     else:
         raise ValueError('unknown loss function: %s. Use SSE, CSA, SA or SID.' % func)
 
+    # the loss is summed over the samples, so a sample with weight n counts as n duplicates of it
+    if sample_weights is not None:
+        sample_loss = tf.multiply( sample_loss, sample_weights )
+    loss = tf.reduce_sum( sample_loss )
+
     return loss
 
 
-def loss_function_crossentropy_1D( y_pred, y_target, class_weights=None, num_classes=None):
+def loss_function_crossentropy_1D( y_pred, y_target, class_weights=None, num_classes=None, sample_weights=None):
     """ Cross entropy loss function op, comparing 1D tensors for network prediction and target. Weights the classes \
         when calculating the loss to balance un-even training batches. If class weights are not provided, then no \
         weighting is done (weight of 1 assigned to each class).
@@ -227,6 +237,8 @@ def loss_function_crossentropy_1D( y_pred, y_target, class_weights=None, num_cla
         y_target (tensor): One-hot classification labels (1D vector). Shape [numSamples x numClasses].
         class_weights (tensor): Weight for each class. Shape [numClasses].
         num_classes (int):
+        sample_weights (tensor): Weight of each sample (e.g. the number of duplicates it represents), multiplying its \
+            class weight. Shape [numSamples]. If None - each sample has a weight of 1.
 
     Returns:
         (tensor): Cross-entropy loss.
@@ -235,9 +247,16 @@ def loss_function_crossentropy_1D( y_pred, y_target, class_weights=None, num_cla
     if class_weights==None:
         class_weights = tf.constant(1,shape=[num_classes],dtype=tf.dtypes.float32)
 
-    sample_weights = tf.reduce_sum( tf.multiply(y_target, class_weights ), axis=1) # weight of each sample
-    loss = tf.reduce_mean( tf.losses.softmax_cross_entropy(
-        onehot_labels=y_target,logits=y_pred,weights=sample_weights ) )
+    weights = tf.reduce_sum( tf.multiply(y_target, class_weights ), axis=1) # weight of each sample
+    if sample_weights is None:
+        loss = tf.reduce_mean( tf.losses.softmax_cross_entropy(
+            onehot_labels=y_target,logits=y_pred,weights=weights ) )
+    else:
+        # a sample with weight w counts as w samples in the mean (over samples with a non-zero class weight)
+        sample_loss = tf.losses.softmax_cross_entropy( onehot_labels=y_target, logits=y_pred,
+            weights=tf.multiply( weights, sample_weights ), reduction=tf.losses.Reduction.NONE )
+        count = tf.reduce_sum( tf.multiply( sample_weights, tf.cast( tf.not_equal(weights, 0), tf.float32 ) ) )
+        loss = tf.reduce_sum( sample_loss ) / tf.maximum( count, 1e-12 )
 
     return loss
 
@@ -254,18 +273,22 @@ def loss_weight_decay(wdLambda):
 
     return tf.multiply( wdLambda , tf.reduce_sum(tf.get_collection('wd')) )
 
-def balance_classes(y_target,num_classes):
+def balance_classes(y_target,num_classes,sample_weights=None):
     """ Calculates the class weights needed to balance the classes, based on the number of samples of each class in the \
         batch of data.
 
     Args:
         y_target (tensor): One-hot classification labels (1D vector). Shape [numSamples x numClasses]
         num_classes (int):
+        sample_weights (tensor): Weight of each sample, counting it as that many samples of its class. \
+            Shape [numSamples]. If None - each sample counts once.
 
     Returns:
         (tensor): A weighting for each class that balances their contribution to the loss. Shape [numClasses].
     """
     y_target = tf.reshape( y_target, [-1, num_classes] )
+    if sample_weights is not None:
+        y_target = tf.multiply( y_target, tf.expand_dims( sample_weights, 1 ) )
     class_count = tf.add( tf.reduce_sum( y_target, axis=0 ), tf.constant( [1]*num_classes, dtype=tf.float32 ) )
     class_weights = tf.multiply( tf.divide( tf.ones( ( 1, num_classes) ), class_count ), tf.reduce_max( class_count ) )
 
@@ -288,25 +311,134 @@ def save_model(addr,sess,saver,current_epoch,epochs_to_save):
         saver.save(sess, join(addr,"epoch_%i"%(current_epoch),"model.ckpt"))
 
 
-def load_model(addr,sess):
+def load_model(addr,sess,saver=None):
     """Loads a model from the address of a checkpoint.
 
     Args:
         addr (str): Address of a directory to save checkpoint for current epoch.
         sess (obj): Tensor flow session object.
+        saver (obj): Tensor flow save object to restore the variables it holds with. If None - all variables are \
+            initialised and then restored with a new save object.
 
     """
-    sess.run(tf.global_variables_initializer())
-    saver = tf.train.Saver()
+    if saver is None:
+        sess.run(tf.global_variables_initializer())
+        saver = tf.train.Saver()
     saver.restore(sess, join(addr, 'model.ckpt'))
 
 
-def save_config(net_obj,addr):
-    """Saves a network config file. Saves the variables listed in net_config within the network object.
+def network_variables(net_obj):
+    """Lists the variables holding the parameters of a network (i.e. those needed to use a trained model, excluding \
+        variables added by train ops).
+
+    Args:
+        net_obj (obj): Network object.
+
+    Returns:
+        (list): Tensor flow variables of the network weights and biases.
+    """
+    params = [net_obj.weights[key] for key in sorted(net_obj.weights)] + \
+             [net_obj.biases[key] for key in sorted(net_obj.biases)]
+    variables = []
+    for param in params:
+        # tied weights are either transposes (not variables) or the same variable as the encoder weights
+        if isinstance(param, tf.Variable) and not any(param is variable for variable in variables):
+            variables.append(param)
+    return variables
+
+
+class SessionCache():
+    """ Least-recently-used cache of tensor flow sessions that each hold a loaded model, so that a model is restored \
+        from its checkpoint once and then reused for every call that uses it. When more than maxSessions models are \
+        loaded, the session of the least-recently-used model is closed.
+
+    Args:
+        maxSessions (int): Maximum number of sessions (i.e. loaded models) to keep open.
+        graph (obj): Tensor flow graph the network is built in. If None - the default graph.
+
+    Attributes:
+        maxSessions (int): Maximum number of sessions (i.e. loaded models) to keep open.
+        graph (obj): Tensor flow graph the network is built in.
+        sessions (OrderedDict): Open sessions keyed by model name, from least to most recently used.
+    """
+
+    def __init__(self, maxSessions=4, graph=None):
+        self.maxSessions = maxSessions
+        if graph is None:
+            graph = tf.get_default_graph()
+        self.graph = graph
+        self.sessions = OrderedDict()
+        self.saver = None
+
+    def get(self, modelName, addr, var_list=None):
+        """ Returns the session holding a model, loading the model into a new session if it is not already open.
+
+        Args:
+            modelName (str): Name of the model.
+            addr (str): Address of the directory containing the checkpoint files.
+            var_list (list): Variables to restore from the checkpoint. If None - all variables.
+
+        Returns:
+            (obj): Tensor flow session object.
+        """
+        if modelName in self.sessions:
+            # move to the most recently used position
+            sess = self.sessions.pop(modelName)
+            self.sessions[modelName] = sess
+            return sess
+
+        with self.graph.as_default():
+            if self.saver is None:
+                self.saver = tf.train.Saver(var_list=var_list)
+            sess = tf.Session(graph=self.graph)
+            try:
+                load_model(addr, sess, self.saver)
+            except:
+                sess.close()
+                raise
+        self.sessions[modelName] = sess
+
+        while len(self.sessions) > self.maxSessions:
+            _, oldest = self.sessions.popitem(last=False)
+            oldest.close()
+
+        return sess
+
+    def close(self, modelName=None):
+        """ Closes the session of a model.
+
+        Args:
+            modelName (str): Name of the model. If None - closes all sessions.
+        """
+        if modelName is None:
+            for sess in self.sessions.values():
+                sess.close()
+            self.sessions.clear()
+        elif modelName in self.sessions:
+            self.sessions.pop(modelName).close()
+
+
+def get_session(net_obj, modelName):
+    """Returns a session holding a model added to a network, from the network's session cache.
+
+    Args:
+        net_obj (obj): Network object.
+        modelName (str): Name of the model (previously added with add_model() ).
+
+    Returns:
+        (obj): Tensor flow session object.
+    """
+    return net_obj.sessions.get(modelName, net_obj.modelsAddrs[modelName], network_variables(net_obj))
+
+
+def save_config(net_obj,addr,preProcessor=None):
+    """Saves a network config file. Saves the variables listed in net_config within the network object. If a \
+        preProcessor is given, it is saved to a preprocess.json file in the same directory.
 
     Args:
         net_obj (obj): Network object.
         addr (obj): Directory of where to store the config.json file.
+        preProcessor (obj): PreProcessor the model is trained with, or None.
 
     """
 
@@ -317,6 +449,10 @@ def save_config(net_obj,addr):
     with open(join(addr,'config.json'), 'w') as outfile:
         json.dump(data, outfile)
 
+    # save the pre-processing the network is trained with, so that it can be applied at inference
+    if preProcessor is not None:
+        preProcessor.save(join(addr,'preprocess.json'))
+
 def load_config(net_obj,addr):
     """Loads a network config file. Loads from variables in the config.json file and overwrites variables in network \
         object. Applies to variables in the net_config list in the network object.
@@ -335,8 +471,406 @@ def load_config(net_obj,addr):
 
 
 
+def load_preprocessor(addr):
+    """Loads the pre-processing saved with a model, if there is one. Looks for a preprocess.json file in the \
+        directory of the checkpoint and in the directory above it (where the config.json file is saved).
+
+    Args:
+        addr (str): Address of the directory containing the checkpoint files.
+
+    Returns:
+        (obj): PreProcessor object, or None if the model was not saved with one.
+    """
+    for directory in [addr, split(addr.rstrip('/\\'))[0]]:
+        if exists(join(directory,'preprocess.json')):
+            return data.PreProcessor(configFile=join(directory,'preprocess.json'))
+    return None
+
+
+def model_preprocessor(net_obj, modelName, applyPreProcessor):
+    """The pre-processing saved with a model if it is to be applied to the data samples input into the model (and \
+        the model has one), else None. Every inference function (of the networks, runtime.NumpyModel, \
+        frozen.FrozenModel, parallel.ParallelModel, scene.SceneProcessor and index.LatentIndex) takes data that is \
+        already pre-processed (e.g. hypData.spectraPrep) by default, and only applies the saved pre-processor when \
+        called with applyPreProcessor=True, for raw spectra (e.g. hypData.spectra).
+
+    Args:
+        net_obj (obj): Network object.
+        modelName (str): Name of the model (previously added with add_model() ).
+        applyPreProcessor (boolean): Whether the data samples are raw spectra, to be pre-processed by the model's \
+            saved pre-processor. If False - the data samples must already be pre-processed.
+
+    Returns:
+        (obj): PreProcessor object, or None.
+    """
+    if not applyPreProcessor:
+        return None
+    return net_obj.modelsPreProcessors.get(modelName)
+
+
+def export_numpy(net_obj, modelName, addr):
+    """Exports a model to a single .npz file, holding the trained parameters, the network config and the \
+        pre-processing saved with the model. The file can be loaded by runtime.NumpyModel to use the model without \
+        tensor flow. Tied weights are not duplicated in the file.
+
+    Args:
+        net_obj (obj): Network object.
+        modelName (str): Name of the model (previously added with add_model() ).
+        addr (str): Address of the .npz file.
+    """
+    sess = get_session(net_obj, modelName)
+
+    params = {}
+    variables = network_variables(net_obj)
+    for group, groupParams in [('weights', net_obj.weights), ('biases', net_obj.biases)]:
+        # decoder parameters last, so that tied weights are the ones left out
+        for key in sorted(groupParams, key=lambda key: key.startswith('decoder')):
+            param = groupParams[key]
+            if any(param is variable for variable in variables):
+                params['%s/%s' % (group, key)] = param
+                variables = [variable for variable in variables if variable is not param]
+    arrays = sess.run(params)
+
+    config = {'network': '%s.%s' % (type(net_obj).__module__.split('.')[-1], type(net_obj).__name__)}
+    for config_parameter in net_obj.net_config:
+        config[config_parameter] = getattr(net_obj, config_parameter)
+    arrays['config'] = np.array(json.dumps(config))
+
+    preProcessor = net_obj.modelsPreProcessors.get(modelName)
+    if preProcessor is not None:
+        arrays['preprocess'] = np.array(json.dumps(preProcessor.get_config()))
+
+    np.savez(addr, **arrays)
+
+
+def network_outputs(net_obj):
+    """Lists the tensors a network can output at inference, by name: the input 'x', the latent vectors 'z' and \
+        reconstruction 'y_recon' of autoencoders, the class scores 'y_pred', softmax scores 'y_scores' and labels \
+        'y_labels' of classifiers, and the activations of each layer ('a1', 'a2', ...).
+
+    Args:
+        net_obj (obj): Network object.
+
+    Returns:
+        (dict): Tensors keyed by name.
+    """
+    outputs = {}
+    for name in ['x', 'z', 'y_recon', 'y_pred', 'y_scores', 'y_labels']:
+        if hasattr(net_obj, name):
+            outputs[name] = getattr(net_obj, name)
+    for key in net_obj.a:
+        if key != 'a0':
+            outputs[key] = net_obj.a[key]
+    return outputs
+
+
+def freeze_graph(net_obj, modelName):
+    """Makes a frozen inference graph of a model. The variables are converted to constants and everything not \
+        needed to compute the network outputs (e.g. train ops, optimiser slots and input pipelines) is removed.
+
+    Args:
+        net_obj (obj): Network object.
+        modelName (str): Name of the model (previously added with add_model() ).
+
+    Returns:
+        (tuple): 2-element tuple containing:
+
+        - (*obj*) - Frozen tensor flow GraphDef.
+        - (*dict*) - Names of the output tensors in the GraphDef, keyed as in *network_outputs*.
+    """
+    sess = get_session(net_obj, modelName)
+    outputs = network_outputs(net_obj)
+
+    graph_def = sess.graph.as_graph_def()
+    for node in graph_def.node:
+        # networks fed by a tf.data pipeline are fed by a placeholder instead
+        if (node.name == outputs['x'].op.name) & (node.op == 'PlaceholderWithDefault'):
+            node.op = 'Placeholder'
+            del node.input[:]
+    frozen_graph_def = tf.graph_util.convert_variables_to_constants(
+        sess, graph_def, [outputs[name].op.name for name in sorted(outputs)])
+
+    return frozen_graph_def, dict((name, outputs[name].name) for name in outputs)
+
+
+def export_frozen(net_obj, modelName, addr):
+    """Exports a model as a frozen inference graph. The variables are converted to constants and everything not \
+        needed to compute the network outputs (e.g. train ops, optimiser slots and input pipelines) is removed. \
+        Saves a frozen_model.pb file with the graph, a frozen_model.json file with the names of the output tensors \
+        (see *network_outputs*) and the network config, and the pre-processing saved with the model. The model can \
+        be loaded with frozen.FrozenModel.
+
+    Args:
+        net_obj (obj): Network object.
+        modelName (str): Name of the model (previously added with add_model() ).
+        addr (str): Directory to save the files in.
+    """
+    frozen_graph_def, outputNames = freeze_graph(net_obj, modelName)
+
+    with tf.gfile.GFile(join(addr, 'frozen_model.pb'), 'wb') as outfile:
+        outfile.write(frozen_graph_def.SerializeToString())
+
+    config = {'network': '%s.%s' % (type(net_obj).__module__.split('.')[-1], type(net_obj).__name__),
+              'outputs': outputNames}
+    for config_parameter in net_obj.net_config:
+        config[config_parameter] = getattr(net_obj, config_parameter)
+    with open(join(addr, 'frozen_model.json'), 'w') as outfile:
+        json.dump(config, outfile)
+
+    preProcessor = net_obj.modelsPreProcessors.get(modelName)
+    if preProcessor is not None:
+        preProcessor.save(join(addr, 'preprocess.json'))
+
+
+def run_batched(sess, fetch, feedTensor, dataSamples, batchSize=None, out=None, generator=False, preProcessor=None):
+    """Runs a tensor (or a dictionary of tensors) over some data samples in batches, so that the memory used by \
+        intermediate activations depends on the batch size rather than on the number of samples.
+
+    Args:
+        sess (obj): Tensor flow session object.
+        fetch (tensor or dict): Tensor to compute for the data samples, or a dictionary of tensors to compute in the \
+            same run.
+        feedTensor (tensor): Tensor (e.g. placeholder) the data samples are fed into.
+        dataSamples (np.array): Shape [numSamples x inputSize]. Can be a memmap.
+        batchSize (int): Number of samples to run at a time. If None - all samples are run at once.
+        out (np.array or dict): Array to write the results into (e.g. a memmap). Shape [numSamples x outputSize]. \
+            If fetch is a dictionary, a dictionary of arrays for some (or none) of its keys. If None - new arrays are \
+            returned.
+        generator (boolean): If True - returns a generator of the results of each batch, instead of an array.
+        preProcessor (obj): PreProcessor applied to each batch before it is fed. If None - batches are fed \
+            unchanged.
+
+    Returns:
+        (np.array, dict or generator): Results for all data samples (a dictionary of them if fetch is a \
+            dictionary), or a generator of results per batch.
+    """
+    numSamples = np.shape(dataSamples)[0]
+    if batchSize is None:
+        batchSize = max(numSamples, 1)
+
+    isDict = isinstance(fetch, dict)
+    if not isDict:
+        fetch = {None: fetch}
+        out = {None: out}
+    out = dict(out or {})
+
+    def run_batches():
+        for start in range(0, numSamples, batchSize):
+            batch = dataSamples[start:start+batchSize]
+            if preProcessor is not None:
+                batch = preProcessor.transform(batch)
+            yield start, sess.run(fetch, feed_dict={feedTensor: batch})
+
+    if generator:
+        return (result if isDict else result[None] for _, result in run_batches())
+
+    for start, result in run_batches():
+        for key in result:
+            if out.get(key) is None:
+                out[key] = np.empty((numSamples,) + result[key].shape[1:], dtype=result[key].dtype)
+            out[key][start:start+len(result[key])] = result[key]
+
+    for key in fetch:
+        if out.get(key) is None:
+            # no samples - run once to get the output shape
+            out[key] = sess.run(fetch[key], feed_dict={feedTensor: dataSamples})
+        elif isinstance(out[key], np.memmap):
+            out[key].flush()
+
+    if isDict:
+        return out
+    return out[None]
+
+
+def create_pipeline(inputSize, targetSize):
+    """ Sets up a reinitialisable tf.data iterator to feed a network directly, instead of through feed dicts. The \
+        iterator can be initialised with the training or validation dataset made by *create_dataset*.
+
+    Args:
+        inputSize (int): Number of dimensions of input data (i.e. number of spectral bands).
+        targetSize (int): Number of dimensions of the targets (i.e. inputSize for autoencoders, numClasses for \
+            classifiers).
+
+    Returns:
+        (dict): The 'iterator', the batches of inputs 'x', targets 'y_target' and sample weights 'weights' it \
+            produces, and the 'datasets' made for it by *create_dataset*.
+    """
+    iterator = tf.data.Iterator.from_structure((tf.float32, tf.float32, tf.float32),
+                                               (tf.TensorShape([None, inputSize]), tf.TensorShape([None, targetSize]),
+                                                tf.TensorShape([None])))
+    x, y_target, weights = iterator.get_next()
+
+    return {'iterator': iterator, 'x': x, 'y_target': y_target, 'weights': weights, 'datasets': {}}
+
+
+def input_placeholders(inputSize, targetSize, usePipeline=False):
+    """ Sets up the input and target placeholders of a network. If using a tf.data pipeline, the placeholders default \
+        to the batches produced by the pipeline, but can still be fed (e.g. to use a trained model).
+
+    Args:
+        inputSize (int): Number of dimensions of input data (i.e. number of spectral bands).
+        targetSize (int): Number of dimensions of the targets.
+        usePipeline (boolean): Whether to feed the network with a tf.data pipeline (see *create_pipeline*).
+
+    Returns:
+        (tuple): 3-element tuple containing the input placeholder, target placeholder and the pipeline (or None).
+    """
+    if usePipeline:
+        pipeline = create_pipeline(inputSize, targetSize)
+        x = tf.placeholder_with_default(pipeline['x'], [None, inputSize])
+        y_target = tf.placeholder_with_default(pipeline['y_target'], [None, targetSize])
+    else:
+        pipeline = None
+        x = tf.placeholder("float", [None, inputSize])
+        y_target = tf.placeholder("float", [None, targetSize])
+
+    return x, y_target, pipeline
+
+
+def sample_weights_placeholder(x, pipeline=None):
+    """ Sets up the placeholder for the weight of each sample in the loss. It defaults to the weights produced by \
+        the pipeline if there is one, else to a weight of 1 for each sample of x, so it only needs feeding when \
+        training with weighted samples.
+
+    Args:
+        x (tensor): Input placeholder of the network. Shape [numSamples x inputSize].
+        pipeline (dict): Pipeline feeding the network (see *create_pipeline*), or None.
+
+    Returns:
+        (tensor): Sample weights placeholder. Shape [numSamples].
+    """
+    if pipeline is not None:
+        return tf.placeholder_with_default(pipeline['weights'], [None])
+    return tf.placeholder_with_default(tf.ones([tf.shape(x)[0]]), [None])
+
+
+def create_dataset(net_obj, name, dataIter, prefetch=2, chunkSize=10000):
+    """ Makes a tf.data dataset of batches for a pipeline made by *create_pipeline*, and the op that initialises the \
+        pipeline with it. These are added to the graph once per network for each name (e.g. 'train' and 'val') and \
+        kind of data, and reused by later calls. Data in memory is loaded into the session once by *load_dataset*, \
+        and each epoch the pipeline is initialised with only the current index permutation of the Iterator, so \
+        batches are gathered from the data by tensorflow without it being copied or reordered. Memory-mapped data is \
+        read from disk chunkSize samples at a time by a generator, in the current order of the Iterator. Batches are \
+        prefetched in the background. The sample weights of the Iterator (or weights of 1) are included in each batch.
+
+    Args:
+        net_obj (obj): Network object, fed by a pipeline.
+        name (str): Name of the dataset (e.g. 'train' or 'val').
+        dataIter (obj): Iterator object. If its targets are class labels (numClasses is set), they are one-hot \
+            encoded in the pipeline (labels <= 0 become a one-hot vector of all zeros).
+        prefetch (int): Number of batches to prefetch.
+        chunkSize (int): Number of samples read at a time from memory-mapped data.
+
+    Returns:
+        (dict): The pipeline initialiser op 'init', the placeholders it is fed ('idx' for the index permutation and \
+            'batchSize'), and the variables the data is loaded into ('variables', for data in memory).
+    """
+    numClasses = dataIter.numClasses
+    autoencoding = dataIter.targets is dataIter.dataSamples
+    memmap = isinstance(dataIter.dataSamples, np.memmap) or isinstance(dataIter.targets, np.memmap)
+    weighted = dataIter.loss_weights() is not None
+    key = (name, memmap, autoencoding, numClasses, weighted)
+    datasets = net_obj.pipeline['datasets']
+    if key in datasets:
+        return datasets[key]
+
+    inputSize = np.shape(dataIter.dataSamples)[1]
+    if numClasses is not None:
+        targetShape = [None]
+        targetType = tf.int32
+    else:
+        targetShape = [None] + list(np.shape(dataIter.targets)[1:])
+        targetType = tf.float32
+
+    source = {'idx': tf.placeholder(tf.int64, [None]), 'batchSize': tf.placeholder(tf.int64, []),
+              'variables': {}, 'dataIter': None}
+
+    if memmap:
+        def read_chunks():
+            # the Iterator last loaded by load_dataset, in its current order
+            chunkIter = source['dataIter']
+            weights = chunkIter.loss_weights()
+            for start in range(0, chunkIter.numSamples, chunkSize):
+                idx = chunkIter.permutation[start:start+chunkSize]
+                chunk_x = np.take(chunkIter.dataSamples, idx, axis=0)
+                if weights is None:
+                    chunk_w = np.ones(len(idx), dtype=np.float32)
+                else:
+                    chunk_w = np.take(weights, idx, axis=0)
+                if autoencoding:
+                    yield chunk_x, chunk_x, chunk_w
+                else:
+                    yield chunk_x, np.reshape(np.take(chunkIter.targets, idx, axis=0), [len(idx)] + targetShape[1:]), \
+                          chunk_w
+
+        dataset = tf.data.Dataset.from_generator(read_chunks, (tf.float32, targetType, tf.float32),
+                                                 (tf.TensorShape([None, inputSize]), tf.TensorShape(targetShape),
+                                                  tf.TensorShape([None])))
+        dataset = dataset.flat_map(lambda x, y, w: tf.data.Dataset.from_tensor_slices((x, y, w)))
+        dataset = dataset.batch(source['batchSize'])
+    else:
+        # the data is held in local variables (not saved with the model), loaded once per session by load_dataset
+        def data_variable(dtype, shape):
+            placeholder = tf.placeholder(dtype, shape)
+            variable = tf.Variable(placeholder, trainable=False, collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                                   validate_shape=False)
+            return placeholder, variable
+
+        source['variables']['data'] = data_variable(tf.float32, [None, inputSize])
+        if not autoencoding:
+            source['variables']['targets'] = data_variable(targetType, targetShape)
+        if weighted:
+            source['variables']['weights'] = data_variable(tf.float32, [None])
+
+        def gather_batch(idx):
+            x = tf.gather(source['variables']['data'][1], idx)
+            x.set_shape([None, inputSize])
+            if autoencoding:
+                y = x
+            else:
+                y = tf.gather(source['variables']['targets'][1], idx)
+                y.set_shape(targetShape)
+            if weighted:
+                w = tf.gather(source['variables']['weights'][1], idx)
+            else:
+                w = tf.ones(tf.shape(idx), dtype=tf.float32)
+            return x, y, w
+
+        dataset = tf.data.Dataset.from_tensor_slices(source['idx']).batch(source['batchSize']).map(gather_batch)
+
+    if numClasses is not None:
+        dataset = dataset.map(lambda x, y, w: (x, tf.one_hot(y - 1, numClasses), w))
+
+    dataset = dataset.prefetch(prefetch)
+    source['init'] = net_obj.pipeline['iterator'].make_initializer(dataset)
+
+    datasets[key] = source
+    return source
+
+
+def load_dataset(sess, source, dataIter):
+    """ Loads the data of an Iterator into a dataset made by *create_dataset*, ready for the pipeline to be \
+        initialised with it. Data in memory is copied into the session once, in its stored order.
+
+    Args:
+        sess (obj): Tensor flow session object.
+        source (dict): Dataset made by *create_dataset*.
+        dataIter (obj): Iterator object.
+    """
+    source['dataIter'] = dataIter
+    if not source['variables']:
+        return
+    values = {'data': dataIter.dataSamples, 'weights': dataIter.loss_weights()}
+    if 'targets' in source['variables']:
+        values['targets'] = dataIter.targets
+        if dataIter.numClasses is not None:
+            values['targets'] = np.reshape(dataIter.targets, -1).astype(np.int32)
+    for key, (placeholder, variable) in source['variables'].items():
+        sess.run(variable.initializer, feed_dict={placeholder: values[key]})
+
+
 def train( net_obj , dataTrain, dataVal, train_op_name, n_epochs, save_addr, visualiseRateTrain=0, visualiseRateVal=0,
-           save_epochs=[1000] ):
+           save_epochs=[1000], preProcessor=None ):
     """ Function for training a network. Updates the network weights through the training op. The function will check \
         the save address for a model checkpoint to load, otherwise it will begin training from scratch.
 
@@ -352,21 +886,27 @@ def train( net_obj , dataTrain, dataVal, train_op_name, n_epochs, save_addr, vis
         visualiseRateTrain (int): Epoch rate at which to print training loss in console.
         visualiseRateVal (int): Epoch rate at which to print validation loss in console.
         save_epochs (int list): Epochs to save checkpoints at.
+        preProcessor (obj): PreProcessor used to pre-process the training data, saved with the model. If None - no \
+            pre-processor is saved.
     """
 
     if np.shape(dataTrain.dataSamples)[1] != net_obj.inputSize:
         raise Exception('the data dimensionality must match the network input size. '
                         'Data size: %d, network input size: %d'%(np.shape(dataTrain.dataSamples)[1], net_obj.inputSize))
 
-    batchSize = dataTrain.batchSize
-    numSamples = dataTrain.numSamples
-
-    numIters = numSamples // batchSize
-    if (numSamples % batchSize)>0:
-        numIters+=1
+    # if the network is fed by a tf.data pipeline, get the datasets for the iterators
+    if net_obj.pipeline is not None:
+        train_source = create_dataset(net_obj, 'train', dataTrain)
+        val_source = create_dataset(net_obj, 'val', dataVal)
+    else:
+        train_source = None
+        val_source = None
 
     with tf.Session() as sess:
         sess.run(tf.global_variables_initializer())
+        if net_obj.pipeline is not None:
+            load_dataset(sess, train_source, dataTrain)
+            load_dataset(sess, val_source, dataVal)
         saver = tf.train.Saver()
 
         # check if addr has 'epoch' in name and contains a checkpoint
@@ -379,31 +919,46 @@ def train( net_obj , dataTrain, dataVal, train_op_name, n_epochs, save_addr, vis
             # save directory is empty
             epoch_start = 0
             # create network config file in directory
-            save_config(net_obj,save_addr)
-
-        for epoch_i in range(epoch_start, n_epochs+1):
-            train_error = []
-            for batch_i in range(numIters):
-                train_batch_x , train_batch_y = dataTrain.next_batch()
+            save_config(net_obj,save_addr,preProcessor)
 
-                # update weights and biases
-                sess.run(net_obj.train_ops['%s_train'%(train_op_name)], feed_dict={net_obj.x: train_batch_x,
-                                                                                   net_obj.y_target: train_batch_y})
+        train_op = net_obj.train_ops['%s_train'%(train_op_name)]
+        loss_op = net_obj.train_ops['%s_loss'%(train_op_name)]
+        # losses summed over the samples of a batch are averaged over the batches (as the loss of a batch already
+        # grows with its size), losses averaged over the samples of a batch are weighted by the batch size
+        meanLoss = net_obj.train_ops['%s_reduction'%(train_op_name)] == 'mean'
 
-                # training loss
-                if visualiseRateTrain > 0:
-                    if epoch_i % visualiseRateTrain == 0:
-                        train_error.append( net_obj.train_ops['%s_loss' % (train_op_name)].eval(
-                            {net_obj.x: train_batch_x, net_obj.y_target: train_batch_y}) )
-
-                if batch_i == numIters - 1:
-                    dataTrain.reset_batch()
+        for epoch_i in range(epoch_start, n_epochs+1):
+            log_train = (visualiseRateTrain > 0) and (epoch_i % visualiseRateTrain == 0)
+            train_error = 0.0
+            train_count = 0
+            epoch_start_time = time.time()
+            step_time = 0.0
+            for feed_dict, batch_size in _batch_feeds(net_obj, dataTrain, sess, train_source):
+                step_start_time = time.time()
+
+                # update weights and biases. When the loss is logged, it is fetched in the same run (it is computed
+                # by the forward pass the update uses, so it is the loss before the update)
+                if log_train:
+                    _, loss = sess.run([train_op, loss_op], feed_dict=feed_dict)
+                    train_error += loss * batch_size if meanLoss else loss
+                    train_count += batch_size if meanLoss else 1
+                else:
+                    sess.run(train_op, feed_dict=feed_dict)
+
+                step_time += time.time() - step_start_time
 
             # outputs average batch error
-            if visualiseRateTrain > 0:
-                if epoch_i % visualiseRateTrain == 0:
-                    train_error = np.array(train_error)
-                    print("epoch: %d, training loss: %g" % (epoch_i, np.mean(train_error)))
+            if log_train:
+                print("epoch: %d, training loss: %g" % (epoch_i, train_error / train_count))
+                epoch_time = time.time() - epoch_start_time
+                if isinstance(dataTrain, data.PrefetchIterator) & (net_obj.pipeline is None):
+                    # time the training loop spent waiting for batches of data, as measured by the iterator
+                    print("epoch: %d, time waiting for data: %.3fs of %.3fs" % (epoch_i, dataTrain.waitTime,
+                                                                                epoch_time))
+                else:
+                    # time spent outside the training steps (assembling batches of data, and loop overhead)
+                    print("epoch: %d, time outside training steps: %.3fs of %.3fs" % (epoch_i, epoch_time-step_time,
+                                                                                      epoch_time))
 
 
 
@@ -412,18 +967,15 @@ def train( net_obj , dataTrain, dataVal, train_op_name, n_epochs, save_addr, vis
             if visualiseRateVal > 0:
                 if epoch_i % visualiseRateVal == 0:
 
-                    val_error = []
-                    for batch_i in range(dataVal.numSamples // dataVal.batchSize):
-                        val_batch_x, val_batch_y = dataVal.next_batch()
+                    val_error = 0.0
+                    val_count = 0
+                    for feed_dict, batch_size in _batch_feeds(net_obj, dataVal, sess, val_source):
 
-                        val_error.append( net_obj.train_ops['%s_loss' % (train_op_name)].eval(
-                                {net_obj.x: val_batch_x, net_obj.y_target: val_batch_y}) )
+                        loss = sess.run(loss_op, feed_dict=feed_dict)
+                        val_error += loss * batch_size if meanLoss else loss
+                        val_count += batch_size if meanLoss else 1
 
-                        if batch_i == (dataVal.numSamples // dataVal.batchSize)-1:
-                            dataVal.reset_batch()
-
-                    val_error = np.array(val_error)
-                    print("epoch: %d, validation loss: %g" % (epoch_i, np.mean(val_error)))
+                    print("epoch: %d, validation loss: %g" % (epoch_i, val_error / val_count))
 
             save_model(save_addr,sess,saver,epoch_i,save_epochs)
 
@@ -435,6 +987,34 @@ def train( net_obj , dataTrain, dataVal, train_op_name, n_epochs, save_addr, vis
 
 
 
+def _batch_feeds(net_obj, dataIter, sess, source=None):
+    """ Generator of the feed dict and size of each batch in an epoch of an Iterator. If the network is fed by a \
+        tf.data pipeline, the pipeline is initialised and the feed dicts are empty. Batches with sample weights \
+        also feed the sample weights placeholder.
+
+    Args:
+        net_obj (obj): Network object.
+        dataIter (obj): Iterator object.
+        sess (obj): Tensor flow session object.
+        source (dict): Dataset the Iterator is loaded into (from *create_dataset*), or None.
+
+    """
+    if source is None:
+        for batch in dataIter:
+            feed_dict = {net_obj.x: batch[0], net_obj.y_target: batch[1]}
+            if len(batch) > 2:
+                feed_dict[net_obj.sample_weights] = batch[2]
+            yield feed_dict, len(batch[0])
+    else:
+        # shuffle (or redraw the weighted sample) each epoch, as iterating through the Iterator would
+        if dataIter.reshuffle:
+            dataIter.shuffle()
+        sess.run(source['init'], feed_dict={source['idx']: dataIter.permutation,
+                                            source['batchSize']: dataIter.batchSize})
+        for start in range(0, dataIter.numSamples, dataIter.batchSize):
+            yield {}, min(dataIter.batchSize, dataIter.numSamples - start)
+
+
 def init_weight(opts, shape, stddev=0.1, const=0.1, wd = False, dtype=tf.float32):
     """ Weight initialisation function.
 
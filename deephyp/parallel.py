@@ -0,0 +1,284 @@
+'''
+    Description: multi-process inference with the numpy runtime. The data samples and results are held in shared \
+    memory (or memory-mapped files), and a pool of worker processes, each holding a loaded model, processes shards of \
+    rows of them.
+
+    - File name: parallel.py
+    - Author: deephyp contributors
+    - Date created: October 2026
+    - Python package: deephyp
+
+'''
+
+import numpy as np
+import mmap
+import multiprocessing
+import os
+import tempfile
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+from deephyp import runtime
+
+
+# model loaded in a worker process, the shared arrays it has attached (keyed by call and descriptor), and the barrier
+# the workers meet at when releasing them
+_workerModel = None
+_workerArrays = {}
+_workerBarrier = None
+
+# environment variables limiting the threads used by numpy's BLAS library
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                    'NUMEXPR_NUM_THREADS']
+
+
+class ParallelModel():
+    """ Class for using a model exported with the export_numpy class function of the networks across a pool of \
+        worker processes. Each worker loads the model once, when the pool is started. The data samples and results \
+        are shared with the workers rather than copied to them: memmaps are opened by the workers directly, and \
+        other arrays are placed in shared memory. Each worker processes shards of rows.
+
+    Args:
+        addr (str): Address of the .npz file exported from a network.
+        numWorkers (int): Number of worker processes. If None - set to the number of CPUs.
+        threadsPerWorker (int): Number of threads each worker's BLAS library may use.
+
+    Attributes:
+        model (obj): runtime.NumpyModel loaded in this process (used to get the shape of results).
+        numWorkers (int): Number of worker processes.
+        pool (obj): Pool of worker processes.
+        numCalls (int): Number of calls made to the workers, used to tell the arrays of each call apart.
+    """
+
+    def __init__(self, addr, numWorkers=None, threadsPerWorker=1):
+
+        if numWorkers is None:
+            numWorkers = multiprocessing.cpu_count()
+        self.model = runtime.NumpyModel(addr)
+        self.numWorkers = numWorkers
+        self.numCalls = 0
+
+        # workers are started fresh (rather than forked), so that the thread limits apply when they import numpy
+        environ = dict(os.environ)
+        os.environ.update(dict((variable, str(threadsPerWorker)) for variable in THREAD_VARIABLES))
+        try:
+            context = multiprocessing.get_context('spawn')
+            self.pool = context.Pool(numWorkers, initializer=_init_worker, initargs=(addr, context.Barrier(numWorkers)))
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+    def close(self):
+        """ Stops the worker processes.
+        """
+        self.pool.close()
+        self.pool.join()
+
+    def _run(self, method, dataSamples, shardSize, out, outAddr, **kwargs):
+
+        numSamples = np.shape(dataSamples)[0]
+        sample = getattr(self.model, method)(dataSamples[:1], **kwargs)
+        shape = (numSamples,) + np.shape(sample)[1:]
+        if (out is None) & (outAddr is not None):
+            out = np.lib.format.open_memmap(outAddr, mode='w+', dtype=sample.dtype, shape=shape)
+
+        # the arrays of each call are told apart by a token, so that a worker never writes to an array attached in an
+        # earlier call (e.g. a mapping of a file since replaced at the same address)
+        self.numCalls += 1
+        token = self.numCalls
+
+        handles = []
+        try:
+            inDescriptor, inArray = _share(dataSamples, handles, mode='r')
+            if out is None:
+                outDescriptor, outArray = _share(None, handles, shape=shape, dtype=sample.dtype)
+            else:
+                outDescriptor, outArray = _share(out, handles)
+
+            tasks = [(token, method, inDescriptor, outDescriptor, start, min(start + shardSize, numSamples), kwargs)
+                     for start in range(0, numSamples, shardSize)]
+            try:
+                for _ in self.pool.imap_unordered(_run_shard, tasks):
+                    pass
+            finally:
+                # every worker releases the arrays it attached (each takes one task, as it waits for the others)
+                self.pool.map(_release_worker_arrays, range(self.numWorkers), chunksize=1)
+
+            if out is None:
+                out = np.array(outArray)
+            elif outArray is not out:
+                out[...] = outArray
+            if isinstance(out, np.memmap):
+                out.flush()
+        finally:
+            # views of shared memory must be gone before it is closed
+            inArray = outArray = None
+            for handle in handles:
+                _release(handle, unlink=True)
+
+        return out
+
+    def encoder(self, dataSamples, shardSize=10000, out=None, outAddr=None, applyPreProcessor=False):
+        """ Extract the latent variable of some dataSamples across the worker processes.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize]. Can be a memmap.
+            shardSize (int): Number of samples in each shard handed to a worker.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            outAddr (str): Address of a .npy file to write the results into as a memmap, if out is None.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array): Latent representation z of dataSamples. Shape [numSamples x arbitrary].
+        """
+        return self._run('encoder', dataSamples, shardSize, out, outAddr, applyPreProcessor=applyPreProcessor)
+
+    def encoder_decoder(self, dataSamples, shardSize=10000, out=None, outAddr=None, applyPreProcessor=False):
+        """ Extract the reconstruction of some dataSamples across the worker processes.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize]. Can be a memmap.
+            shardSize (int): Number of samples in each shard handed to a worker.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            outAddr (str): Address of a .npy file to write the results into as a memmap, if out is None.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array): Reconstructed data. Shape [numSamples x inputSize].
+        """
+        return self._run('encoder_decoder', dataSamples, shardSize, out, outAddr,
+                         applyPreProcessor=applyPreProcessor)
+
+    def predict_scores(self, dataSamples, useSoftmax=True, shardSize=10000, out=None, outAddr=None,
+                       applyPreProcessor=False):
+        """ Extract the predicted classification scores of some dataSamples across the worker processes.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize]. Can be a memmap.
+            useSoftmax (boolean): Pass predicted scores output by the model through a softmax function.
+            shardSize (int): Number of samples in each shard handed to a worker.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            outAddr (str): Address of a .npy file to write the results into as a memmap, if out is None.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array): Predicted classification scores of dataSamples. Shape [numSamples x numClasses].
+        """
+        return self._run('predict_scores', dataSamples, shardSize, out, outAddr, useSoftmax=useSoftmax,
+                         applyPreProcessor=applyPreProcessor)
+
+    def predict_labels(self, dataSamples, shardSize=10000, out=None, outAddr=None, applyPreProcessor=False):
+        """ Extract the predicted classification labels of some dataSamples across the worker processes.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize]. Can be a memmap.
+            shardSize (int): Number of samples in each shard handed to a worker.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            outAddr (str): Address of a .npy file to write the results into as a memmap, if out is None.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array): Predicted classification labels of dataSamples. Shape [numSamples].
+        """
+        return self._run('predict_labels', dataSamples, shardSize, out, outAddr, applyPreProcessor=applyPreProcessor)
+
+
+def _init_worker(addr, barrier):
+    """Loads the model in a worker process."""
+    global _workerModel, _workerBarrier
+    _workerModel = runtime.NumpyModel(addr)
+    _workerBarrier = barrier
+
+
+def _run_shard(task):
+    """Runs a model function over a shard of rows in a worker process, writing into the shared output."""
+    token, method, inDescriptor, outDescriptor, start, stop, kwargs = task
+
+    # arrays stay attached between shards of the same call
+    for key in [(token, inDescriptor), (token, outDescriptor)]:
+        if key not in _workerArrays:
+            _workerArrays[key] = _attach(key[1])
+
+    dataSamples = _workerArrays[(token, inDescriptor)][0]
+    out = _workerArrays[(token, outDescriptor)][0]
+    getattr(_workerModel, method)(dataSamples[start:stop], out=out[start:stop], **kwargs)
+    return stop - start
+
+
+def _release_worker_arrays(_):
+    """Releases the arrays attached by a worker process, once all workers have been handed a release task."""
+    while _workerArrays:
+        _release(_workerArrays.popitem()[1][1])
+    _workerBarrier.wait()
+
+
+def _share(array, handles, shape=None, dtype=None, mode='r+'):
+    """Makes an array accessible to the worker processes. Memmaps (and contiguous views of them) are shared through \
+        their file, opened by the workers with mode, and other arrays are copied into shared memory (or a temporary \
+        memmap if shared memory is not available). If array is None, an empty shared array of shape and dtype is \
+        made. Returns a descriptor the workers attach with, and the array. New handles to release are appended to \
+        handles."""
+    if array is not None:
+        memmapFile = _memmap_file(array)
+        if memmapFile is not None:
+            descriptor = ('memmap', memmapFile[0], array.dtype.str, np.shape(array), memmapFile[1], mode)
+            return descriptor, array
+        array = np.asarray(array)
+        shape, dtype = np.shape(array), array.dtype
+    dtype = np.dtype(dtype)
+    nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+
+    if shared_memory is not None:
+        handle = shared_memory.SharedMemory(create=True, size=nbytes)
+        handles.append(handle)
+        descriptor = ('shm', handle.name, dtype.str, shape, 0, 'r+')
+        sharedArray = np.ndarray(shape, dtype=dtype, buffer=handle.buf)
+    else:
+        fd, addr = tempfile.mkstemp(suffix='.dat')
+        os.close(fd)
+        handles.append(addr)
+        descriptor = ('memmap', addr, dtype.str, shape, 0, 'r+')
+        sharedArray = np.memmap(addr, dtype=dtype, mode='w+', shape=shape)
+
+    if array is not None:
+        sharedArray[...] = array
+    return descriptor, sharedArray
+
+
+def _memmap_file(array):
+    """Finds the file and byte offset of a memmap, or of a contiguous view of one. Returns None for other arrays."""
+    root = array
+    while isinstance(root, np.ndarray) and not isinstance(root.base, mmap.mmap):
+        root = root.base
+    if not isinstance(root, np.memmap) or (root.filename is None) or not array.flags.c_contiguous:
+        return None
+    offset = root.offset + array.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+    return root.filename, offset
+
+
+def _attach(descriptor):
+    """Attaches to an array shared by *_share*. Returns the array and a handle to release."""
+    kind, name, dtype, shape, offset, mode = descriptor
+    if kind == 'memmap':
+        return np.memmap(name, dtype=dtype, mode=mode, shape=shape, offset=offset), None
+    # the workers share the resource tracker of the process that made the memory, which removes it when done
+    handle = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=handle.buf), handle
+
+
+def _release(handle, unlink=False):
+    """Releases a handle made by *_share* or *_attach*."""
+    if handle is None:
+        return
+    if isinstance(handle, str):
+        if unlink:
+            os.remove(handle)
+        return
+    handle.close()
+    if unlink:
+        handle.unlink()
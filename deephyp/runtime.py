@@ -0,0 +1,496 @@
+'''
+    Description: numpy-only runtime for using trained networks without tensor flow. Loads models exported with the \
+    export_numpy class function of the networks, and reproduces their inference functions.
+
+    - File name: runtime.py
+    - Author: deephyp contributors
+    - Date created: October 2026
+    - Python package: deephyp
+
+'''
+
+import numpy as np
+import json
+from deephyp import data
+
+
+class NumpyModel():
+    """ Class for using a trained model without tensor flow. Reproduces the inference functions of the network the \
+        model was exported from (with its export_numpy class function), including tied weights, skip connections, \
+        strides and padding. If the model was saved with a pre-processor, it is applied to the data samples input \
+        into the model when the inference functions are called with applyPreProcessor=True.
+
+    Args:
+        addr (str): Address of the .npz file exported from a network.
+
+    Attributes:
+        network (str): Network the model was exported from. Current options: ['autoencoder.mlp_1D_network', \
+            'autoencoder.cnn_1D_network', 'classifier.cnn_1D_network'].
+        config (dict): Config of the network (the variables listed in its net_config).
+        weights (dict): Weight parameters, keyed as in the network. Includes tied weights.
+        biases (dict): Bias parameters, keyed as in the network.
+        preProcessor (obj): data.PreProcessor saved with the model, or None.
+        numLayers (int): Total number of layers of a classifier (convolutional and fully-connected).
+    """
+
+    def __init__(self, addr):
+
+        with np.load(addr) as arrays:
+            self.config = json.loads(str(arrays['config']))
+            self.network = self.config['network']
+            self.weights = {}
+            self.biases = {}
+            for key in arrays.files:
+                if key.startswith('weights/'):
+                    self.weights[key[len('weights/'):]] = arrays[key]
+                elif key.startswith('biases/'):
+                    self.biases[key[len('biases/'):]] = arrays[key]
+            self.preProcessor = None
+            if 'preprocess' in arrays.files:
+                self.preProcessor = data.PreProcessor()
+                self.preProcessor.set_config(json.loads(str(arrays['preprocess'])))
+
+        if self.network == 'autoencoder.mlp_1D_network':
+            self._setup_mlp_autoencoder()
+        elif self.network == 'autoencoder.cnn_1D_network':
+            self._setup_cnn_autoencoder()
+        elif self.network == 'classifier.cnn_1D_network':
+            self._setup_cnn_classifier()
+        else:
+            raise ValueError('unknown network: %s. Use autoencoder.mlp_1D_network, autoencoder.cnn_1D_network or '
+                             'classifier.cnn_1D_network.' % self.network)
+
+    def _setup_mlp_autoencoder(self):
+        config = self.config
+        self.numEncoderLayers = len(config['encodersize'])
+        tiedWeights = config['tiedWeights']
+        if tiedWeights is None:
+            tiedWeights = [0]*self.numEncoderLayers
+        for layerNum in range(1, self.numEncoderLayers + 1):
+            if tiedWeights[layerNum-1] == 1:
+                self.weights['decoder_w%i' % (self.numEncoderLayers + layerNum)] = \
+                    self.weights['encoder_w%i' % (self.numEncoderLayers + 1 - layerNum)].T
+
+    def _setup_cnn_autoencoder(self):
+        config = self.config
+        self.numConvLayers = len(config['encoderNumfilters'])
+        self.encoderNumFilters = [1] + config['encoderNumfilters']
+        self.decoderNumFilters = self.encoderNumFilters[::-1]
+        self.decoderStride = config['encoderStride'][::-1]
+        self.encoderDataShape = [config['inputSize']]
+        for layerNum in range(self.numConvLayers):
+            self.encoderDataShape.append(conv_output_shape(self.encoderDataShape[layerNum],
+                                                           config['encoderFiltersize'][layerNum], config['padding'],
+                                                           config['encoderStride'][layerNum]))
+        self.encoderDataShape.append(config['zDim'])
+        self.encoderDataShape[self.numConvLayers] = self.encoderDataShape[-2] * self.encoderNumFilters[-1]
+        self.decoderDataShape = self.encoderDataShape[::-1]
+        tiedWeights = config['tiedWeights']
+        if tiedWeights is None:
+            tiedWeights = [0]*self.numConvLayers
+        for layerNum in range(1, self.numConvLayers + 1):
+            if tiedWeights[layerNum-1] == 1:
+                self.weights['decoder_w%i' % (self.numConvLayers + 2 + layerNum)] = \
+                    self.weights['encoder_w%i' % (self.numConvLayers + 1 - layerNum)]
+
+    def _setup_cnn_classifier(self):
+        config = self.config
+        self.numConvLayers = len(config['convNumFilters'])
+        self.numLayers = self.numConvLayers + len(config['fcSize']) + 1
+        self.numClasses = config['numClasses']
+
+    def _encode(self, x):
+        # returns the latent vectors, and the outputs of each layer before activation (for skip connections)
+        config = self.config
+        h = {}
+        if self.network == 'autoencoder.mlp_1D_network':
+            a = x
+            for layerNum in range(1, self.numEncoderLayers + 1):
+                h[layerNum] = layer_fullyConn(a, self.weights['encoder_w%d' % layerNum],
+                                              self.biases['encoder_b%d' % layerNum])
+                a = layer_activation(h[layerNum], config['activationFunc'])
+        else:
+            a = x[:, :, np.newaxis]
+            for layerNum in range(1, self.numConvLayers + 1):
+                h[layerNum] = layer_conv1d(a, self.weights['encoder_w%d' % layerNum],
+                                           self.biases['encoder_b%d' % layerNum], config['encoderStride'][layerNum-1],
+                                           config['padding'])
+                a = layer_activation(h[layerNum], config['activationFunc'])
+            a = np.reshape(a, (-1, self.encoderDataShape[self.numConvLayers]))
+            layerNum = self.numConvLayers + 1
+            h[layerNum] = layer_fullyConn(a, self.weights['encoder_w%d' % layerNum],
+                                          self.biases['encoder_b%d' % layerNum])
+            a = layer_activation(h[layerNum], config['activationFunc'])
+        return a, h
+
+    def _decode(self, z, x=None, h=None):
+        config = self.config
+        if config['skipConnect'] & (h is None):
+            raise Exception('the model has skip connections, so it can only reconstruct data samples (use '
+                            'encoder_decoder).')
+        a = z
+        if self.network == 'autoencoder.mlp_1D_network':
+            for layerNum in range(1, self.numEncoderLayers + 1):
+                absLayerNum = self.numEncoderLayers + layerNum
+                hDec = layer_fullyConn(a, self.weights['decoder_w%d' % absLayerNum],
+                                       self.biases['decoder_b%d' % absLayerNum])
+                if layerNum < self.numEncoderLayers:
+                    if config['skipConnect']:
+                        hDec += h[self.numEncoderLayers - layerNum]
+                    a = layer_activation(hDec, config['activationFunc'])
+                else:
+                    if config['skipConnect']:
+                        hDec += x
+                    a = layer_activation(hDec, config['activationFuncFinal'])
+        else:
+            numConvLayers = self.numConvLayers
+            hDec = layer_fullyConn(a, self.weights['decoder_w%d' % (numConvLayers + 2)],
+                                   self.biases['decoder_b%d' % (numConvLayers + 2)])
+            if config['skipConnect']:
+                hDec += np.reshape(h[numConvLayers], (-1, self.encoderDataShape[numConvLayers]))
+            a = layer_activation(hDec, config['activationFunc'])
+            a = np.reshape(a, (-1, self.decoderDataShape[1] // self.encoderNumFilters[-1], self.encoderNumFilters[-1]))
+            for layerNum in range(1, numConvLayers + 1):
+                absLayerNum = numConvLayers + 2 + layerNum
+                hDec = layer_deconv1d(a, self.weights['decoder_w%d' % absLayerNum],
+                                      self.biases['decoder_b%d' % absLayerNum], self.decoderDataShape[layerNum+1],
+                                      self.decoderStride[layerNum-1], config['padding'])
+                if layerNum < numConvLayers:
+                    if config['skipConnect']:
+                        hDec += h[numConvLayers - layerNum]
+                    a = layer_activation(hDec, config['activationFunc'])
+                else:
+                    if config['skipConnect']:
+                        hDec += x[:, :, np.newaxis]
+                    a = layer_activation(hDec, config['activationFuncFinal'])
+            a = a[:, :, 0]
+        return a
+
+    def _classify(self, x, layer=None):
+        # returns the output of a layer (the class scores if layer is None)
+        config = self.config
+        a = x[:, :, np.newaxis]
+        for layerNum in range(1, self.numConvLayers + 1):
+            a = layer_activation(layer_conv1d(a, self.weights['conv_w%d' % layerNum],
+                                              self.biases['conv_b%d' % layerNum], config['convStride'][layerNum-1],
+                                              config['padding']), config['activationFunc'])
+            if layerNum == self.numConvLayers:
+                a = np.reshape(a, (np.shape(a)[0], -1))
+            if layerNum == layer:
+                return a
+        for layerNum in range(1, len(config['fcSize']) + 2):
+            a = layer_fullyConn(a, self.weights['fc_w%d' % layerNum], self.biases['fc_b%d' % layerNum])
+            if layerNum <= len(config['fcSize']):
+                a = layer_activation(a, config['activationFunc'])
+            if self.numConvLayers + layerNum == layer:
+                return a
+        return a
+
+    def _preprocessor(self, applyPreProcessor):
+        return self.preProcessor if applyPreProcessor else None
+
+    def _check_network(self, networks, function):
+        if self.network not in networks:
+            raise Exception('the %s function is not available for a %s model.' % (function, self.network))
+
+    def encoder(self, dataSamples, batchSize=None, out=None, generator=False, applyPreProcessor=False):
+        """ Extract the latent variable of some dataSamples.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Latent representation z of dataSamples. Shape [numSamples x arbitrary].
+        """
+        self._check_network(['autoencoder.mlp_1D_network', 'autoencoder.cnn_1D_network'], 'encoder')
+        return run_batched(lambda x: self._encode(x)[0], dataSamples, batchSize, out, generator,
+                           self._preprocessor(applyPreProcessor))
+
+    def decoder(self, dataZ, batchSize=None, out=None, generator=False):
+        """ Extract the reconstruction of some dataSamples from their latent representation encoding.
+
+        Args:
+            dataZ (np.array): Latent representation of data samples to reconstruct. Shape [numSamples x arbitrary].
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+
+        Returns:
+            (np.array or generator): Reconstructed data. Shape [numSamples x inputSize].
+        """
+        self._check_network(['autoencoder.mlp_1D_network', 'autoencoder.cnn_1D_network'], 'decoder')
+        return run_batched(self._decode, dataZ, batchSize, out, generator)
+
+    def encoder_decoder(self, dataSamples, batchSize=None, out=None, generator=False, applyPreProcessor=False):
+        """ Extract the reconstruction of some dataSamples.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Reconstructed data. Shape [numSamples x inputSize].
+        """
+        self._check_network(['autoencoder.mlp_1D_network', 'autoencoder.cnn_1D_network'], 'encoder_decoder')
+
+        def encode_decode(x):
+            z, h = self._encode(x)
+            return self._decode(z, x, h)
+
+        return run_batched(encode_decode, dataSamples, batchSize, out, generator,
+                           self._preprocessor(applyPreProcessor))
+
+    def predict_scores(self, dataSamples, useSoftmax=True, batchSize=None, out=None, generator=False,
+                       applyPreProcessor=False):
+        """ Extract the predicted classification scores of some dataSamples.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            useSoftmax (boolean): Pass predicted scores output by the model through a softmax function.
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Predicted classification scores of dataSamples. Shape [numSamples x numClasses].
+        """
+        self._check_network(['classifier.cnn_1D_network'], 'predict_scores')
+        if useSoftmax:
+            func = lambda x: softmax(self._classify(x))
+        else:
+            func = self._classify
+        return run_batched(func, dataSamples, batchSize, out, generator, self._preprocessor(applyPreProcessor))
+
+    def predict_labels(self, dataSamples, batchSize=None, out=None, generator=False, applyPreProcessor=False):
+        """ Extract the predicted classification labels of some dataSamples.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Predicted classification labels of dataSamples. Shape [numSamples].
+        """
+        self._check_network(['classifier.cnn_1D_network'], 'predict_labels')
+        return run_batched(lambda x: np.argmax(self._classify(x), axis=1) + 1, dataSamples, batchSize, out, generator,
+                           self._preprocessor(applyPreProcessor))
+
+    def predict_features(self, dataSamples, layer, batchSize=None, out=None, generator=False, applyPreProcessor=False):
+        """ Extract the feature values at a particular layer of the model.
+
+        Args:
+            dataSamples (np.array): Shape [numSamples x inputSize].
+            layer (int): Layer at which to extract features. Must be between 1 and numLayers inclusive.
+            batchSize (int): Number of samples to run through the model at a time, bounding the memory used. If \
+                None - all samples are run at once.
+            out (np.array): Array (e.g. a memmap) to write the results into. If None - a new array is returned.
+            generator (boolean): If True - returns a generator of the results for each batch, instead of an array.
+            applyPreProcessor (boolean): Whether dataSamples are raw spectra, to be pre-processed by the model's saved \
+                pre-processor (see network_ops.model_preprocessor).
+
+        Returns:
+            (np.array or generator): Values of neurons at layer. Shape [numSamples x numNeurons] if fully-connected \
+                layer and [numSamples x convDim1 x convDim2] if convolutional layer.
+        """
+        self._check_network(['classifier.cnn_1D_network'], 'predict_features')
+        if (layer < 1) | (layer > self.numLayers):
+            raise ValueError('layer must be between 1 and numLayers (%i). Layer = %i found.' % (self.numLayers, layer))
+        return run_batched(lambda x: self._classify(x, layer), dataSamples, batchSize, out, generator,
+                           self._preprocessor(applyPreProcessor))
+
+
+def run_batched(func, dataSamples, batchSize=None, out=None, generator=False, preProcessor=None):
+    """Applies a function to some data samples in batches, so that the memory used by intermediate results depends \
+        on the batch size rather than on the number of samples.
+
+    Args:
+        func (function): Function mapping a batch of data samples to their results.
+        dataSamples (np.array): Shape [numSamples x inputSize]. Can be a memmap.
+        batchSize (int): Number of samples to process at a time. If None - all samples are processed at once.
+        out (np.array): Array to write the results into (e.g. a memmap). Shape [numSamples x outputSize]. If None - \
+            a new array is returned.
+        generator (boolean): If True - returns a generator of the results of each batch, instead of an array.
+        preProcessor (obj): data.PreProcessor applied to each batch. If None - batches are used unchanged.
+
+    Returns:
+        (np.array or generator): Results for all data samples, or a generator of results per batch.
+    """
+    numSamples = np.shape(dataSamples)[0]
+    if batchSize is None:
+        batchSize = max(numSamples, 1)
+
+    def run_batches():
+        for start in range(0, numSamples, batchSize):
+            batch = np.asarray(dataSamples[start:start+batchSize], dtype=np.float32)
+            if preProcessor is not None:
+                batch = preProcessor.transform(batch)
+            yield start, func(batch)
+
+    if generator:
+        return (result for _, result in run_batches())
+
+    for start, result in run_batches():
+        if out is None:
+            out = np.empty((numSamples,) + result.shape[1:], dtype=result.dtype)
+        out[start:start+len(result)] = result
+
+    if out is None:
+        # no samples - run once to get the output shape
+        out = func(np.asarray(dataSamples, dtype=np.float32))
+    elif isinstance(out, np.memmap):
+        out.flush()
+
+    return out
+
+
+def layer_fullyConn(input, W, b):
+    """ Fully connected (i.e. dense) layer.
+
+    Args:
+        input (np.array): Data input into the layer. Shape [numSamples x numInputNeurons].
+        W (np.array): Weight parameters for the layer. Shape [numInputNeurons x numOutputNeurons].
+        b (np.array): Bias parameters for the layer. Shape [numOutputNeurons].
+
+    Returns:
+        (np.array): Layer output. Shape [numSamples x numOutputNeurons].
+    """
+    out = np.dot(input, W)
+    out += b
+    return out
+
+
+def layer_conv1d(input, W, b, stride=1, padding='SAME'):
+    """ 1 dimensional convolution layer, computed as one matrix product per filter tap over a strided view of the \
+        (padded) input.
+
+    Args:
+        input (np.array): Data input into the layer. Shape [numSamples x numInputNeurons x numFiltersIn].
+        W (np.array): Weight parameters of the filters/kernels. Shape [filterSize x numFiltersIn x numFiltersOut].
+        b (np.array): Bias parameters for the layer. Shape [numFiltersOut].
+        stride (int): Stride at which to convolve (must be >= 1).
+        padding (str): Type of padding to use ('SAME' or 'VALID').
+
+    Returns:
+        (np.array): Layer output. Shape [numSamples x numOutputNeurons x numFiltersOut].
+    """
+    filterSize = np.shape(W)[0]
+    inputShape = np.shape(input)[1]
+    outputShape = conv_output_shape(inputShape, filterSize, padding, stride)
+    if padding == 'SAME':
+        padTotal = max((outputShape - 1)*stride + filterSize - inputShape, 0)
+        input = np.pad(input, ((0, 0), (padTotal // 2, padTotal - padTotal // 2), (0, 0)), mode='constant')
+
+    out = np.empty((np.shape(input)[0], outputShape, np.shape(W)[2]), dtype=np.result_type(input, W))
+    out[...] = b
+    for tap in range(filterSize):
+        out += np.dot(input[:, tap:tap + (outputShape - 1)*stride + 1:stride, :], W[tap])
+    return out
+
+
+def layer_deconv1d(input, W, b, outputShape, stride=1, padding='SAME'):
+    """ 1 dimensional deconvolution (i.e. convolution transpose) layer, computed by scattering one matrix product per \
+        filter tap into a padded buffer.
+
+    Args:
+        input (np.array): Data input into the layer. Shape [numSamples x numInputNeurons x numFiltersIn].
+        W (np.array): Weight parameters of the filters/kernels. Shape [filterSize x numFiltersOut x numFiltersIn].
+        b (np.array): Bias parameters for the layer. Shape [numFiltersOut].
+        outputShape (int): Number of output neurons (i.e. length of the convolving axis of the output).
+        stride (int): Stride at which to convolve (must be >= 1).
+        padding (str): Type of padding to use ('SAME' or 'VALID').
+
+    Returns:
+        (np.array): Layer output. Shape [numSamples x numOutputNeurons x numFiltersOut].
+    """
+    filterSize = np.shape(W)[0]
+    inputShape = np.shape(input)[1]
+    if padding == 'SAME':
+        padLeft = max((inputShape - 1)*stride + filterSize - outputShape, 0) // 2
+    elif padding == 'VALID':
+        padLeft = 0
+    else:
+        raise ValueError('unknown padding type: %s. Use SAME or VALID' % padding)
+
+    bufferShape = max((inputShape - 1)*stride + filterSize, padLeft + outputShape)
+    out = np.zeros((np.shape(input)[0], bufferShape, np.shape(W)[1]), dtype=np.result_type(input, W))
+    for tap in range(filterSize):
+        out[:, tap:tap + (inputShape - 1)*stride + 1:stride, :] += np.dot(input, W[tap].T)
+    out = out[:, padLeft:padLeft + outputShape, :]
+    out += b
+    return out
+
+
+def layer_activation(input, func='sigmoid'):
+    """ Activation function.
+
+    Args:
+        input (np.array): Data input into the function.
+        func (str): Type of activation function. (relu, sigmoid, linear).
+
+    Returns:
+        (np.array): Activation. Shape is same as input.
+    """
+    if func == 'relu':
+        a = np.maximum(input, 0)
+    elif func == 'sigmoid':
+        # equal to 1/(1+exp(-x)), without overflowing for large negative x
+        a = 0.5 * (np.tanh(0.5 * input) + 1)
+    elif func == 'linear':
+        a = input
+    else:
+        raise ValueError('unknown activation function: %s. Use relu, sigmoid or linear.' % func)
+    return a
+
+
+def softmax(input):
+    """ Softmax function over the last axis.
+
+    Args:
+        input (np.array): Scores. Shape [numSamples x numClasses].
+
+    Returns:
+        (np.array): Scores normalised to sum to one. Shape [numSamples x numClasses].
+    """
+    e = np.exp(input - np.max(input, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+def conv_output_shape(inputShape, filterSize, padding, stride):
+    """ Computes the output shape (for the convolving axis only) of a convolution layer given an input shape.
+
+    Args:
+        inputShape (int): Shape of convolving axis of input data.
+        filterSize (int): Size of filter/kernel of convolution layer.
+        padding (str): Type of padding to use ('SAME' or 'VALID').
+        stride (int): Stride at which to convolve (must be >= 1).
+
+    Returns:
+        (int): Output shape of convolving axis for given layer and input shape.
+    """
+    if padding == 'VALID':
+        outputShape = np.ceil((inputShape - (filterSize - 1)) / float(stride))
+    elif padding == 'SAME':
+        outputShape = np.ceil(inputShape / float(stride))
+    else:
+        raise ValueError('unknown padding type: %s. Use SAME or VALID' % padding)
+    return int(outputShape)
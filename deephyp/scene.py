@@ -0,0 +1,255 @@
+'''
+    Description: engine for passing whole hyperspectral scenes through a trained network. Reading, pre-processing, \
+    inference and writing are run as concurrent stages connected by bounded queues, working on tiles of rows.
+
+    - File name: scene.py
+    - Author: deephyp contributors
+    - Date created: October 2026
+    - Python package: deephyp
+
+'''
+
+import numpy as np
+import threading
+import time
+import queue
+from deephyp import network_ops as net_ops
+
+
+# network output computed for each inference function
+OUTPUTS = {'encoder':'z', 'encoder_decoder':'y_recon', 'predict_scores':'y_scores', 'predict_labels':'y_labels'}
+
+
+class SceneProcessor():
+    """ Class for passing a whole scene through a trained model, tile by tile. A reader thread reads tiles of rows \
+        from the scene (e.g. a memmap on disk), a pool of worker threads pre-process them, an inference thread passes \
+        them through the network and a writer thread writes the results into the output (e.g. a memmap). The stages \
+        overlap, so the time taken approaches that of the slowest stage rather than the sum of all stages.
+
+    Args:
+        net (obj): Network object with the model added (e.g. autoencoder.mlp_1D_network or \
+            classifier.cnn_1D_network).
+        modelName (str): Name of the model to use (previously added with add_model() ).
+        method (str): Inference function to apply. Current options: ['encoder', 'encoder_decoder', \
+            'predict_scores', 'predict_labels'].
+        tileRows (int): Number of rows of the scene in each tile.
+        numWorkers (int): Number of pre-processing threads.
+        queueSize (int): Maximum number of tiles waiting between each pair of stages.
+        batchSize (int): Number of samples passed through the network at a time. If None - a tile at a time.
+        preProcessor (obj): data.PreProcessor applied to each tile, in which case the scene holds raw spectra. If \
+            None - the pre-processor saved with the model is used if applyPreProcessor is True, else the data is \
+            used as is.
+        applyPreProcessor (boolean): Whether the scene holds raw spectra, to be pre-processed by the model's saved \
+            pre-processor (see network_ops.model_preprocessor).
+        noDataValue (float): Pixels with this value in every band are skipped (not pre-processed or passed through \
+            the network), and given fillValue in the output. If None - not used.
+        maskNaN (boolean): Whether pixels with a NaN in any band are skipped.
+        fillValue (float): Output value of skipped pixels.
+
+    Attributes:
+        net (obj): Network object.
+        modelName (str): Name of the model used.
+        method (str): Inference function applied.
+        tileRows (int): Number of rows of the scene in each tile.
+        numWorkers (int): Number of pre-processing threads.
+        queueSize (int): Maximum number of tiles waiting between each pair of stages.
+        batchSize (int): Number of samples passed through the network at a time.
+        preProcessor (obj): data.PreProcessor applied to each tile, or None.
+        noDataValue (float): Pixels with this value in every band are skipped, or None.
+        maskNaN (boolean): Whether pixels with a NaN in any band are skipped.
+        fillValue (float): Output value of skipped pixels.
+        stageTimes (dict): Seconds spent working in each stage ('read', 'pre_process', 'infer', 'write') during the \
+            last call to *process*. Pre-processing time is summed over the workers.
+        totalTime (float): Wall-clock seconds taken by the last call to *process*.
+    """
+
+    def __init__(self, net, modelName, method='encoder', tileRows=16, numWorkers=2, queueSize=4, batchSize=None,
+                 preProcessor=None, noDataValue=None, maskNaN=False, fillValue=0, applyPreProcessor=False):
+
+        if method not in OUTPUTS:
+            raise ValueError('unknown method: %s. Use %s.' % (method, ', '.join(sorted(OUTPUTS))))
+        if not hasattr(net, OUTPUTS[method]):
+            raise ValueError('the network has no %s function.' % method)
+        if preProcessor is None:
+            preProcessor = net_ops.model_preprocessor(net, modelName, applyPreProcessor)
+
+        self.net = net
+        self.modelName = modelName
+        self.method = method
+        self.tileRows = tileRows
+        self.numWorkers = numWorkers
+        self.queueSize = queueSize
+        self.batchSize = batchSize
+        self.preProcessor = preProcessor
+        self.noDataValue = noDataValue
+        self.maskNaN = maskNaN
+        self.fillValue = fillValue
+        self.stageTimes = {}
+        self.totalTime = 0.0
+
+    def output_shape(self, numRows, numCols):
+        """ Shape and data type of the output for a scene.
+
+        Args:
+            numRows (int): Number of rows in the scene.
+            numCols (int): Number of columns in the scene.
+
+        Returns:
+            (tuple): 2-element tuple containing:
+
+            - (*tuple*) - Shape of the output. [numRows x numCols x arbitrary], or [numRows x numCols] for labels.
+            - (*np.dtype*) - Data type of the output.
+        """
+        fetch = getattr(self.net, OUTPUTS[self.method])
+        return (numRows, numCols) + tuple(fetch.get_shape().as_list()[1:]), np.dtype(fetch.dtype.as_numpy_dtype)
+
+    def process(self, spectraCube, out=None, outAddr=None):
+        """ Passes a scene through the model.
+
+        Args:
+            spectraCube (np.array): Scene with shape [numRows x numCols x numBands]. Can be a memmap (e.g. from \
+                data.load_memmap), in which case tiles are read from disk as they are needed.
+            out (np.array): Array to write the results into. Shape given by *output_shape*.
+            outAddr (str): Address of a .npy file to write the results into as a memmap, if out is None. If both are \
+                None - a new array is made.
+
+        Returns:
+            (np.array): Results for the scene. Shape [numRows x numCols x arbitrary], or [numRows x numCols] for labels.
+        """
+
+        numRows, numCols, numBands = np.shape(spectraCube)
+        shape, dtype = self.output_shape(numRows, numCols)
+        if out is None:
+            if outAddr is not None:
+                out = np.lib.format.open_memmap(outAddr, mode='w+', dtype=dtype, shape=shape)
+            else:
+                out = np.empty(shape, dtype=dtype)
+
+        sess = net_ops.get_session(self.net, self.modelName)
+        fetch = getattr(self.net, OUTPUTS[self.method])
+
+        readQueue = queue.Queue(maxsize=self.queueSize)
+        inferQueue = queue.Queue(maxsize=self.queueSize)
+        writeQueue = queue.Queue(maxsize=self.queueSize)
+        stop = threading.Event()
+        errors = []
+        stageTimes = {'read':0.0, 'pre_process':0.0, 'infer':0.0, 'write':0.0}
+        timesLock = threading.Lock()
+
+        def add_time(stage, seconds):
+            with timesLock:
+                stageTimes[stage] += seconds
+
+        def put(tileQueue, item):
+            while not stop.is_set():
+                try:
+                    tileQueue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def get(tileQueue):
+            while not stop.is_set():
+                try:
+                    return tileQueue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return None
+
+        def stage(func):
+            # runs a stage, stopping all the others if it fails
+            def run():
+                try:
+                    func()
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+            thread = threading.Thread(target=run)
+            thread.daemon = True
+            return thread
+
+        def read():
+            for start in range(0, numRows, self.tileRows):
+                if stop.is_set():
+                    return
+                tic = time.time()
+                tile = np.array(spectraCube[start:start+self.tileRows], dtype=np.float32)
+                add_time('read', time.time() - tic)
+                put(readQueue, (start, np.reshape(tile, (-1, numBands))))
+            for i in range(self.numWorkers):
+                put(readQueue, None)
+
+        def pre_process():
+            while True:
+                item = get(readQueue)
+                if item is None:
+                    put(inferQueue, None)
+                    return
+                start, tile = item
+                tic = time.time()
+                valid = None
+                if (self.noDataValue is not None) | self.maskNaN:
+                    valid = np.ones(len(tile), dtype=bool)
+                    if self.noDataValue is not None:
+                        valid &= ~np.all(tile == self.noDataValue, axis=1)
+                    if self.maskNaN:
+                        valid &= ~np.any(np.isnan(tile), axis=1)
+                    tile = tile[valid]
+                if self.preProcessor is not None:
+                    self.preProcessor.transform(tile, out=tile, chunkSize=max(len(tile), 1), numThreads=1)
+                add_time('pre_process', time.time() - tic)
+                put(inferQueue, (start, tile, valid))
+
+        def infer():
+            numFinished = 0
+            while numFinished < self.numWorkers:
+                item = get(inferQueue)
+                if item is None:
+                    if stop.is_set():
+                        return
+                    numFinished += 1
+                    continue
+                start, tile, valid = item
+                tic = time.time()
+                result = net_ops.run_batched(sess, fetch, self.net.x, tile, self.batchSize)
+                add_time('infer', time.time() - tic)
+                put(writeQueue, (start, result, valid))
+            put(writeQueue, None)
+
+        def write():
+            while True:
+                item = get(writeQueue)
+                if item is None:
+                    return
+                start, result, valid = item
+                tic = time.time()
+                rows = out[start:start+self.tileRows]
+                if valid is None:
+                    rows[...] = np.reshape(result, rows.shape)
+                else:
+                    # skipped pixels are filled, and the results of the others scattered back into place
+                    pixels = np.full((len(valid),) + rows.shape[2:], self.fillValue, dtype=rows.dtype)
+                    pixels[valid] = result
+                    rows[...] = np.reshape(pixels, rows.shape)
+                add_time('write', time.time() - tic)
+
+        threads = [stage(read)] + [stage(pre_process) for i in range(self.numWorkers)] + [stage(infer), stage(write)]
+        tic = time.time()
+        for thread in threads:
+            thread.start()
+        try:
+            threads[-1].join()
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.totalTime = time.time() - tic
+        self.stageTimes = stageTimes
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        if isinstance(out, np.memmap):
+            out.flush()
+
+        return out
@@ -0,0 +1,224 @@
+'''
+    Description: selection of a small, diverse subset of the samples of a dataset to train a network on, in place of \
+    the whole scene (or its first rows). Samples can be drawn evenly from clusters found by mini-batch k-means, or \
+    picked by greedy k-center on random projections of the spectra.
+
+    - File name: subset.py
+    - Author: deephyp contributors
+    - Date created: October 2026
+    - Python package: deephyp
+
+'''
+
+import numpy as np
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from deephyp import data
+from deephyp import index
+
+
+def kmeans_stratified(spectra, numSelect, numClusters=100, allocation='equal', numIters=100, batchSize=10000,
+                      chunkSize=100000, numThreads=None, seed=None):
+    """ Selects samples evenly from the clusters of a dataset. The clusters are found with mini-batch k-means on \
+        random batches of spectra (see index.LatentIndex), then every sample is assigned to its nearest cluster, a \
+        chunk at a time across a pool of threads, and samples are drawn at random from each cluster. Only the \
+        cluster of each sample is held in memory, so spectra can be a large memmap. With equal allocation, rare \
+        materials are represented as well as common ones.
+
+    Args:
+        spectra (np.array or obj): Spectra with shape [numSamples x numBands] or [numRows x numCols x numBands] (can \
+            be a memmap), or a data.HypImg, in which case its spectraPrep is used.
+        numSelect (int): Number of samples to select.
+        numClusters (int): Number of k-means clusters.
+        allocation (str): How the numSelect samples are shared between the clusters. Current options: ['equal' \
+            (the same number from each cluster, or all of a cluster if it is smaller), 'proportional' (in proportion \
+            to the size of each cluster)].
+        numIters (int): Number of mini-batch k-means iterations.
+        batchSize (int): Number of spectra in each mini-batch.
+        chunkSize (int): Number of spectra assigned to clusters at a time.
+        numThreads (int): Number of threads used to assign spectra to clusters. If None - set to the number of CPUs.
+        seed (int): Seed of the random sampling. If None - not seeded.
+
+    Returns:
+        (np.array int): Indexes of the selected samples (rows of spectra, or of spectraPrep for a HypImg), in \
+            increasing order. Shape [numSelect]. Can be passed as the idx argument of data.Iterator.
+    """
+
+    if allocation not in ['equal', 'proportional']:
+        raise ValueError('unknown allocation: %s. Use equal or proportional.' % allocation)
+
+    spectra = _as_samples(spectra)
+    numSamples = spectra.shape[0]
+    numSelect = min(numSelect, numSamples)
+    numClusters = min(numClusters, numSamples)
+    rng = np.random.RandomState(seed)
+
+    # learn the cluster centroids from random batches of spectra, starting from k-means++ seeds (which, unlike
+    # random seeds, are likely to include the rare materials)
+    seeds = _kmeans_plus_plus(np.asarray(spectra[index._sample_rows(numSamples, batchSize, rng)], dtype=np.float32),
+                              numClusters, rng)
+    quantiser = index.LatentIndex(numLists=numClusters)
+    quantiser.train(spectra, numIters=numIters, batchSize=batchSize, seed=rng.randint(2**31), centroids=seeds)
+    centroids = quantiser.centroids
+    centroidSqNorms = np.sum(centroids**2, axis=1)
+
+    # assign every sample to its nearest centroid
+    clusters = np.empty(numSamples, dtype=data._compact_int_dtype(0, numClusters))
+
+    def assign_chunk(start):
+        chunk = np.asarray(spectra[start:start+chunkSize], dtype=np.float32)
+        clusters[start:start+len(chunk)] = np.argmin(centroidSqNorms - 2 * np.dot(chunk, centroids.T), axis=1)
+
+    data._map_chunks(assign_chunk, numSamples, chunkSize, numThreads)
+
+    # share the samples between the clusters, then draw them at random from each cluster
+    sizes = np.bincount(clusters, minlength=numClusters)
+    if allocation == 'equal':
+        counts = _allocate_equal(sizes, numSelect)
+    else:
+        counts = _allocate_proportional(sizes, numSelect)
+
+    order = np.argsort(clusters, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    selected = [rng.choice(order[starts[c]:starts[c+1]], counts[c], replace=False)
+                for c in range(numClusters) if counts[c] > 0]
+
+    return np.sort(np.concatenate(selected)).astype(data._compact_int_dtype(0, numSamples))
+
+
+def k_center(spectra, numSelect, projectionSize=16, maxCandidates=1000000, chunkSize=100000, numThreads=None,
+             seed=None):
+    """ Selects samples that cover a dataset, with greedy k-center: starting from a random sample, the sample \
+        furthest from all those selected so far is added until numSelect are selected. Distances are measured \
+        between random projections of the spectra onto projectionSize dimensions (which approximately preserve \
+        them), so each step costs projectionSize operations per candidate. The candidates are a random subset of at \
+        most maxCandidates samples, projected a chunk at a time across a pool of threads, which bounds the memory \
+        used. Outlying spectra (e.g. noisy pixels) are picked early, so remove them before selecting.
+
+    Args:
+        spectra (np.array or obj): Spectra with shape [numSamples x numBands] or [numRows x numCols x numBands] (can \
+            be a memmap), or a data.HypImg, in which case its spectraPrep is used.
+        numSelect (int): Number of samples to select.
+        projectionSize (int): Number of dimensions the spectra are projected onto. If None - the spectra are not \
+            projected.
+        maxCandidates (int): Maximum number of samples the selected samples are chosen from. If None - all samples.
+        chunkSize (int): Number of spectra projected at a time.
+        numThreads (int): Number of threads used to project spectra and update distances. If None - set to the \
+            number of CPUs.
+        seed (int): Seed of the random projection and sampling. If None - not seeded.
+
+    Returns:
+        (np.array int): Indexes of the selected samples (rows of spectra, or of spectraPrep for a HypImg), in the \
+            order they were selected (so the first n of them also cover the dataset). Shape [numSelect]. Can be passed \
+            as the idx argument of data.Iterator.
+    """
+
+    spectra = _as_samples(spectra)
+    numSamples, numBands = spectra.shape
+    rng = np.random.RandomState(seed)
+    if numThreads is None:
+        numThreads = multiprocessing.cpu_count()
+
+    if (maxCandidates is None) or (maxCandidates >= numSamples):
+        candidates = np.arange(numSamples)
+    else:
+        candidates = index._sample_rows(numSamples, maxCandidates, rng)
+    numCandidates = len(candidates)
+    numSelect = min(numSelect, numCandidates)
+
+    # project the candidates onto random gaussian directions
+    if projectionSize is None:
+        projection = None
+        points = np.empty((numCandidates, numBands), dtype=np.float32)
+    else:
+        projection = (rng.randn(numBands, projectionSize) / np.sqrt(projectionSize)).astype(np.float32)
+        points = np.empty((numCandidates, projectionSize), dtype=np.float32)
+
+    def project_chunk(start):
+        chunk = np.asarray(data._read_rows(spectra, start, chunkSize, candidates), dtype=np.float32)
+        points[start:start+len(chunk)] = chunk if projection is None else np.dot(chunk, projection)
+
+    data._map_chunks(project_chunk, numCandidates, chunkSize, numThreads)
+
+    # squared distance of each candidate to its nearest selected sample, updated in blocks across a pool of threads.
+    # Distances are expanded as |p|^2 - 2p.c + |c|^2, so each update is a matrix-vector product into scratch memory.
+    sqNorms = np.einsum('ij,ij->i', points, points)
+    minDistances = np.full(numCandidates, np.inf, dtype=np.float32)
+    scratch = np.empty(numCandidates, dtype=np.float32)
+    blockSize = int(np.ceil(float(numCandidates) / numThreads))
+    blocks = [slice(start, start+blockSize) for start in range(0, numCandidates, blockSize)]
+
+    def update_block(block, centre):
+        distances = scratch[block]
+        np.dot(points[block], centre, out=distances)
+        distances *= -2
+        distances += sqNorms[block]
+        distances += np.dot(centre, centre)
+        np.minimum(minDistances[block], distances, out=minDistances[block])
+        furthest = np.argmax(minDistances[block])
+        return minDistances[block][furthest], block.start + furthest
+
+    selected = np.empty(numSelect, dtype=np.int64)
+    selected[0] = rng.randint(numCandidates)
+    pool = ThreadPool(len(blocks)) if len(blocks) > 1 else None
+    try:
+        for i in range(1, numSelect):
+            centre = points[selected[i-1]]
+            if pool is None:
+                results = [update_block(block, centre) for block in blocks]
+            else:
+                results = pool.map(lambda block: update_block(block, centre), blocks)
+            selected[i] = max(results)[1]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return candidates[selected].astype(data._compact_int_dtype(0, numSamples))
+
+
+def _as_samples(spectra):
+    """Returns the spectraPrep of a HypImg, or spectra reshaped to [numSamples x numBands] (a view, not a copy)."""
+    if isinstance(spectra, data.HypImg):
+        return spectra.spectraPrep
+    return np.reshape(spectra, (-1, np.shape(spectra)[-1]))
+
+
+def _kmeans_plus_plus(samples, numClusters, rng):
+    """Picks numClusters of the samples as initial k-means centroids, each with probability proportional to its \
+        squared distance from the nearest centroid already picked."""
+    sqNorms = np.einsum('ij,ij->i', samples, samples)
+    centroids = [samples[rng.randint(len(samples))]]
+    minDistances = np.full(len(samples), np.inf)
+    for i in range(1, numClusters):
+        distances = sqNorms - 2 * np.dot(samples, centroids[-1]) + np.dot(centroids[-1], centroids[-1])
+        minDistances = np.minimum(minDistances, np.maximum(distances, 0))
+        total = np.sum(minDistances)
+        if total > 0:
+            centroids.append(samples[rng.choice(len(samples), p=minDistances / total)])
+        else:
+            centroids.append(samples[rng.randint(len(samples))])
+    return np.array(centroids)
+
+
+def _allocate_equal(sizes, numSelect):
+    """Shares numSelect samples as equally as possible between clusters of the given sizes. Small clusters are \
+        taken whole, and the rest is shared between the larger ones."""
+    counts = np.zeros(len(sizes), dtype=np.int64)
+    remaining = numSelect
+    order = np.argsort(sizes, kind='stable')
+    for i, c in enumerate(order):
+        counts[c] = min(sizes[c], int(np.ceil(float(remaining) / (len(sizes) - i))))
+        remaining -= counts[c]
+    return counts
+
+
+def _allocate_proportional(sizes, numSelect):
+    """Shares numSelect samples between clusters in proportion to their sizes, giving the remainder of the rounding \
+        to the clusters with the largest fractions."""
+    shares = numSelect * sizes.astype(np.float64) / np.sum(sizes)
+    counts = np.floor(shares).astype(np.int64)
+    remainder = numSelect - np.sum(counts)
+    if remainder > 0:
+        counts[np.argsort(counts - shares, kind='stable')[:remainder]] += 1
+    return counts
@@ -0,0 +1,77 @@
+'''
+    File name: autoencoder_preprocessor_MLP.py
+    Author: deephyp contributors
+    Date created: October 2026
+    Python package: deephyp
+
+    Description: An example script for saving the pre-processing with a trained MLP (or dense) autoencoder, on the
+    Pavia Uni hyperspectral dataset, and using the model on raw (un-pre-processed) spectra.
+
+'''
+
+import os
+import shutil
+import numpy as np
+
+
+# import toolbox libraries
+import sys
+sys.path.insert(0, '..')
+from deephyp import autoencoder
+from deephyp import data
+from deephyp import runtime
+import scipy.io
+
+
+if __name__ == '__main__':
+
+    # read the data set (downloaded by autoencoder_train_MLP_basic.py)
+    mat = scipy.io.loadmat( 'PaviaU.mat' )
+    img = mat[ 'paviaU' ]
+
+    # pre-process the data with band-wise z-scores, fitted to the whole scene
+    hypData = data.HypImg( img )
+    hypData.pre_process( 'zscore' )
+
+    # create data iterator objects for training and validation using the pre-processed data
+    trainSamples = 50000
+    valSamples = 100
+    dataTrain = data.Iterator( dataSamples=hypData.spectraPrep[:trainSamples, :],
+                              targets=hypData.spectraPrep[:trainSamples, :], batchSize=1000 )
+    dataVal = data.Iterator( dataSamples=hypData.spectraPrep[trainSamples:trainSamples+valSamples, :],
+                            targets=hypData.spectraPrep[trainSamples:trainSamples+valSamples, :] )
+    dataTrain.shuffle()
+
+    # setup a fully-connected autoencoder neural network with 3 encoder layers
+    net = autoencoder.mlp_1D_network( inputSize=hypData.numBands, encoderSize=[50,30,10], activationFunc='relu',
+                                      weightInitOpt='truncated_normal', tiedWeights=None, skipConnect=False,
+                                      activationFuncFinal='linear' )
+    net.add_train_op( name='sse', lossFunc='SSE', learning_rate=1e-3, method='Adam' )
+
+    # create a directory to save the learnt model
+    model_dir = os.path.join('models','test_ae_mlp_preprocessor')
+    if os.path.exists(model_dir):
+        # if directory already exists, delete it
+        shutil.rmtree(model_dir)
+    os.mkdir(model_dir)
+
+    # train the network, saving the fitted pre-processor with the model (to preprocess.json)
+    net.train(dataTrain=dataTrain, dataVal=dataVal, train_op_name='sse', n_epochs=20, save_addr=model_dir,
+              visualiseRateTrain=5, visualiseRateVal=5, save_epochs=[20], preProcessor=hypData.preProcessor)
+
+    # load the model. Its saved pre-processor is loaded with it
+    net.add_model( addr=os.path.join(model_dir,'epoch_20'), modelName='sse_20' )
+
+    # raw spectra (e.g. of a new scene) are input with applyPreProcessor=True, and the saved pre-processing is applied
+    # to each batch...
+    dataZ = net.encoder( modelName='sse_20', dataSamples=hypData.spectra, batchSize=10000, applyPreProcessor=True )
+
+    # ...while data that is already pre-processed is input as it is. Both give the same latent vectors
+    dataZPrep = net.encoder( modelName='sse_20', dataSamples=hypData.spectraPrep, batchSize=10000 )
+    print( 'max difference between latent vectors: %g' % np.max( np.abs( dataZ - dataZPrep ) ) )
+
+    # a model exported for the numpy runtime applies its saved pre-processing in the same way
+    net.export_numpy( modelName='sse_20', addr=os.path.join(model_dir,'sse_20.npz') )
+    model = runtime.NumpyModel( os.path.join(model_dir,'sse_20.npz') )
+    dataZNumpy = model.encoder( dataSamples=hypData.spectra, batchSize=10000, applyPreProcessor=True )
+    print( 'max difference between latent vectors (numpy runtime): %g' % np.max( np.abs( dataZ - dataZNumpy ) ) )
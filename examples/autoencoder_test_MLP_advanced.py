@@ -25,22 +25,19 @@ except:
 import sys
 sys.path.insert(0, '..')
 from deephyp import autoencoder
-from deephyp import data
+from deephyp import cache
 
 
 
 
 if __name__ == '__main__':
 
-    # read data into numpy array
-    mat = scipy.io.loadmat( 'PaviaU.mat' )
-    img = mat[ 'paviaU' ]
-
-    # create a hyperspectral dataset object from the numpy array
-    hypData = data.HypImg( img )
-
-    # pre-process data to make the model easier to train
-    hypData.pre_process( 'minmax' )
+    # load the pre-processed dataset (the .mat file is read and pre-processed on the first run only, and the cached
+    # result is memory-mapped on later runs)
+    dataCache = cache.DatasetCache( 'deephyp_cache' )
+    hypData = dataCache.load( 'PaviaU.mat', varName='paviaU', method='minmax' )
+    print( 'dataset loaded in %.2fs (%s)' % ( dataCache.lastTimes['total'],
+                                              'cached' if dataCache.lastHit else 'not cached' ) )
 
     # setup a network from a config file
     net = autoencoder.mlp_1D_network( configFile=os.path.join('models','test_ae_mlp_adv_sse','config.json') )
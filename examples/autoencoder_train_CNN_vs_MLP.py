@@ -10,9 +10,9 @@
 '''
 
 
-import scipy.io
 import urllib
 import os
+import numpy as np
 import shutil
 from utils import reporthook
 
@@ -22,6 +22,8 @@ import sys
 sys.path.insert(0, '..')
 from deephyp import autoencoder
 from deephyp import data
+from deephyp import cache
+from deephyp import subset
 
 
 if __name__ == '__main__':
@@ -29,23 +31,24 @@ if __name__ == '__main__':
     # download dataset (if already downloaded, comment this out)
     #urllib.urlretrieve( 'http://www.ehu.eus/ccwintco/uploads/e/ee/PaviaU.mat', os.path.join(os.getcwd(),'PaviaU.mat'), reporthook )
 
-    # read data into numpy array
-    mat = scipy.io.loadmat( 'PaviaU.mat' )
-    img = mat[ 'paviaU' ]
+    # load the pre-processed dataset (the .mat file is read and pre-processed on the first run only, and the cached
+    # result is memory-mapped on later runs)
+    dataCache = cache.DatasetCache( 'deephyp_cache' )
+    hypData = dataCache.load( 'PaviaU.mat', varName='paviaU', method='minmax' )
+    print( 'dataset loaded in %.2fs (%s)' % ( dataCache.lastTimes['total'],
+                                              'cached' if dataCache.lastHit else 'not cached' ) )
 
-    # create a hyperspectral dataset object from the numpy array
-    hypData = data.HypImg( img )
-
-    # pre-process data to make the model easier to train
-    hypData.pre_process( 'minmax' )
+    # select a diverse training set, drawn evenly from k-means clusters of the scene, and random validation samples
+    # from the rest
+    trainSamples = 20000
+    valSamples = 100
+    trainIdx = subset.kmeans_stratified( hypData, trainSamples, numClusters=100, seed=0 )
+    valIdx = np.random.choice( np.setdiff1d( np.arange( hypData.numValid ), trainIdx ), valSamples, replace=False )
 
     # create data iterator objects for training and validation using the pre-processed data
-    trainSamples = 200000
-    valSamples = 100
-    dataTrain = data.Iterator( dataSamples=hypData.spectraPrep[:trainSamples, :],
-                              targets=hypData.spectraPrep[:trainSamples, :], batchSize=1000 )
-    dataVal = data.Iterator( dataSamples=hypData.spectraPrep[trainSamples:trainSamples+valSamples, :],
-                            targets=hypData.spectraPrep[trainSamples:trainSamples+valSamples, :] )
+    dataTrain = data.Iterator( dataSamples=hypData.spectraPrep, targets=hypData.spectraPrep, batchSize=1000,
+                              idx=trainIdx )
+    dataVal = data.Iterator( dataSamples=hypData.spectraPrep, targets=hypData.spectraPrep, idx=valIdx )
 
     # shuffle training data
     dataTrain.shuffle()
@@ -9,7 +9,6 @@
 
 '''
 
-import scipy.io
 import urllib
 import os
 import shutil
@@ -21,6 +20,7 @@ import sys
 sys.path.insert(0, '..')
 from deephyp import autoencoder
 from deephyp import data
+from deephyp import cache
 
 
 if __name__ == '__main__':
@@ -28,15 +28,12 @@ if __name__ == '__main__':
     # download dataset (if already downloaded, comment this out)
     #urllib.urlretrieve( 'http://www.ehu.eus/ccwintco/uploads/e/ee/PaviaU.mat', os.path.join(os.getcwd(),'PaviaU.mat'), reporthook )
 
-    # read data into numpy array
-    mat = scipy.io.loadmat( 'PaviaU.mat' )
-    img = mat[ 'paviaU' ]
-
-    # create a hyperspectral dataset object from the numpy array
-    hypData = data.HypImg( img )
-
-    # pre-process data to make the model easier to train
-    hypData.pre_process( 'minmax' )
+    # load the pre-processed dataset (the .mat file is read and pre-processed on the first run only, and the cached
+    # result is memory-mapped on later runs)
+    dataCache = cache.DatasetCache( 'deephyp_cache' )
+    hypData = dataCache.load( 'PaviaU.mat', varName='paviaU', method='minmax' )
+    print( 'dataset loaded in %.2fs (%s)' % ( dataCache.lastTimes['total'],
+                                              'cached' if dataCache.lastHit else 'not cached' ) )
 
     # create data iterator objects for training and validation using the pre-processed data
     trainSamples = 200000
@@ -21,19 +21,16 @@ import pylab as pl
 import sys
 sys.path.insert(0, '..')
 from deephyp import classifier
-from deephyp import data
+from deephyp import cache
 
 if __name__ == '__main__':
 
-    # read data into numpy array
-    mat = scipy.io.loadmat('PaviaU.mat')
-    img = mat['paviaU']
-
-    # create a hyperspectral dataset object from the numpy array
-    hypData = data.HypImg( img )
-
-    # pre-process data to make the model easier to train
-    hypData.pre_process('minmax')
+    # load the pre-processed dataset (the .mat file is read and pre-processed on the first run only, and the cached
+    # result is memory-mapped on later runs)
+    dataCache = cache.DatasetCache( 'deephyp_cache' )
+    hypData = dataCache.load( 'PaviaU.mat', varName='paviaU', method='minmax' )
+    print( 'dataset loaded in %.2fs (%s)' % ( dataCache.lastTimes['total'],
+                                              'cached' if dataCache.lastHit else 'not cached' ) )
 
 
     # setup a fully-connected autoencoder neural network with 3 encoder layers
@@ -42,12 +39,14 @@ if __name__ == '__main__':
     # assign previously trained parameters to the network, and name model
     net.add_model( addr=os.path.join('models','test_clf_cnn','epoch_1000'), modelName='basic_model' )
 
-    # feed forward hyperspectral dataset through the model to predict class labels and scores for each sample
-    data_pred = net.predict_labels( modelName='basic_model', dataSamples=hypData.spectraPrep  )
-    data_scores = net.predict_scores( modelName='basic_model', dataSamples=hypData.spectraPrep  )
-
-    # extract features at second last layer
-    data_features = net.predict_features(modelName='basic_model', dataSamples=hypData.spectraPrep, layer=net.numLayers-1)
+    # feed forward hyperspectral dataset through the model once to predict class labels and scores for each sample,
+    # and extract features at second last layer
+    featureLayer = 'a%i'%(net.numLayers-1)
+    data_outputs = net.predict( modelName='basic_model', dataSamples=hypData.spectraPrep,
+                                outputs=['y_labels', 'y_scores', featureLayer] )
+    data_pred = data_outputs['y_labels']
+    data_scores = data_outputs['y_scores']
+    data_features = data_outputs[featureLayer]
 
     #--------- visualisation ----------------------------------------
 
@@ -8,7 +8,6 @@
 
 '''
 
-import scipy.io
 import os
 import shutil
 import numpy as np
@@ -23,6 +22,7 @@ import sys
 sys.path.insert(0, '..')
 from deephyp import classifier
 from deephyp import data
+from deephyp import cache
 
 if __name__ == '__main__':
 
@@ -32,19 +32,13 @@ if __name__ == '__main__':
     urlretrieve('http://www.ehu.eus/ccwintco/uploads/5/50/PaviaU_gt.mat',
                        os.path.join(os.getcwd(), 'PaviaU_gt.mat'), reporthook)
 
-    # read data into numpy array
-    mat = scipy.io.loadmat('PaviaU.mat')
-    img = mat['paviaU']
-
-    # read labels into numpy array
-    mat_gt = scipy.io.loadmat('PaviaU_gt.mat')
-    img_gt = mat_gt['paviaU_gt']
-
-    # create a hyperspectral dataset object from the numpy array
-    hypData = data.HypImg( img, labels=img_gt )
-
-    # pre-process data to make the model easier to train
-    hypData.pre_process( 'minmax' )
+    # load the pre-processed dataset (the .mat file is read and pre-processed on the first run only, and the cached
+    # result is memory-mapped on later runs)
+    dataCache = cache.DatasetCache( 'deephyp_cache' )
+    hypData = dataCache.load( 'PaviaU.mat', varName='paviaU', labelsAddr='PaviaU_gt.mat', labelsVarName='paviaU_gt',
+                              method='minmax' )
+    print( 'dataset loaded in %.2fs (%s)' % ( dataCache.lastTimes['total'],
+                                              'cached' if dataCache.lastHit else 'not cached' ) )
 
     # get indices for training and validation data
     trainSamples = 50 # per class
@@ -58,9 +52,11 @@ if __name__ == '__main__':
 
     # create data iterator objects for training and validation using the pre-processed data
     dataTrain = data.Iterator( dataSamples=hypData.spectraPrep[train_indices, :],
-                              targets=hypData.labelsOnehot[train_indices,:], batchSize=50 )
+                              targets=hypData.labels[train_indices,:], batchSize=50,
+                              numClasses=hypData.numClasses )
     dataVal = data.Iterator( dataSamples=hypData.spectraPrep[val_indices, :],
-                            targets=hypData.labelsOnehot[val_indices,:] )
+                            targets=hypData.labels[val_indices,:],
+                            numClasses=hypData.numClasses )
 
     # shuffle training data
     dataTrain.shuffle()
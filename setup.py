@@ -24,9 +24,9 @@ setup(
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 2",
         "Programming Language :: Python :: 3",
     ],
+    python_requires=">=3.5",
     packages=["deephyp"],
     include_package_data=True,
     install_requires=[
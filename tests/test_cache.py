@@ -0,0 +1,44 @@
+'''
+    Description: tests of loading datasets through a DatasetCache.
+
+    - File name: test_cache.py
+    - Python package: deephyp
+
+'''
+
+import os
+import shutil
+import numpy as np
+from deephyp import cache
+
+
+def test_hit_reads_spectra_from_the_loaded_file(tmp_path):
+    """A hit for a copy of the file that built the entry memory-maps the copy, even after the original changes or is \
+        deleted."""
+    rng = np.random.RandomState(0)
+    spectra = rng.rand(20, 30, 8).astype(np.float32)
+    addrA = str(tmp_path / 'A.npy')
+    addrB = str(tmp_path / 'B.npy')
+    np.save(addrA, spectra)
+    shutil.copyfile(addrA, addrB)
+    dataCache = cache.DatasetCache(str(tmp_path / 'cache'))
+
+    hypData = dataCache.load(addrA)
+    assert not dataCache.lastHit
+    spectraPrep = np.array(hypData.spectraPrep)
+    hypData = None
+
+    # change the file that built the entry
+    np.save(addrA, spectra + 1)
+    hypData = dataCache.load(addrB)
+    assert dataCache.lastHit
+    assert np.array_equal(hypData.spectra, np.reshape(spectra, (-1, 8)))
+    assert np.array_equal(hypData.spectraPrep, spectraPrep)
+    hypData = None
+
+    # delete it
+    os.remove(addrA)
+    hypData = dataCache.load(addrB)
+    assert dataCache.lastHit
+    assert np.array_equal(hypData.spectra, np.reshape(spectra, (-1, 8)))
+    assert np.array_equal(hypData.spectraPrep, spectraPrep)
@@ -0,0 +1,33 @@
+'''
+    Description: tests of saving and loading a LatentIndex.
+
+    - File name: test_index.py
+    - Python package: deephyp
+
+'''
+
+import numpy as np
+from deephyp import index
+
+
+def test_save_to_memmapped_directory(tmp_path):
+    """Adding vectors to an index loaded as memmaps and saving it back to the same directory keeps every vector."""
+    rng = np.random.RandomState(0)
+    X = rng.rand(10000, 8).astype(np.float32)
+    addr = str(tmp_path / 'index')
+
+    latentIndex = index.LatentIndex(numLists=16, numProbes=16)
+    latentIndex.train(X[:5000], seed=0)
+    latentIndex.add(X[:5000])
+    latentIndex.save(addr)
+
+    # incremental insertion: load as memmaps, add a new batch and save back in place
+    latentIndex = index.LatentIndex(addr=addr, mmapMode='r')
+    latentIndex.add(X[5000:], ids=np.arange(5000, 10000))
+    latentIndex.save(addr)
+
+    for loaded in [latentIndex, index.LatentIndex(addr=addr, mmapMode='r')]:
+        assert loaded.numIndexed == 10000
+        distances, ids = loaded.search(X[[0, 1, 2, 5000, 9999]], k=1)
+        assert np.array_equal(ids[:, 0], [0, 1, 2, 5000, 9999])
+        assert np.allclose(distances[:, 0], 0, atol=1e-3)
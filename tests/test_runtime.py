@@ -0,0 +1,86 @@
+'''
+    Description: tests that models run with the numpy runtime give the same outputs as the tensor flow networks they \
+    were exported from. Skipped if tensor flow is not installed.
+
+    - File name: test_runtime.py
+    - Python package: deephyp
+
+'''
+
+import os
+import itertools
+import numpy as np
+import pytest
+from deephyp import data
+from deephyp import runtime
+
+tf = pytest.importorskip('tensorflow')
+from deephyp import autoencoder
+from deephyp import classifier
+
+
+NUM_BANDS = 32
+NUM_CLASSES = 3
+
+
+def train_and_export(net, addr, dataSamples, targets, numClasses=None):
+    """Trains a network for an epoch, loads the saved model and exports it for the numpy runtime."""
+    dataTrain = data.Iterator(dataSamples=dataSamples, targets=targets, batchSize=20, numClasses=numClasses)
+    dataVal = data.Iterator(dataSamples=dataSamples, targets=targets, numClasses=numClasses)
+    net.train(dataTrain=dataTrain, dataVal=dataVal, train_op_name='op', n_epochs=1, save_addr=addr, save_epochs=[1])
+    net.add_model(addr=os.path.join(addr, 'epoch_1'), modelName='model')
+    net.export_numpy(modelName='model', addr=os.path.join(addr, 'model.npz'))
+    return runtime.NumpyModel(os.path.join(addr, 'model.npz'))
+
+
+def spectra(numSamples=100):
+    return np.random.RandomState(0).rand(numSamples, NUM_BANDS).astype(np.float32)
+
+
+@pytest.mark.parametrize('tied,skip,activation', itertools.product([False, True], [False, True], ['relu', 'sigmoid']))
+def test_mlp_autoencoder(tmp_path, tied, skip, activation):
+    """The numpy runtime reproduces the latent vectors and reconstructions of an mlp autoencoder."""
+    tf.reset_default_graph()
+    x = spectra()
+    net = autoencoder.mlp_1D_network(inputSize=NUM_BANDS, encoderSize=[20, 10, 4], activationFunc=activation,
+                                     tiedWeights=[1, 0, 1] if tied else None, skipConnect=skip)
+    net.add_train_op(name='op', lossFunc='SSE')
+    model = train_and_export(net, str(tmp_path), x, x)
+
+    np.testing.assert_allclose(model.encoder(x), net.encoder('model', x), atol=1e-4)
+    np.testing.assert_allclose(model.encoder_decoder(x), net.encoder_decoder('model', x), atol=1e-4)
+
+
+@pytest.mark.parametrize('padding,stride,tied,skip',
+                         itertools.product(['VALID', 'SAME'], [1, 2], [False, True], [False, True]))
+def test_cnn_autoencoder(tmp_path, padding, stride, tied, skip):
+    """The numpy runtime reproduces the latent vectors and reconstructions of a cnn autoencoder."""
+    tf.reset_default_graph()
+    x = spectra()
+    net = autoencoder.cnn_1D_network(inputSize=NUM_BANDS, zDim=4, encoderNumFilters=[4, 6],
+                                     encoderFilterSize=[5, 3], activationFunc='relu',
+                                     tiedWeights=[1, 1] if tied else None, skipConnect=skip, padding=padding,
+                                     encoderStride=[stride, stride])
+    net.add_train_op(name='op', lossFunc='SSE')
+    model = train_and_export(net, str(tmp_path), x, x)
+
+    np.testing.assert_allclose(model.encoder(x), net.encoder('model', x), atol=1e-4)
+    np.testing.assert_allclose(model.encoder_decoder(x), net.encoder_decoder('model', x), atol=1e-4)
+
+
+@pytest.mark.parametrize('padding,stride', itertools.product(['VALID', 'SAME'], [1, 2]))
+def test_cnn_classifier(tmp_path, padding, stride):
+    """The numpy runtime reproduces the class scores and features of a cnn classifier."""
+    tf.reset_default_graph()
+    x = spectra()
+    labels = np.random.RandomState(1).randint(1, NUM_CLASSES + 1, (x.shape[0], 1))
+    net = classifier.cnn_1D_network(inputSize=NUM_BANDS, numClasses=NUM_CLASSES, convFilterSize=[5, 3],
+                                    convNumFilters=[4, 6], convStride=[stride, stride], fcSize=[10],
+                                    padding=padding)
+    net.add_train_op(name='op')
+    model = train_and_export(net, str(tmp_path), x, labels, numClasses=NUM_CLASSES)
+
+    np.testing.assert_allclose(model.predict_scores(x), net.predict_scores('model', x), atol=1e-4)
+    for layer in range(1, model.numLayers + 1):
+        np.testing.assert_allclose(model.predict_features(x, layer), net.predict_features('model', x, layer),
+                                   atol=1e-4)